@@ -1,6 +1,175 @@
+"""
+Sample plugin that enables CloudBolt interface to provide a form field that
+autocompletes as the user is typing, fetching matching options from a local
+SQLite database of email addresses.
+
+The database has a trigram full-text index (SQLite FTS5) on top of the users
+table, so a "contains" search reads the index rather than scanning every row.
+Build it from a CSV file or an LDIF export of the directory with:
+
+    python async_param_options.py load users.csv [db path]
+
+and measure lookup latency on a synthetic table with:
+
+    python async_param_options.py benchmark [rows]
+"""
+import csv
+import os
+import queue
+import random
 import sqlite3
+import string
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
 from common.methods import set_progress
 
+USERS_DB = '/var/opt/cloudbolt/proserv/ldap_users.db'
+# Limit the results to something reasonable, for a responsive user experience;
+# this action is called as the user is typing and results should be returned
+# as quickly as possible, but also not too many.
+MAX_RESULTS = 50
+# Read-only connections kept open between keystrokes
+POOL_SIZE = 4
+# Recent queries whose results are kept in memory
+QUERY_CACHE_SIZE = 1024
+# Trigram index queries need at least this many characters; shorter ones
+# only return prefix matches
+MIN_SUBSTRING_QUERY = 3
+LOAD_BATCH_SIZE = 10000
+
+
+class ConnectionPool:
+    """
+    Read-only SQLite connections to one database file, reused between calls.
+    The pool is rebuilt when the file is replaced (e.g. by a new load).
+    """
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self.version = None
+        self.connections = queue.LifoQueue()
+        self.has_index = False
+        self.lock = threading.Lock()
+
+    def current_version(self):
+        stat = os.stat(self.path)
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _connect(self):
+        conn = sqlite3.connect('file:{}?mode=ro'.format(self.path), uri=True, check_same_thread=False)
+        conn.execute('PRAGMA query_only = 1')
+        return conn
+
+    def refresh(self):
+        """Drop the open connections if the database file changed. Returns its version."""
+        version = self.current_version()
+        if version != self.version:
+            with self.lock:
+                if version != self.version:
+                    while not self.connections.empty():
+                        self.connections.get_nowait()[1].close()
+                    conn = self._connect()
+                    self.has_index = conn.execute(
+                        "SELECT 1 FROM sqlite_master WHERE name = 'users_fts'").fetchone() is not None
+                    self.connections.put((version, conn))
+                    self.version = version
+        return version
+
+    @contextmanager
+    def connection(self):
+        version = self.version
+        try:
+            conn_version, conn = self.connections.get_nowait()
+        except queue.Empty:
+            conn_version, conn = version, self._connect()
+        try:
+            yield conn
+        finally:
+            # Connections opened on a file since replaced are not reused
+            if conn_version == self.version and self.connections.qsize() < self.size:
+                self.connections.put((conn_version, conn))
+            else:
+                conn.close()
+
+
+class QueryCache:
+    """Least recently used cache of query -> options."""
+
+    def __init__(self, size=QUERY_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+_pools = {}
+_query_cache = QueryCache()
+
+
+def get_pool(path=USERS_DB):
+    if path not in _pools:
+        _pools[path] = ConnectionPool(path)
+    return _pools[path]
+
+
+def _escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def find_emails(conn, query, has_index, max_results=MAX_RESULTS):
+    """
+    Return up to ``max_results`` emails containing ``query`` (ignoring case),
+    those starting with it first, each part in email order.
+    """
+    # Prefix matches are a range scan of the NOCASE email index
+    emails = [row[0] for row in conn.execute(
+        "SELECT email FROM users WHERE email LIKE ? ESCAPE '\\' ORDER BY email COLLATE NOCASE LIMIT ?",
+        (_escape_like(query) + '%', max_results),
+    )]
+    if len(emails) >= max_results or len(query) < MIN_SUBSTRING_QUERY:
+        return emails
+
+    # Substring matches include the prefix matches again, so asking for
+    # max_results of them always leaves enough once those are skipped
+    prefix_matches = set(emails)
+    if has_index:
+        # The loader inserts rows in email order, so rowid order is email order
+        rows = conn.execute(
+            'SELECT email FROM users_fts WHERE users_fts MATCH ? ORDER BY rowid LIMIT ?',
+            ('"{}"'.format(query.replace('"', '""')), max_results),
+        )
+    else:
+        # Database built before the index was added: scan the table
+        rows = conn.execute(
+            "SELECT email FROM users WHERE email LIKE ? ESCAPE '\\' ORDER BY email LIMIT ?",
+            ('%' + _escape_like(query) + '%', max_results),
+        )
+    for (email,) in rows:
+        if email not in prefix_matches:
+            emails.append(email)
+            if len(emails) >= max_results:
+                break
+    return emails
+
 
 def suggest_options(field, query, **kwargs):
     """
@@ -15,30 +184,20 @@ def suggest_options(field, query, **kwargs):
     external API.
 
     Args:
-        query: the word the user has typed 
+        query: the word the user has typed
 
     Returns:
         list of tuples representing dropdown options ("value", "Visible label")]
     """
-
-    # Limit the results to something reasonable, for a responsive user experience;
-    # this action is called as the user is typing and results should be returned
-    # as quickly as possible, but also not too many.
-    max_results = 50
-
-    # Query an SQLite database table for matching email addresses.
-    conn = sqlite3.connect('/var/opt/cloudbolt/proserv/ldap_users.db')
-    c = conn.cursor()
-    emails = c.execute(
-        'SELECT email FROM users WHERE email LIKE ? ORDER BY email LIMIT ?',
-        ('%{}%'.format(query), max_results)
-    )
-    
-    # Use the SQLite query result here, before closing the DB connection. It
-    # materializes the cursor and avoids Python exception.
-    options = [(email, email) for email in emails]
-        
-    conn.close()
+    pool = get_pool()
+    # Cached results are only reused while the database file is unchanged
+    key = (pool.refresh(), query.lower())
+    options = _query_cache.get(key)
+    if options is None:
+        with pool.connection() as conn:
+            emails = find_emails(conn, query, pool.has_index)
+        options = [(email, email) for email in emails]
+        _query_cache.put(key, options)
     return options
 
 
@@ -49,3 +208,121 @@ def get_options_list(*args, **kwargs):
     present.
     """
     return None
+
+
+def read_emails(path):
+    """
+    Yield emails from a CSV file (its "email" column, or the first column if
+    there is no such header) or, for a .ldif file, the mail attribute of each
+    LDIF record.
+    """
+    if path.endswith('.ldif'):
+        from shared_modules.ldap_membership_sync import LdifDirectory
+        for _, attributes in LdifDirectory(path).records():
+            for email in attributes.get('mail', []):
+                yield email
+        return
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        lowered = [name.strip().lower() for name in header]
+        if 'email' in lowered:
+            column = lowered.index('email')
+        else:
+            column = 0
+            if '@' in header[0]:
+                yield header[0].strip()
+        for row in reader:
+            if len(row) > column and row[column].strip():
+                yield row[column].strip()
+
+
+def build_users_db(emails, path=USERS_DB):
+    """
+    Build the users database with its trigram index from ``emails`` into a
+    new file, then swap it in place of ``path`` so suggestions being served
+    never see a half-built database. Returns the number of users loaded.
+    """
+    unique = sorted(set(emails), key=lambda email: (email.lower(), email))
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.building')
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(tmp_path)
+        conn.executescript('''
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            CREATE TABLE users (id INTEGER PRIMARY KEY, email TEXT NOT NULL);
+        ''')
+        for start in range(0, len(unique), LOAD_BATCH_SIZE):
+            conn.executemany(
+                'INSERT INTO users (email) VALUES (?)',
+                ((email,) for email in unique[start:start + LOAD_BATCH_SIZE]),
+            )
+        conn.executescript('''
+            CREATE INDEX users_email_nocase ON users (email COLLATE NOCASE);
+            CREATE VIRTUAL TABLE users_fts USING fts5(
+                email, content='users', content_rowid='id', tokenize='trigram'
+            );
+            INSERT INTO users_fts (users_fts) VALUES ('rebuild');
+            INSERT INTO users_fts (users_fts) VALUES ('optimize');
+            ANALYZE;
+        ''')
+        conn.commit()
+        conn.close()
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return len(unique)
+
+
+def benchmark(rows=1000000, queries=2000):
+    """Time suggestions on a synthetic table of ``rows`` emails and print the latency percentiles."""
+    rng = random.Random(0)
+    letters = string.ascii_lowercase
+
+    def word(low, high):
+        return ''.join(rng.choice(letters) for _ in range(rng.randint(low, high)))
+
+    domains = ['{}.{}'.format(word(4, 10), rng.choice(['com', 'org', 'net', 'io'])) for _ in range(200)]
+    emails = ['{}.{}{}@{}'.format(word(3, 8), word(4, 10), i % 100, rng.choice(domains)) for i in range(rows)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'users.db')
+        start = time.perf_counter()
+        build_users_db(emails, path)
+        set_progress('Loaded {} rows in {:.1f}s'.format(rows, time.perf_counter() - start))
+
+        samples = rng.sample(emails, queries)
+        terms = []
+        for email in samples:
+            begin = rng.randrange(len(email) - 2)
+            terms.append(email[begin:begin + rng.randint(1, 8)])
+
+        pool = ConnectionPool(path)
+        pool.refresh()
+        timings = []
+        for term in terms:
+            begin = time.perf_counter()
+            with pool.connection() as conn:
+                find_emails(conn, term, pool.has_index)
+            timings.append((time.perf_counter() - begin) * 1000)
+        timings.sort()
+        for label, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99), ('max', 1)):
+            index = min(len(timings) - 1, int(fraction * len(timings)))
+            set_progress('{}: {:.2f} ms'.format(label, timings[index]))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 3 and sys.argv[1] == 'load':
+        count = build_users_db(read_emails(sys.argv[2]), sys.argv[3] if len(sys.argv) > 3 else USERS_DB)
+        set_progress('Loaded {} users'.format(count))
+    elif len(sys.argv) >= 2 and sys.argv[1] == 'benchmark':
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 1000000)
+    else:
+        sys.stderr.write('usage: {0} load <CSV or LDIF file> [<db path>]\n'
+                         '       {0} benchmark [<rows>]\n'.format(sys.argv[0]))
+        sys.exit(2)
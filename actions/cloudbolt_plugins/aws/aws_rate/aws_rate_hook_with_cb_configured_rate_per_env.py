@@ -7,18 +7,42 @@ currency is USD, edit this action to change it.
 
 This file is applied when provisioning a server.
 These rates are updated regularly by the 'Refresh Server Rates' recurring job.
+
+Prices come from the per-region AWS offer files, and only for the regions in
+use by AWS resource handlers (see sync_pricing). Each region's offer file is
+compiled into an indexed SQLite price catalog (see compile_price_catalog), so
+every rate is a single indexed lookup. The offer files are checked again every
+PRICING_SYNC_INTERVAL_SECONDS with ETag/Last-Modified, and only regions whose
+offer file changed are downloaded and recompiled. Catalogs are versioned by the
+offer file's version; a new catalog is built next to the current one and
+swapped in atomically.
+
+compute_rates_bulk prices many servers at once, looking each distinct
+(region, instance type, OS) up only once.
+
+PRICING_BASE_URL may also be a local directory laid out like the pricing site
+(offers/v1.0/aws/AmazonEC2/current/region_index.json and the files it points
+to), e.g. to try the sync against fixture offer files:
+    python aws_rate_hook_with_cb_configured_rate_per_env.py /path/to/fixtures us-east-1
 """
 
 
 from decimal import Decimal
+from email.utils import formatdate
+import json
+import os
 import os.path
+import shutil
+import sqlite3
+import sys
+import threading
+import time
 import ijson
-import json
-import re
 import requests
 
 from django.conf import settings
 from django.core.cache import cache
+from django.db.models import prefetch_related_objects
 
 from resourcehandlers.aws.models import AWSHandler, get_region_title
 from utilities.filesystem import mkdir_p
@@ -35,111 +59,374 @@ NUMBER_OF_HOURS = {
 }
 
 RATE_HOOK_DIR = "{}/opt/cloudbolt/aws_rate_hook".format(settings.VARDIR)
-AWS_URL = "https://pricing.us-east-1.amazonaws.com/offers/v1.0/aws/AmazonEC2/current/index.json"
+# AWS pricing site, or a local directory with the same layout
+PRICING_BASE_URL = "https://pricing.us-east-1.amazonaws.com"
+REGION_INDEX_PATH = "/offers/v1.0/aws/AmazonEC2/current/region_index.json"
+# How often the offer files are checked for a new version
+PRICING_SYNC_INTERVAL_SECONDS = 24 * 3600
+# ETag, Last-Modified and last check time of each offer file
+SYNC_STATE_DB = "{}/pricing_sync_state.sqlite3".format(RATE_HOOK_DIR)
+# Name of the symlink to a region's price catalog in use, swapped atomically
+# when a new one is compiled
+CURRENT_CATALOG_NAME = "price_catalog_{}_current.sqlite3"
+# Bump when the catalog tables change, so older catalogs get recompiled
+CATALOG_SCHEMA_VERSION = 1
+# Rows inserted per executemany() call while compiling
+COMPILE_BATCH_SIZE = 5000
 logger = ThreadLogger(__name__)
 
 
-def download_file(url, file_location):
+def fetch_offer_file(base_url, path, destination, etag=None, last_modified=None):
     """
-    Downloads the pricing file if it does not already exist.
-    """
-    if os.path.exists(file_location):
-        return
-
-    # try making the directory to store rate files in.
-    mkdir_p(RATE_HOOK_DIR)
+    Fetch ``path`` from ``base_url`` to ``destination`` unless it is unchanged
+    since the given ETag/Last-Modified. Returns (changed, etag, last_modified).
 
-    logger.debug('Downloading AWS pricing file from {}'.format(url))
-    r = requests.get(url, stream=True)
-    with open(file_location, 'wb') as f:
-        for chunk in r.iter_content(chunk_size=1024):
+    ``base_url`` may be a local directory, in which case the file's size and
+    modification time stand in for the ETag.
+    """
+    if not base_url.startswith(('http://', 'https://')):
+        source = os.path.join(base_url, path.lstrip('/'))
+        stat = os.stat(source)
+        new_etag = '"{}-{}"'.format(stat.st_size, stat.st_mtime_ns)
+        new_last_modified = formatdate(stat.st_mtime, usegmt=True)
+        if etag and etag == new_etag:
+            return False, etag, last_modified
+        shutil.copyfile(source, destination)
+        return True, new_etag, new_last_modified
+
+    url = base_url.rstrip('/') + path
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    logger.debug('Fetching AWS pricing file {}'.format(url))
+    r = requests.get(url, headers=headers, stream=True, timeout=60)
+    if r.status_code == 304:
+        return False, etag, last_modified
+    r.raise_for_status()
+    tmp_destination = "{}.{}.tmp".format(destination, os.getpid())
+    with open(tmp_destination, 'wb') as f:
+        for chunk in r.iter_content(chunk_size=1024 * 1024):
             if chunk:  # filter out keep-alive new chunks
                 f.write(chunk)
+    os.replace(tmp_destination, destination)
     logger.debug('Download complete')
+    return True, r.headers.get('ETag'), r.headers.get('Last-Modified')
 
 
-def split_file(file_location, products_file, terms_file):
-    """
-    Splits file into two components for faster lookups.
-
-    products_file contains SKUs for each location/instance type combination.
-    terms_file contains the on-demand pricing for each SKU.
-    """
-    if os.path.exists(products_file) and os.path.exists(terms_file):
-        return
-    logger.debug('Splitting AWS pricing file')
-    with open(file_location) as f:
-        full_data = json.load(f)
-    with open(products_file, 'w') as f:
-        json.dump(full_data['products'], f)
-    with open(terms_file, 'w') as f:
-        json.dump(full_data['terms']['OnDemand'], f)
-    logger.debug('Split complete')
-
-
-def get_sku(location, instance_type, products_file):
-    """
-    Optimized JSON parsing to find the SKU for the provided location and type.
-    """
-    # SKU dicts have prefixes like 76V3SF2FJC3ZR3GH
-    sku_dict_prefix = re.compile('^[a-zA-Z0-9]+$')
-    sku = ''
-    matches = 0
-    event_count = 0
-    with open(products_file) as f:
-        parser = ijson.parse(f)
-        for prefix, event, value in parser:
-            event_count += 1
-            if prefix.endswith('.sku'):
-                # Save the SKU of the current SKU dict
-                sku = value
-            elif prefix.endswith('.productFamily') and value == "Compute Instance":
-                matches += 1
-            elif prefix.endswith('.location') and value == location:
-                matches += 1
-            elif prefix.endswith('.instanceType') and value == instance_type:
-                matches += 1
-            elif event == 'end_map' and sku_dict_prefix.match(prefix):
-                # We've reached the end of the SKU dict, is this the right one?
-                if matches == 3:
-                    # All three values matched, this is our sku
-                    logger.debug("SKU: {}".format(sku))
-                    return sku
-                else:
-                    # This wasn't the right SKU dict, reset our matches
-                    matches = 0
-
-
-def get_price(sku, terms_file):
-    event_count = 0
-    with open(terms_file) as file:
-        parser = ijson.parse(file)
-        for prefix, event, value in parser:
-            event_count += 1
-            if prefix.endswith('.pricePerUnit.USD') and sku in prefix:
-                logger.debug('Hourly price: {}'.format(value))
-                return value
+class PricingSyncState(object):
+    """Where each offer file came from and how to tell whether it changed."""
 
+    def __init__(self, path=SYNC_STATE_DB):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS offer_files (
+                name TEXT PRIMARY KEY,
+                source_path TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                checked_at INTEGER NOT NULL
+            )
+        ''')
 
-def compute_rate(group, environment, resource_technology, cfvs, pcvss,
-                 os_build, apps, quantity=1, **kwargs):
-    # Download AWS pricing data, if it doesn't already exist.
-    file_location = "{}/full_pricing_data.json".format(RATE_HOOK_DIR)
-    download_file(AWS_URL, file_location)
+    def close(self):
+        self.conn.close()
 
-    # Split file into two parts: one to look up the SKU for this instance type,
-    # and one to look up the price for a SKU. The smaller file sizes speed up
-    # calculation by several seconds.
-    products_file = "{}/products_data.json".format(RATE_HOOK_DIR)
-    terms_file = "{}/terms_data.json".format(RATE_HOOK_DIR)
-    split_file(file_location, products_file, terms_file)
+    def get(self, name):
+        row = self.conn.execute(
+            'SELECT source_path, etag, last_modified, checked_at FROM offer_files WHERE name = ?',
+            (name,)).fetchone()
+        return row or (None, None, None, 0)
 
-    server = kwargs.get('server', None)
-    # If being called from a context where we have a server object that stores
-    # AWS-specific info, reference that first for the instance type
+    def set(self, name, source_path, etag, last_modified):
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO offer_files VALUES (?, ?, ?, ?, ?)',
+                (name, source_path, etag, last_modified, int(time.time())))
+
+
+def regions_in_use():
+    """Regions imported on any AWS resource handler, sorted."""
+    regions = set()
+    for handler in AWSHandler.objects.all():
+        regions.update(region for region in handler.current_regions() if region)
+    return sorted(regions)
+
+
+def sync_pricing(regions=None, base_url=PRICING_BASE_URL, rate_hook_dir=RATE_HOOK_DIR, force=False):
+    """
+    Bring the price catalogs of ``regions`` (by default the regions in use)
+    up to date with the AWS offer files and return the regions recompiled.
+
+    The region index is fetched conditionally. A region's offer file is only
+    downloaded when the index points at a new version of it or the server
+    says it changed, and only the catalogs of those regions are rebuilt.
+    """
+    mkdir_p(rate_hook_dir)
+    if regions is None:
+        regions = regions_in_use()
+    state = PricingSyncState(os.path.join(rate_hook_dir, os.path.basename(SYNC_STATE_DB)))
+    try:
+        index_file = os.path.join(rate_hook_dir, "region_index.json")
+        _, etag, last_modified, _ = state.get('region_index')
+        if force or not os.path.exists(index_file):
+            etag = last_modified = None
+        _, etag, last_modified = fetch_offer_file(
+            base_url, REGION_INDEX_PATH, index_file, etag, last_modified)
+        state.set('region_index', REGION_INDEX_PATH, etag, last_modified)
+        with open(index_file) as f:
+            region_index = json.load(f).get('regions', {})
+
+        rebuilt = []
+        for region in regions:
+            entry = region_index.get(region)
+            if not entry:
+                logger.warning('Region {} is not in the AWS offer index'.format(region))
+                continue
+            source_path = entry['currentVersionUrl']
+            previous_path, etag, last_modified, _ = state.get(region)
+            have_catalog = os.path.exists(os.path.join(rate_hook_dir, CURRENT_CATALOG_NAME.format(region)))
+            if force or not have_catalog or previous_path != source_path:
+                etag = last_modified = None
+
+            offer_file = os.path.join(rate_hook_dir, "offer_{}.json".format(region))
+            changed, etag, last_modified = fetch_offer_file(
+                base_url, source_path, offer_file, etag, last_modified)
+            if changed:
+                try:
+                    compile_price_catalog(offer_file, region, rate_hook_dir)
+                finally:
+                    # The compiled catalog holds everything needed, free the disk space
+                    os.remove(offer_file)
+                rebuilt.append(region)
+            state.set(region, source_path, etag, last_modified)
+    finally:
+        state.close()
+    logger.debug('AWS pricing sync rebuilt {} of {} region(s): {}'.format(len(rebuilt), len(regions), rebuilt))
+    return rebuilt
+
+
+def compile_price_catalog(file_location, region, rate_hook_dir=RATE_HOOK_DIR):
+    """
+    Stream a region's offer file into a new SQLite price catalog and make it
+    the region's current catalog.
+
+    Only "Compute Instance" products are kept, indexed by (location, instance
+    type, operating system, tenancy), with their on-demand hourly USD price.
+    The offer file is read with ijson in two passes (products, then terms),
+    so memory use stays flat however large it is. Returns the catalog path.
+    """
+    with open(file_location, 'rb') as f:
+        version = next(ijson.items(f, 'version'), None) or str(int(time.time()))
+    catalog_file = os.path.join(rate_hook_dir, "price_catalog_{}_{}.sqlite3".format(region, version))
+    tmp_file = "{}.{}.tmp".format(catalog_file, os.getpid())
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+
+    logger.debug('Compiling AWS price catalog version {} for {} from {}'.format(version, region, file_location))
+    conn = sqlite3.connect(tmp_file)
+    try:
+        conn.executescript('''
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE products (
+                sku TEXT PRIMARY KEY,
+                file_order INTEGER NOT NULL,
+                location TEXT NOT NULL,
+                instance_type TEXT NOT NULL,
+                operating_system TEXT,
+                tenancy TEXT,
+                capacity_status TEXT,
+                pre_installed_sw TEXT,
+                price_per_hour TEXT
+            );
+        ''')
+
+        with open(file_location, 'rb') as f:
+            batch = []
+            for file_order, (sku, product) in enumerate(ijson.kvitems(f, 'products')):
+                if product.get('productFamily') != "Compute Instance":
+                    continue
+                attributes = product.get('attributes', {})
+                batch.append((
+                    sku, file_order, attributes.get('location', ''), attributes.get('instanceType', ''),
+                    attributes.get('operatingSystem'), attributes.get('tenancy'),
+                    attributes.get('capacitystatus'), attributes.get('preInstalledSw'),
+                ))
+                if len(batch) >= COMPILE_BATCH_SIZE:
+                    conn.executemany('INSERT INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL)', batch)
+                    batch = []
+            conn.executemany('INSERT INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL)', batch)
+
+        with open(file_location, 'rb') as f:
+            batch = []
+            for sku, offers in ijson.kvitems(f, 'terms.OnDemand'):
+                price = first_usd_price(offers)
+                if price is not None:
+                    batch.append((str(price), sku))
+                if len(batch) >= COMPILE_BATCH_SIZE:
+                    conn.executemany('UPDATE products SET price_per_hour = ? WHERE sku = ?', batch)
+                    batch = []
+            conn.executemany('UPDATE products SET price_per_hour = ? WHERE sku = ?', batch)
+
+        conn.execute('''
+            CREATE INDEX products_lookup ON products
+                (location, instance_type, operating_system, tenancy, file_order)
+        ''')
+        conn.executemany('INSERT INTO meta VALUES (?, ?)', [
+            ('schema_version', str(CATALOG_SCHEMA_VERSION)),
+            ('offer_version', version),
+            ('region', region),
+            ('compiled_at', str(int(time.time()))),
+        ])
+        conn.commit()
+    finally:
+        conn.close()
+
+    os.replace(tmp_file, catalog_file)
+    swap_current_catalog(catalog_file, region, rate_hook_dir)
+    logger.debug('AWS price catalog {} is now current'.format(catalog_file))
+    return catalog_file
+
+
+def first_usd_price(offers):
+    """The first USD pricePerUnit of a SKU's on-demand offers, as in the offer file's order."""
+    for offer in offers.values():
+        for dimension in offer.get('priceDimensions', {}).values():
+            usd = dimension.get('pricePerUnit', {}).get('USD')
+            if usd is not None:
+                return usd
+    return None
+
+
+def swap_current_catalog(catalog_file, region, rate_hook_dir=RATE_HOOK_DIR):
+    """
+    Point the region's current catalog link at ``catalog_file`` with an
+    atomic rename, then delete the region's older catalogs. Readers that
+    already opened an old catalog keep reading it until they reopen.
+    """
+    current = os.path.join(rate_hook_dir, CURRENT_CATALOG_NAME.format(region))
+    prefix = 'price_catalog_{}_'.format(region)
+    tmp_link = "{}.{}.tmp".format(current, os.getpid())
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    os.symlink(os.path.basename(catalog_file), tmp_link)
+    os.replace(tmp_link, current)
+
+    for name in os.listdir(rate_hook_dir):
+        path = os.path.join(rate_hook_dir, name)
+        if name.startswith(prefix) and name.endswith('.sqlite3') \
+                and path != catalog_file and not os.path.islink(path):
+            os.remove(path)
+
+
+class PriceCatalog(object):
+    """Read-only view of a compiled price catalog."""
+
+    # Preferred rows when several SKUs share a location, instance type, OS and
+    # tenancy: plain capacity, no pre-installed software, then file order.
+    LOOKUP_SQL = '''
+        SELECT sku, price_per_hour FROM products
+        WHERE location = ? AND instance_type = ? AND operating_system = ? AND tenancy = ?
+        ORDER BY capacity_status != 'Used', pre_installed_sw != 'NA', file_order
+        LIMIT 1
+    '''
+    # Fallback matching the original behaviour: the first SKU in the offer file
+    FALLBACK_SQL = '''
+        SELECT sku, price_per_hour FROM products
+        WHERE location = ? AND instance_type = ?
+        ORDER BY file_order
+        LIMIT 1
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect('file:{}?mode=ro'.format(path), uri=True)
+        self.meta = dict(self.conn.execute('SELECT key, value FROM meta'))
+        self.version = self.meta.get('offer_version')
+        self.opened_at = time.time()
+
+    def close(self):
+        self.conn.close()
+
+    def lookup(self, location, instance_type, operating_system='Linux', tenancy='Shared'):
+        """Return (sku, hourly USD price) for the instance, or (None, None)."""
+        row = self.conn.execute(
+            self.LOOKUP_SQL, (location, instance_type, operating_system, tenancy)).fetchone()
+        if row is None:
+            row = self.conn.execute(self.FALLBACK_SQL, (location, instance_type)).fetchone()
+        return row if row else (None, None)
+
+
+_catalogs = threading.local()
+_sync_lock = threading.Lock()
+
+
+def get_price_catalog(region):
+    """
+    Return this thread's PriceCatalog for ``region``. The region's pricing is
+    synced first when it has no catalog yet or was last checked more than
+    PRICING_SYNC_INTERVAL_SECONDS ago; if that check fails, the existing
+    catalog keeps being used. Reopens the catalog when a newer one has been
+    swapped in.
+    """
+    catalogs = getattr(_catalogs, 'by_region', None)
+    if catalogs is None:
+        catalogs = _catalogs.by_region = {}
+    link = os.path.join(RATE_HOOK_DIR, CURRENT_CATALOG_NAME.format(region))
+    catalog = catalogs.get(region)
+
+    if catalog is None or time.time() - catalog.opened_at > PRICING_SYNC_INTERVAL_SECONDS:
+        with _sync_lock:
+            state_file = SYNC_STATE_DB
+            checked_at = 0
+            if os.path.exists(state_file):
+                state = PricingSyncState(state_file)
+                checked_at = state.get(region)[3]
+                state.close()
+            if not os.path.exists(link) or time.time() - checked_at > PRICING_SYNC_INTERVAL_SECONDS:
+                try:
+                    sync_pricing([region])
+                except Exception as e:
+                    if not os.path.exists(link):
+                        raise
+                    logger.warning('Could not refresh AWS pricing for {}, using the existing catalog: {}'
+                                   .format(region, e))
+
+    path = os.path.realpath(link)
+    if catalog is None or catalog.path != path or time.time() - catalog.opened_at > PRICING_SYNC_INTERVAL_SECONDS:
+        if catalog is not None:
+            catalog.close()
+        catalog = PriceCatalog(path)
+        if catalog.meta.get('schema_version') != str(CATALOG_SCHEMA_VERSION):
+            catalog.close()
+            sync_pricing([region], force=True)
+            catalog = PriceCatalog(os.path.realpath(link))
+        catalogs[region] = catalog
+    return catalog
+
+
+def operating_system_for(os_build):
+    """The offer file's operatingSystem value for an OS build; Linux unless it is Windows."""
+    family = getattr(os_build, 'os_family', None) if os_build else None
+    if family is not None and 'windows' in str(family).lower():
+        return 'Windows'
+    return 'Linux'
+
+
+def instance_type_and_region(server, cfvs, pcvss):
+    """
+    The instance type and region to price, from the server's EC2 info when
+    there is a server, else from the instance_type custom field or
+    preconfiguration. Either may be None.
+    """
     instance_type = None
     region_name = None
 
+    # If being called from a context where we have a server object that stores
+    # AWS-specific info, reference that first for the instance type
     if server and hasattr(server, 'ec2serverinfo') and server.ec2serverinfo:
         instance_type = server.ec2serverinfo.instance_type
         region_name = server.ec2serverinfo.ec2_region
@@ -159,45 +446,158 @@ def compute_rate(group, environment, resource_technology, cfvs, pcvss,
                 instance_type = instance_type_cfvs[0].value
                 break
 
-    if not instance_type:
-        logger.warning("Could not determine instance type, unable to calculate rate")
-        return {}
+    return instance_type, region_name
 
-    if not region_name:
-        rh = AWSHandler.objects.first()
-        region_name = rh.get_env_region(environment)
 
-    if not region_name:
-        logger.warning("Could not determine region, unable to calculate rate.")
-        return {}
+def hourly_rate(region_name, instance_type, operating_system):
+    """
+    The on-demand hourly USD price as a string, from the Django cache or the
+    region's price catalog, or None if the catalog has no matching SKU.
+    """
+    # Syncs and compiles the region's AWS pricing data if it is missing or due a check
+    catalog = get_price_catalog(region_name)
 
     # Locations are full titles, like "US West (N. California)"
     location = get_region_title(region_name)
 
-    cache_key = "{}:{}".format(region_name, instance_type)
+    # The catalog version is part of the key, so a new catalog replaces cached rates
+    cache_key = "aws_rate:{}:{}:{}:{}".format(catalog.version, region_name, instance_type, operating_system)
     rate = cache.get(cache_key)
 
     if rate:
         logger.debug("Using cached rate {} for {} type in {}"
                      .format(rate, instance_type, location))
-    else:
-        sku = get_sku(location, instance_type, products_file)
-        if sku is None:
-            logger.warning('No Product SKU was found in the AWS pricing file '
-                           'for region {} and instance type {}.'
-                           .format(location, instance_type))
-            return {}
-        rate = get_price(sku, terms_file)
-        cache.set(cache_key, rate)
+        return rate
 
-    rate_time_unit = GlobalPreferences.objects.get().rate_time_unit
-    number_of_hours = NUMBER_OF_HOURS.get(rate_time_unit, 0)
+    sku, rate = catalog.lookup(location, instance_type, operating_system)
+    if sku is None or rate is None:
+        logger.warning('No Product SKU was found in the AWS pricing file '
+                       'for region {} and instance type {}.'
+                       .format(location, instance_type))
+        return None
+    logger.debug("SKU: {}, hourly price: {}".format(sku, rate))
+    cache.set(cache_key, rate)
+    return rate
+
+
+def build_rate_dict(rate, number_of_hours, quantity, default_rate):
     rate_dict = {
     'Hardware': {
         "Instance Type": Decimal(rate) * number_of_hours * quantity
       },
     }
-    default_rate = default_compute_rate(group=group,environment=environment,resource_technology=resource_technology,cfvs=cfvs,pcvss=pcvss,os_build=os_build,apps=apps,quantity=quantity,**kwargs)
     rate_dict['Software'] = default_rate.get('Software', 0)
     rate_dict['Extra'] = default_rate.get('Extra', 0)
-    return rate_dict
\ No newline at end of file
+    return rate_dict
+
+
+def compute_rate(group, environment, resource_technology, cfvs, pcvss,
+                 os_build, apps, quantity=1, **kwargs):
+    server = kwargs.get('server', None)
+    instance_type, region_name = instance_type_and_region(server, cfvs, pcvss)
+
+    if not instance_type:
+        logger.warning("Could not determine instance type, unable to calculate rate")
+        return {}
+
+    if not region_name:
+        rh = AWSHandler.objects.first()
+        region_name = rh.get_env_region(environment)
+
+    if not region_name:
+        logger.warning("Could not determine region, unable to calculate rate.")
+        return {}
+
+    rate = hourly_rate(region_name, instance_type, operating_system_for(os_build))
+    if rate is None:
+        return {}
+
+    rate_time_unit = GlobalPreferences.objects.get().rate_time_unit
+    number_of_hours = NUMBER_OF_HOURS.get(rate_time_unit, 0)
+    default_rate = default_compute_rate(group=group,environment=environment,resource_technology=resource_technology,cfvs=cfvs,pcvss=pcvss,os_build=os_build,apps=apps,quantity=quantity,**kwargs)
+    return build_rate_dict(rate, number_of_hours, quantity, default_rate)
+
+
+def compute_rates_bulk(servers):
+    """
+    Compute the rate of many servers at once, e.g. to refresh rates for the
+    whole estate. Returns {server id: rate dict}, with {} for servers that
+    could not be priced, same as compute_rate.
+
+    The servers' EC2 info, custom field values, OS builds and other related
+    rows are prefetched in bulk. Servers are grouped by (region, instance
+    type, OS) and each distinct key is priced once, and GlobalPreferences is
+    read once.
+    """
+    servers = list(servers)
+    prefetch_related_objects(
+        servers,
+        'ec2serverinfo',
+        'custom_field_values__field',
+        'os_build__os_family',
+        'environment',
+        'group',
+        'applications',
+        'resource_handler__resource_technology',
+    )
+
+    rate_time_unit = GlobalPreferences.objects.get().rate_time_unit
+    number_of_hours = NUMBER_OF_HOURS.get(rate_time_unit, 0)
+    default_handler = None
+    env_regions = {}
+
+    keys = {}
+    for server in servers:
+        cfvs = list(server.custom_field_values.all())
+        instance_type, region_name = instance_type_and_region(server, cfvs, [])
+        if not instance_type:
+            logger.warning("Could not determine instance type for server {}, unable to calculate rate"
+                           .format(server))
+            continue
+        if not region_name and server.environment_id:
+            if server.environment_id not in env_regions:
+                default_handler = default_handler or AWSHandler.objects.first()
+                env_regions[server.environment_id] = default_handler.get_env_region(server.environment)
+            region_name = env_regions[server.environment_id]
+        if not region_name:
+            logger.warning("Could not determine region for server {}, unable to calculate rate.".format(server))
+            continue
+        keys[server.id] = (region_name, instance_type, operating_system_for(server.os_build))
+
+    rates = {}
+    for key in sorted(set(keys.values())):
+        try:
+            rates[key] = hourly_rate(*key)
+        except Exception as e:
+            # e.g. the region's pricing could not be synced; price the other regions
+            logger.warning("Could not price {} {} in {}: {}".format(key[2], key[1], key[0], e))
+            rates[key] = None
+    logger.debug("Priced {} server(s) with {} distinct (region, instance type, OS) keys"
+                 .format(len(keys), len(rates)))
+
+    rate_dicts = {}
+    for server in servers:
+        rate = rates.get(keys.get(server.id))
+        if rate is None:
+            rate_dicts[server.id] = {}
+            continue
+        resource_handler = server.resource_handler
+        default_rate = default_compute_rate(
+            group=server.group,
+            environment=server.environment,
+            resource_technology=resource_handler.resource_technology if resource_handler else None,
+            cfvs=list(server.custom_field_values.all()),
+            pcvss=[],
+            os_build=server.os_build,
+            apps=list(server.applications.all()),
+            quantity=1,
+            server=server,
+        )
+        rate_dicts[server.id] = build_rate_dict(rate, number_of_hours, 1, default_rate)
+    return rate_dicts
+
+if __name__ == '__main__':
+    # Sync pricing from the AWS pricing site or a local directory of offer files:
+    # python aws_rate_hook_with_cb_configured_rate_per_env.py [base_url_or_dir] [region ...]
+    base_url = sys.argv[1] if len(sys.argv) > 1 else PRICING_BASE_URL
+    print(sync_pricing(sys.argv[2:] or None, base_url=base_url))
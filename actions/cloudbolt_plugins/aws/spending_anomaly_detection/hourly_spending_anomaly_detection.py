@@ -1,6 +1,15 @@
 """
-Checks the last hour of AWS Billing Data from S3 buckets, and sends an alert if
-any servers have exceeded the specified threshold.
+Checks the last hours of AWS Billing Data from S3 buckets, and sends an alert
+if any servers' hourly cost deviates sharply from their own usual spending.
+
+Each server has a baseline: an exponentially weighted moving average (EWMA)
+and variance of its hourly cost over roughly BASELINE_WINDOW_HOURS. An hour is
+anomalous when its cost is more than Z_SCORE_THRESHOLD standard deviations
+(and at least MIN_DEVIATION) above the server's baseline. Baselines are kept
+in BASELINE_STATE_FILE between runs, so each run only reads the hours it has
+not seen yet. Hours without billing data for a server (e.g. while it is
+stopped) are skipped, not counted as zero cost. All servers are scored
+together with NumPy, a few vector operations per hour.
 
 Note: This Action assumes that you have one or more configured Alert Channels
     that can be used for notifying the appropraite users. These channels must
@@ -12,64 +21,260 @@ Version:
 
 import datetime
 import json
+import os
+import time
+from itertools import repeat
+from operator import itemgetter, sub
 from typing import List, Tuple
 
+import numpy as np
+
 from alerts.methods import alert
 from resourcehandlers.aws.models import AWSHandler
 from utilities.logger import ThreadLogger
 
-AWS_COST_THRESHOLD = 100
 ALERT_CHANNEL_NAMES: List[str] = []
+BASELINE_STATE_FILE = "/var/opt/cloudbolt/proserv/aws_spending_baseline.npz"
+# Approximate number of recent hours the baseline follows
+BASELINE_WINDOW_HOURS = 168
+# Standard deviations above the baseline that make an hour anomalous
+Z_SCORE_THRESHOLD = 4.0
+# Smallest increase over the baseline (in the billing currency) worth alerting on
+MIN_DEVIATION = 1.0
+# Hours of history a server needs before it can be flagged
+MIN_BASELINE_HOURS = 24
+# Lower bound on the standard deviation, so flat spending doesn't divide by zero
+MIN_STD = 0.01
 
 logger = ThreadLogger(__name__)
 
 CostData = Tuple[datetime.datetime, str, float]
 
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+NAIVE_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+class _Columns(dict):
+    """Maps each server id to a column number, numbering new ids as they come."""
+
+    def __missing__(self, server_id):
+        column = self[server_id] = len(self)
+        return column
+
+
+def _epoch_seconds(timestamp):
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+    return (timestamp - EPOCH).total_seconds()
+
+
+def to_matrix(data_list):
+    """
+    Convert [(datetime, server_id, cost)] rows to (server ids, first hour since
+    the epoch, costs, billed) where costs is an (hours, servers) array and
+    billed marks the hours each server has rows for. Naive datetimes are UTC;
+    duplicate rows are summed.
+
+    The columns are read with map/itemgetter into np.fromiter, so the only
+    per-row work is done in C.
+    """
+    count = len(data_list)
+    if not count:
+        return [], 0, np.zeros((0, 0), dtype=np.float32), np.zeros((0, 0), dtype=bool)
+    # Subtracting an epoch of the same kind (naive ones are UTC) is much
+    # quicker than datetime.timestamp(); mixed rows take the slow path
+    epoch = NAIVE_EPOCH if data_list[0][0].tzinfo is None else EPOCH
+    try:
+        seconds = np.fromiter(
+            map(datetime.timedelta.total_seconds, map(sub, map(itemgetter(0), data_list), repeat(epoch))),
+            dtype=np.float64, count=count)
+    except TypeError:
+        seconds = np.fromiter(map(_epoch_seconds, map(itemgetter(0), data_list)), dtype=np.float64, count=count)
+    hours = np.floor_divide(seconds, 3600).astype(np.int64)
+    columns = _Columns()
+    server_columns = np.fromiter(
+        map(columns.__getitem__, map(str, map(itemgetter(1), data_list))), dtype=np.int64, count=count)
+    costs = np.fromiter(map(float, map(itemgetter(2), data_list)), dtype=np.float64, count=count)
+
+    first_hour = int(hours.min())
+    cells = (hours - first_hour, server_columns)
+    shape = (int(hours.max()) - first_hour + 1, len(columns))
+    matrix = np.zeros(shape, dtype=np.float32)
+    np.add.at(matrix, cells, costs)
+    billed = np.zeros(shape, dtype=bool)
+    billed[cells] = True
+    return list(columns), first_hour, matrix, billed
+
+
+class SpendingBaselines:
+    """Per-server EWMA mean and variance of hourly cost, stored as parallel arrays."""
+
+    def __init__(self, window_hours=BASELINE_WINDOW_HOURS):
+        self.alpha = 2.0 / (window_hours + 1)
+        self.server_ids = []
+        self.mean = np.zeros(0)
+        self.var = np.zeros(0)
+        self.count = np.zeros(0, dtype=np.int64)
+        # Last hour (since the epoch) already included in the baselines
+        self.last_hour = -1
+
+    @classmethod
+    def load(cls, path=BASELINE_STATE_FILE, window_hours=BASELINE_WINDOW_HOURS):
+        baselines = cls(window_hours)
+        if os.path.exists(path):
+            with np.load(path) as state:
+                baselines.server_ids = state["server_ids"].tolist()
+                baselines.mean = state["mean"]
+                baselines.var = state["var"]
+                baselines.count = state["count"]
+                baselines.last_hour = int(state["last_hour"])
+        return baselines
+
+    def save(self, path=BASELINE_STATE_FILE):
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path, server_ids=np.array(self.server_ids, dtype=str), mean=self.mean,
+            var=self.var, count=self.count, last_hour=np.int64(self.last_hour),
+        )
+        os.replace(tmp_path, path)
+
+    def _state_indexes(self, server_ids):
+        """Baseline array index for each of ``server_ids``, adding unseen servers."""
+        positions = {server_id: i for i, server_id in enumerate(self.server_ids)}
+        indexes = np.empty(len(server_ids), dtype=np.int64)
+        added = 0
+        for i, server_id in enumerate(server_ids):
+            index = positions.get(server_id)
+            if index is None:
+                index = len(self.server_ids)
+                self.server_ids.append(server_id)
+                positions[server_id] = index
+                added += 1
+            indexes[i] = index
+        if added:
+            self.mean = np.concatenate([self.mean, np.zeros(added)])
+            self.var = np.concatenate([self.var, np.zeros(added)])
+            self.count = np.concatenate([self.count, np.zeros(added, dtype=np.int64)])
+        return indexes
+
+    def update(self, server_ids, first_hour, costs, billed):
+        """
+        Score and fold in the hours of ``costs`` (an (hours, servers) array
+        starting at ``first_hour``) after last_hour. Only the hours marked in
+        ``billed`` are scored and folded in; a server's baseline is left as is
+        for the hours it has no billing data.
+
+        Returns [(hour, server id, cost, baseline, z-score)] for anomalous hours.
+        """
+        skip = max(0, self.last_hour + 1 - first_hour)
+        costs = costs[skip:]
+        billed = billed[skip:]
+        first_hour += skip
+        span = costs.shape[0]
+        if not span or not len(server_ids):
+            return []
+
+        indexes = self._state_indexes(server_ids)
+        # The hourly loop runs in float32: half the memory traffic of float64,
+        # and plenty of precision for hourly costs
+        costs = np.asarray(costs, dtype=np.float32)
+        mean = self.mean[indexes].astype(np.float32)
+        var = self.var[indexes].astype(np.float32)
+        count = self.count[indexes].copy()
+
+        alpha = np.float32(self.alpha)
+        # Flooring the deviation at MIN_DEVIATION / Z_SCORE_THRESHOLD also
+        # means an anomaly is always at least MIN_DEVIATION above the mean
+        min_std = np.float32(max(MIN_STD, MIN_DEVIATION / Z_SCORE_THRESHOLD))
+        std = np.empty_like(mean)
+        limit = np.empty_like(mean)
+        diff = np.empty_like(mean)
+        increment = np.empty_like(mean)
+        decay = np.empty_like(mean)
+        anomalies = []
+        for column in range(span):
+            x = costs[column]
+            present = billed[column]
+            # A server's baseline starts at its first billed hour, with its
+            # mean set to that hour's cost
+            starting = present & (count == 0)
+            if starting.any():
+                mean[starting] = x[starting]
+            np.sqrt(var, out=std)
+            np.maximum(std, min_std, out=std)
+            # Cost above which the hour is anomalous; unbilled hours and
+            # servers still building their baseline are never flagged
+            np.multiply(std, np.float32(Z_SCORE_THRESHOLD), out=limit)
+            limit += mean
+            np.copyto(limit, np.inf, where=~present | (count < MIN_BASELINE_HOURS))
+            for index in np.flatnonzero(x > limit):
+                anomalies.append((
+                    first_hour + column, server_ids[index], float(x[index]),
+                    float(mean[index]), float((x[index] - mean[index]) / std[index]),
+                ))
+            # Clip spikes before folding them in, so one anomaly doesn't
+            # inflate the baseline it is measured against
+            np.minimum(x, limit, out=diff)
+            diff -= mean
+            diff *= present
+            np.multiply(diff, alpha, out=increment)
+            mean += increment
+            diff *= increment
+            var += diff
+            np.multiply(present, -alpha, out=decay)
+            decay += 1
+            var *= decay
+            count += present
+
+        self.mean[indexes] = mean
+        self.var[indexes] = var
+        self.count[indexes] = count
+        self.last_hour = first_hour + span - 1
+        return anomalies
+
 
 class AWSCostAlert:
-    def __init__(self):
-        self.over_threshold = []
+    def __init__(self, state_file=BASELINE_STATE_FILE):
+        self.state_file = state_file
+        self.anomalies = []
 
     def __call__(self):
         """
         Retrieve cost data for all AWS Resource Handlers and alert if any
-        servers exceed the specified threshold.
+        servers' spending deviates from their baseline.
         """
-        aws_instances = AWSHandler.objects.all()
-        for aws in aws_instances:
-            last_hours_data = aws.get_yesterday_hourly_billing_data()
-            self.__check_threshold(last_hours_data)
+        data_list = []
+        for aws in AWSHandler.objects.all():
+            data_list.extend(aws.get_yesterday_hourly_billing_data())
 
-        if self.over_threshold:
-            _ = self.__alert_over_threshold()
+        baselines = SpendingBaselines.load(self.state_file)
+        self.anomalies = baselines.update(*to_matrix(data_list))
+        baselines.save(self.state_file)
 
-    def __check_threshold(self, data_list):
-        """
-        Parse server information for instances that exceed the threshold.
+        if self.anomalies:
+            _ = self.__alert_anomalies()
 
-        Args:
-            data_list (List[CostData]): [(datetime, server_id, cost)]
-        """
-        _exceed_threshold_list = []
-        for time, server_id, cost in data_list:
-            if cost >= AWS_COST_THRESHOLD:
-                _exceed_threshold_list.append((str(time), server_id, cost))
-        self.over_threshold.extend(_exceed_threshold_list)
-        return
-
-    def __alert_over_threshold(self):
+    def __alert_anomalies(self):
         """
-        Send alert for all server instances that exceed the threshold.
+        Send alert for all server instances with anomalous spending.
 
         Returns:
             None
         """
-        keys = ["Timestamp", "Resource", "Cost"]
-        instance_dict = [dict(zip(keys, i)) for i in self.over_threshold]
+        instance_dict = [
+            {
+                "Timestamp": str(datetime.datetime.fromtimestamp(hour * 3600, datetime.timezone.utc)),
+                "Resource": server_id,
+                "Cost": round(cost, 4),
+                "Baseline": round(baseline, 4),
+                "Z-Score": round(z_score, 1),
+            }
+            for hour, server_id, cost, baseline, z_score in self.anomalies
+        ]
         instance_json = json.dumps(instance_dict, indent=4)
         message = (
-            f"The following servers exceeded the AWS cost threshold of {AWS_COST_THRESHOLD}:"
-            f"{instance_json}"
+            f"The following servers' hourly AWS cost was over {Z_SCORE_THRESHOLD} standard "
+            f"deviations above their baseline:{instance_json}"
         )
         logger.info(message)
 
@@ -79,8 +284,46 @@ class AWSCostAlert:
         return None
 
 
+def benchmark(servers=100000, hours=720):
+    """
+    Time building baselines from ``hours`` hours of history for ``servers``
+    servers, then a daily run: loading a day of billing rows and scoring it.
+    """
+    rng = np.random.default_rng(0)
+    server_ids = [f"i-{i:017x}" for i in range(servers)]
+    scale = rng.gamma(2.0, 0.5, servers)
+    costs = scale[None, :] * rng.normal(1.0, 0.05, (hours, servers))
+    # Some servers are stopped for part of the history
+    billed = rng.random((hours, servers)) > 0.05
+    costs[~billed] = 0
+
+    baselines = SpendingBaselines()
+    start = time.perf_counter()
+    baselines.update(server_ids, 480000, costs, billed)
+    print(f"history, {servers} servers x {hours} hours: {time.perf_counter() - start:.2f}s")
+
+    day = scale[None, :] * rng.normal(1.0, 0.05, (24, servers))
+    day.flat[rng.choice(day.size, 50, replace=False)] *= 20
+    first = datetime.datetime.fromtimestamp((480000 + hours) * 3600, datetime.timezone.utc)
+    rows = [
+        (first + datetime.timedelta(hours=hour), server_id, cost)
+        for hour, hour_costs in enumerate(day.tolist())
+        for server_id, cost in zip(server_ids, hour_costs)
+    ]
+    start = time.perf_counter()
+    matrix = to_matrix(rows)
+    loaded = time.perf_counter()
+    anomalies = baselines.update(*matrix)
+    print(f"daily run, {len(rows)} rows: load {loaded - start:.2f}s, "
+          f"score {time.perf_counter() - loaded:.2f}s, {len(anomalies)} anomalies")
+
+
 def run(*args, **kwargs):
     cost_alert = AWSCostAlert()
     cost_alert()
 
     return "SUCCESS", "", ""
+
+
+if __name__ == "__main__":
+    benchmark()
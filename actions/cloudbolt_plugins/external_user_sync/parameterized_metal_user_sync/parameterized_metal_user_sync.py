@@ -30,25 +30,44 @@ will be removed.
 
 import sys
 
-from accounts.models import Group, GroupType, UserProfile
+from django.contrib.auth.models import User
+
+from accounts.models import GroupType, UserProfile
 from common.methods import set_progress
+from shared_modules.ldap_membership_sync import (
+    GroupMap, LdifDirectory, MembershipPlan, apply_membership_plan, fetch_directory_entries)
 
 GROUP_LEVELS = ["Silver", "Bronze", "Gold"]
+# Roles reset on the metal groups on every sync (viewers are only ever added)
+MANAGED_ROLES = ["requestors", "approvers", "user_admins", "resource_admins"]
 
 
 def run(job, logger=None, **kwargs):
     debug("Running hook {}".format(__name__), logger)
 
     users = kwargs.get('users', None)
+    # Users are looked up with a few paged LDAP searches; pass ldap_directory
+    # (e.g. an LdifDirectory) to read them from somewhere else
+    entries, missing = fetch_directory_entries(users, kwargs.get('ldap_directory'))
+    for user_profile in missing:
+        debug("No external data found for user: {}".format(user_profile), logger)
+
+    groups = get_or_create_groups()
+    plan = MembershipPlan()
+    admins = {}
     for user_profile in users:
-        debug("Fetching external data for user: {}".format(user_profile), logger)
-        data = user_profile.ldap.runUserSearch(user_profile.user.username, find="")
-        # debug("{}".format(data), logger)
-        if not data:
-            return "FAILURE", "", ""
-
-        groups = get_or_create_groups()
-        set_user_permissions(user_profile, groups, data)
+        entry = entries.get(user_profile.id)
+        if entry is None:
+            continue
+        is_admin = set_user_permissions(user_profile, groups, entry.as_search_result(), plan)
+        if is_admin is not None:
+            admins[user_profile] = is_admin
+
+    apply_membership_plan(plan)
+    set_admin_permissions(admins)
+
+    if missing:
+        return "FAILURE", "", "No LDAP data found for: {}".format(", ".join(str(u) for u in missing))
     return "", "", ""
 
 
@@ -60,52 +79,46 @@ def get_or_create_groups():
     """
     groups = {}
     group_type, _ = GroupType.objects.get_or_create(group_type="Organization")
+    group_map = GroupMap()
     for level in GROUP_LEVELS:
-        group, _ = Group.objects.get_or_create(
-            name=level, type=group_type, parent=None
-        )
-        groups[level] = group
+        groups[level] = group_map.get_or_create(level, group_type)
     return groups
 
 
-def add_user_to_groups(user_profile, groups, role):
+def add_user_to_groups(user_profile, groups, role, plan):
     """
     Adds a user to a list of groups, in the specified role.
 
     :param user_profile: a CB UserProfile object
     :param groups: a list of Group objects
-    :param role: a string that should be "viewers", "requesters", "approvers",
+    :param role: a string that should be "viewers", "requestors", "approvers",
     "resource_admins", or "user_admins"
+    :param plan: the MembershipPlan the role is added to
     :return: None
     """
     set_progress("Adding {} to {} role on these groups: {}".format(user_profile, role, groups))
-    role_relationship = getattr(user_profile, role)
-    role_relationship.add(*groups)
+    plan.grant(user_profile, role, groups)
 
 
-def set_user_permissions(user_profile, groups, data):
+def set_user_permissions(user_profile, groups, data, plan):
     """
-    Set users permissions on the 3 groups based on security group membership in LDAP/AD
+    Plan users permissions on the 3 groups based on security group membership in LDAP/AD
 
-    Also make them a CB admin, super admin, and env admin if they are a member of the
-    corresponding security group in AD.
+    :return: whether they should be a CB admin, super admin, and env admin
+        based on membership of the corresponding security group in AD, or None
+        if their security groups are unknown
     """
-    group_objects = groups.values()
+    group_objects = list(groups.values())
     is_admin = False  # keeps track of whether they have been found to be in the CB admin sec group
 
     # First remove all permissions from the groups we are managing
-    user_profile.requestors.remove(*group_objects)
-    user_profile.approvers.remove(*group_objects)
-    user_profile.user_admins.remove(*group_objects)
-    user_profile.resource_admins.remove(*group_objects)
-
-    user = user_profile.user
+    plan.manage(user_profile, MANAGED_ROLES, group_objects)
 
     # Add additional permissions based on LDAP/AD group membership
     if 'memberOf' not in data[0][1]:
         set_progress("No memberOf information found for user {}, skipping adding user to any "
                      "roles".format(user_profile))
-        return
+        return None
 
     ldap_groups = data[0][1]['memberOf']
     set_progress("{} was found to be a member of these security groups: {}".format(
@@ -116,7 +129,7 @@ def set_user_permissions(user_profile, groups, data):
         # if the viewer security group name is anywhere in the name of the security group
         if "{{viewers_security_group_name}}" in lgroup:
             # Add user as an viewer in all 3 groups in CB
-            add_user_to_groups(user_profile, group_objects, "viewers")
+            add_user_to_groups(user_profile, group_objects, "viewers", plan)
         if "{{requesters_security_group_name}}" in lgroup:
             # Requesters are different - check to see if sec group name ends in any one of the
             # group level names ('silver', 'bronze', or 'gold'). If so, add to the corresponding
@@ -125,39 +138,48 @@ def set_user_permissions(user_profile, groups, data):
                 if group_level in lgroup:
                     group = groups[group_level]
                     set_progress("Adding {} to {} as a requester".format(user_profile, group))
-                    user_profile.requestors.add(group)
+                    plan.grant(user_profile, "requestors", [group])
         if "{{approvers_security_group_name}}" in lgroup:
             # Add user as an approver in all 3 groups in CB
-            add_user_to_groups(user_profile, group_objects, "approvers")
+            add_user_to_groups(user_profile, group_objects, "approvers", plan)
         if "{{group_admins_security_group_name}}" in lgroup:
             # Add user as a user_admin (group admin) in all 3 groups in CB
-            add_user_to_groups(user_profile, group_objects, "user_admins")
+            add_user_to_groups(user_profile, group_objects, "user_admins", plan)
         if "{{resource_admins_security_group_name}}" in lgroup:
             # Add user as a resource_admin in all 3 groups in CB
-            add_user_to_groups(user_profile, group_objects, "resource_admins")
+            add_user_to_groups(user_profile, group_objects, "resource_admins", plan)
 
         # process CB admin perms
         if "{{cb_admins_security_group_name}}" in lgroup:
-            set_progress("Making the user an admin")
-            # Make the user a super admin, CB admin, and env admin
-            user_profile.super_admin = True
-            user_profile.environment_admin = True
-            user_profile.save()
-            # set the django user permission that maps to cb_admin
-            user.is_superuser = True
-            user.save()
             is_admin = True
 
-    if not is_admin:
-        # after checking all groups, the user was not part of any that make them a CB admin
-        set_progress("Removing admin permissions from the user")
-        # Make the user not a super admiin, CB admin, and env admin
-        user_profile.super_admin = False
-        user_profile.environment_admin = False
-        user_profile.save()
-        # unset the django user permission that maps to cb_admin
-        user.is_superuser = False
-        user.save()
+    return is_admin
+
+
+def set_admin_permissions(admins):
+    """
+    Make each user in ``admins`` (user profile -> should be admin) a super
+    admin, CB admin and env admin, or take those permissions away, saving
+    only the users that change.
+    """
+    profiles = []
+    django_users = []
+    for user_profile, is_admin in admins.items():
+        user = user_profile.user
+        if user_profile.super_admin != is_admin or user_profile.environment_admin != is_admin:
+            set_progress("{} admin permissions for {}".format(
+                "Granting" if is_admin else "Removing", user_profile))
+            user_profile.super_admin = is_admin
+            user_profile.environment_admin = is_admin
+            profiles.append(user_profile)
+        # the django user permission that maps to cb_admin
+        if user.is_superuser != is_admin:
+            user.is_superuser = is_admin
+            django_users.append(user)
+    if profiles:
+        UserProfile.objects.bulk_update(profiles, ["super_admin", "environment_admin"])
+    if django_users:
+        User.objects.bulk_update(django_users, ["is_superuser"])
 
 
 def debug(message, logger):
@@ -168,8 +190,8 @@ def debug(message, logger):
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        sys.stderr.write("usage: %s <CloudBolt UserProfile.username>\n" % (sys.argv[0]))
+    if len(sys.argv) not in (2, 3):
+        sys.stderr.write("usage: %s <CloudBolt UserProfile.username> [<LDIF file>]\n" % (sys.argv[0]))
         sys.exit(2)
     username = sys.argv[1]
     try:
@@ -177,6 +199,11 @@ if __name__ == "__main__":
     except Exception:
         print("Failed to fetch user with username: {}".format(username))
         exit(1)
+    if len(sys.argv) == 3:
+        # Sync the user from a recorded LDIF export instead of AD
+        status, msg, err = run(None, None, users=[profile], ldap_directory=LdifDirectory(sys.argv[2]))
+        print("status, msg, err = {}, {}, {}".format(status, msg, err))
+        sys.exit(0)
     # Uncomment this to test calling into AD and sync users
     # status, msg, err = run(None, None, users=[profile])
     # print("status, msg, err = {}, {}, {}".format(status, msg, err))
@@ -188,4 +215,7 @@ if __name__ == "__main__":
         "{{requesters_security_group_name}}-Gold", "{{approvers_security_group_name}}",
     ]}]]
     groups = get_or_create_groups()
-    set_user_permissions(profile, groups, data)
+    plan = MembershipPlan()
+    is_admin = set_user_permissions(profile, groups, data, plan)
+    apply_membership_plan(plan)
+    set_admin_permissions({profile: is_admin})
@@ -1,4 +1,6 @@
-from accounts.models import UserProfile, Group
+from accounts.models import UserProfile
+from shared_modules.ldap_membership_sync import (
+    GroupMap, LdifDirectory, MembershipPlan, apply_membership_plan, fetch_directory_entries)
 
 __author__ = 'rick@cloudbolt.io'
 
@@ -39,62 +41,58 @@ GROUP_MAPPINGS = {
 }
 
 
+# CloudBolt role relation for each mapping role
+ROLE_FIELDS = {
+    ROLE_REQUESTOR: 'requestors',
+    ROLE_APPROVER: 'approvers',
+    ROLE_RESOURCE_ADMIN: 'resource_admins',
+    ROLE_GROUP_ADMIN: 'user_admins',
+}
+
+
 def run(job, logger=None, **kwargs):
     debug("Running hook {}".format(__name__), logger)
 
-    try:
-        root_group = Group.objects.get(name=ROOT_GROUP_NAME)
-    except:
-        root_group = None
+    group_map = GroupMap()
+    root_group = group_map.first(ROOT_GROUP_NAME) if ROOT_GROUP_NAME else None
+    mappings = {ldap_dn.lower(): mapping for ldap_dn, mapping in GROUP_MAPPINGS.items()}
 
     users = kwargs.get('users', None)
+    # Users are looked up with a few paged LDAP searches; pass ldap_directory
+    # (e.g. an LdifDirectory) to read them from somewhere else
+    entries, missing = fetch_directory_entries(users, kwargs.get('ldap_directory'))
+    for user_profile in missing:
+        debug("No LDAP info found for user: {}".format(user_profile), logger)
+
+    plan = MembershipPlan()
+    missing_groups = set()
     for user_profile in users:
-        debug("Fetching LDAP info for user: {}".format(user_profile), logger)
-        data = user_profile.ldap.runUserSearch(user_profile.user.username, find="")
-
-        if not data:
-            return "FAILURE", "", ""
-
-        ldap_groups = []
-        if 'memberOf' in data[0][1]:
-            ldap_groups = data[0][1]['memberOf']
-
-        for ldap_group in ldap_groups:
+        entry = entries.get(user_profile.id)
+        if entry is None:
+            continue
+        for ldap_group in entry.member_of:
             if is_mapped_to_cloudbolt(ldap_group):
-                mapping = GROUP_MAPPINGS[ldap_group]
+                mapping = mappings[ldap_group.lower()]
 
                 if ROOT_GROUP_NAME:
-                    cb_group, _ = Group.objects.get_or_create(
-                        name=mapping['cb_group'], type=root_group.type, parent=root_group)
+                    cb_group = group_map.find(mapping['cb_group'], root_group) or group_map.create(
+                        mapping['cb_group'], root_group.type, root_group)
                 else:
-                    try:
-                        cb_group, _ = Group.objects.get(name=mapping['cb_group'])
-                    except:
-                        return "FAILURE", "", ""
+                    cb_group = group_map.first(mapping['cb_group'])
+                    if cb_group is None:
+                        debug("CloudBolt group {} does not exist".format(mapping['cb_group']), logger)
+                        missing_groups.add(mapping['cb_group'])
+                        continue
 
                 # Pre-7.2 version
                 # by default add user to viewer role
-                user_profile.viewers.add(cb_group)
-
-                # reset user roles
-                user_profile.requestors.remove(cb_group)
-                user_profile.approvers.remove(cb_group)
-                user_profile.resource_admins.remove(cb_group)
-                user_profile.user_admins.remove(cb_group)
-
-                if mapping['roles']:
-                    for role in mapping['roles']:
-                        if role == ROLE_REQUESTOR:
-                            user_profile.requestors.add(cb_group)
-
-                        if role == ROLE_APPROVER:
-                            user_profile.approvers.add(cb_group)
-
-                        if role == ROLE_RESOURCE_ADMIN:
-                            user_profile.resource_admins.add(cb_group)
+                plan.grant(user_profile, 'viewers', [cb_group])
 
-                        if role == ROLE_GROUP_ADMIN:
-                            user_profile.user_admins.add(cb_group)
+                # reset user roles to the mapped ones
+                plan.manage(user_profile, ROLE_FIELDS.values(), [cb_group])
+                for role in mapping['roles'] or []:
+                    if role in ROLE_FIELDS:
+                        plan.grant(user_profile, ROLE_FIELDS[role], [cb_group])
 
                 # 7.2+ version
                 # from account.models import Role
@@ -113,6 +111,10 @@ def run(job, logger=None, **kwargs):
                 #             r = Role.objects.get(name=role)
                 #             user_profile.add_role_for_group(r, cb_group)
 
+    apply_membership_plan(plan)
+    if missing or missing_groups:
+        return "FAILURE", "", "No LDAP info found for: {}; missing CloudBolt groups: {}".format(
+            ", ".join(str(u) for u in missing), ", ".join(sorted(missing_groups)))
     return 'SUCCESS', '', ''
 
 
@@ -131,8 +133,8 @@ def debug(message, logger):
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        sys.stderr.write("usage: %s <CloudBolt UserProfile.username>\n" % (sys.argv[0]))
+    if len(sys.argv) not in (2, 3):
+        sys.stderr.write("usage: %s <CloudBolt UserProfile.username> [<LDIF file>]\n" % (sys.argv[0]))
         sys.exit(2)
     threading.current_thread().logger = logging.getLogger()
     username = sys.argv[1]
@@ -141,5 +143,7 @@ if __name__ == "__main__":
     except Exception:
         print("Failed to fetch user with username: {}".format(username))
         exit(1)
-    status, msg, err = run(None, None, users=[profile])
+    # With an LDIF file, read the user's groups from it instead of from LDAP
+    directory = LdifDirectory(sys.argv[2]) if len(sys.argv) == 3 else None
+    status, msg, err = run(None, None, users=[profile], ldap_directory=directory)
     print("status, msg, err = {}, {}, {}".format(status, msg, err))
@@ -12,73 +12,52 @@ user's current OU.
 
 import sys
 
-from accounts.models import Group, GroupType, UserProfile
+from accounts.models import GroupType, UserProfile
+from shared_modules.ldap_membership_sync import (
+    GroupMap, LdifDirectory, MembershipPlan, apply_membership_plan, fetch_directory_entries)
+
+# memberOf substring -> role it grants on the user's OU group
+ROLE_LDAP_GROUPS = {
+    "CB-Requestors": "requestors",
+    "CB-Approvers": "approvers",
+    "CB-GroupManagers": "user_admins",
+    "CB-ResourceManagers": "resource_admins",
+}
 
 
 def run(job, logger=None, **kwargs):
     debug("Running hook {}".format(__name__), logger)
 
     users = kwargs.get('users', None)
+    # Users are looked up with a few paged LDAP searches; pass ldap_directory
+    # (e.g. an LdifDirectory) to read them from somewhere else
+    entries, missing = fetch_directory_entries(users, kwargs.get('ldap_directory'))
+    for user_profile in missing:
+        debug("No external data found for user: {}".format(user_profile), logger)
+
+    ou_group_type, _ = GroupType.objects.get_or_create(group_type="Organizational Unit")
+    group_map = GroupMap()
+    plan = MembershipPlan()
     for user_profile in users:
-        debug("Fetching external data for user: {}".format(user_profile), logger)
-        skip_user = False
-        data = user_profile.ldap.runUserSearch(user_profile.user.username, find="")
-        if not data:
-            return ("FAILURE", "", "")
+        entry = entries.get(user_profile.id)
+        if entry is None:
+            continue
 
         # create cloudbolt groups as needed
-        dn = data[0][0]
-        ou_group_type, _ = GroupType.objects.get_or_create(group_type="Organizational Unit")
-        parent_group = None
-        for element in dn.split(",")[::-1]:
-            if element.startswith("OU="):
-                group_name = element[3:]
-                group = Group.objects.filter(name=group_name)
-                if not group:
-                    debug("Creating group {} as part of external user sync".format(group_name),
-                          logger)
-                    group = Group.objects.create(
-                        name=group_name, type=ou_group_type, parent=parent_group
-                    )
-                else:
-                    group = group[0]
-                    if group.parent != parent_group:
-                        #this is a duplicate OU in LDAP/AD, skip permission setting
-                        skip_user = True
-                        break
-                parent_group = group
-
-        if skip_user:
+        group = ou_group(entry.dn, ou_group_type, group_map, logger)
+        if group is None:
             continue
 
         # Pre-7.2 version
-        # set users permissions based on special group membership in LDAP/AD
-        # for each permission first remove the group if there
-        user_profile.requestors.remove(group)
-        user_profile.approvers.remove(group)
-        user_profile.user_admins.remove(group)
-        user_profile.resource_admins.remove(group)
-
-        # add Viewer permission
-        user_profile.viewers.add(group)
-
-        # Add additional permissions based on LDAP/AD group membership
-        if 'memberOf' in data[0][1]:
-            ldap_groups = data[0][1]['memberOf']
-
-            for lgroup in ldap_groups:
-                if "CB-Requestors" in lgroup:
-                    # Requestor
-                    user_profile.requestors.add(group)
-                if "CB-Approvers" in lgroup:
-                    # Approver
-                    user_profile.approvers.add(group)
-                if "CB-GroupManagers" in lgroup:
-                    # Group Admin
-                    user_profile.user_admins.add(group)
-                if "CB-ResourceManagers" in lgroup:
-                    # Resource Admin
-                    user_profile.resource_admins.add(group)
+        # set users permissions based on special group membership in LDAP/AD:
+        # the roles below are reset on the group, then Viewer plus whatever
+        # the user's LDAP/AD groups grant is added
+        plan.manage(user_profile, ROLE_LDAP_GROUPS.values(), [group])
+        plan.grant(user_profile, "viewers", [group])
+        for lgroup in entry.member_of:
+            for ldap_group_name, role in ROLE_LDAP_GROUPS.items():
+                if ldap_group_name in lgroup:
+                    plan.grant(user_profile, role, [group])
 
         # 7.2+ version
         # set users permissions based on special group membership in LDAP/AD
@@ -91,26 +70,50 @@ def run(job, logger=None, **kwargs):
         # user_profile.add_role_for_group(role, group)
 
         # # Add additional permissions based on LDAP/AD group membership
-        # if 'memberOf' in data[0][1]:
-        #     ldap_groups = data[0][1]['memberOf']
-
-        #     for lgroup in ldap_groups:
-        #         if "CB-Requestors" in lgroup:
-        #             role = Role.objects.get(name='requestor')
-        #             user_profile.add_role_for_group(role, group)
-        #         if "CB-Approvers" in lgroup:
-        #             role = Role.objects.get(name='approver')
-        #             user_profile.add_role_for_group(role, group)
-        #         if "CB-GroupManagers" in lgroup:
-        #             role = Role.objects.get(name='group_admin')
-        #             user_profile.add_role_for_group(role, group)
-        #         if "CB-ResourceManagers" in lgroup:
-        #             role = Role.objects.get(name='resource_admin')
-        #             user_profile.add_role_for_group(role, group)
-
+        # for lgroup in entry.member_of:
+        #     if "CB-Requestors" in lgroup:
+        #         role = Role.objects.get(name='requestor')
+        #         user_profile.add_role_for_group(role, group)
+        #     if "CB-Approvers" in lgroup:
+        #         role = Role.objects.get(name='approver')
+        #         user_profile.add_role_for_group(role, group)
+        #     if "CB-GroupManagers" in lgroup:
+        #         role = Role.objects.get(name='group_admin')
+        #         user_profile.add_role_for_group(role, group)
+        #     if "CB-ResourceManagers" in lgroup:
+        #         role = Role.objects.get(name='resource_admin')
+        #         user_profile.add_role_for_group(role, group)
+
+    changes = apply_membership_plan(plan)
+    debug("Role changes (added, removed): {}".format(changes), logger)
+
+    if missing:
+        return "FAILURE", "", "No LDAP data found for: {}".format(", ".join(str(u) for u in missing))
     return "", "", ""
 
 
+def ou_group(dn, ou_group_type, group_map, logger):
+    """
+    Return the CloudBolt group for the leaf OU in ``dn``, creating the groups
+    along the OU path as needed. Returns None when an OU is a duplicate of a
+    group with a different parent.
+    """
+    parent_group = None
+    for element in dn.split(",")[::-1]:
+        if element.startswith("OU="):
+            group_name = element[3:]
+            group = group_map.first(group_name)
+            if group is None:
+                debug("Creating group {} as part of external user sync".format(group_name),
+                      logger)
+                group = group_map.create(group_name, ou_group_type, parent_group)
+            elif group.parent_id != (parent_group.id if parent_group else None):
+                #this is a duplicate OU in LDAP/AD, skip permission setting
+                return None
+            parent_group = group
+    return parent_group
+
+
 def debug(message, logger):
     if logger:
         logger.debug(message)
@@ -119,8 +122,8 @@ def debug(message, logger):
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        sys.stderr.write("usage: %s <CloudBolt UserProfile.username>\n" % (sys.argv[0]))
+    if len(sys.argv) not in (2, 3):
+        sys.stderr.write("usage: %s <CloudBolt UserProfile.username> [<LDIF file>]\n" % (sys.argv[0]))
         sys.exit(2)
     username = sys.argv[1]
     try:
@@ -128,5 +131,7 @@ if __name__ == "__main__":
     except Exception:
         print("Failed to fetch user with username: ".format(username))
         exit(1)
-    status, msg, err = run(None, None, users=[profile])
+    # With an LDIF file, read the user's entry from it instead of from LDAP
+    directory = LdifDirectory(sys.argv[2]) if len(sys.argv) == 3 else None
+    status, msg, err = run(None, None, users=[profile], ldap_directory=directory)
     print("status, msg, err = {}, {}, {}".format(status, msg, err))
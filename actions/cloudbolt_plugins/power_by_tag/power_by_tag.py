@@ -1,6 +1,3 @@
-from infrastructure.models import Server
-from tags.models import TaggedItem
-
 """
 Action used to control server power by tag name.
 
@@ -11,15 +8,19 @@ before servers tagged with power-02.
 
 This script could be added to a service blueprint as actions that get executed
 in a specific order to control server power by tag.
+
+The tagged servers are loaded with one query and powered in parallel, a few
+at a time per resource handler, using the bulk_power Shared Module.
 """
 
+from shared_modules.bulk_power import power_servers, servers_with_tag
+
 
 def run(job, **kwargs):
-    for tag in TaggedItem.objects.filter(tag__name='{{ tag_name }}'):
-        s = tag.content_object
-        if isinstance(s, Server):
-            if 'ON' == '{{ desired_power_state }}':
-                s.power_on()
-            elif 'OFF' == '{{ desired_power_state }}':
-                s.power_off()
+    desired_state = '{{ desired_power_state }}'
+    if desired_state not in ('ON', 'OFF'):
+        return "", "", ""
+    result = power_servers(servers_with_tag('{{ tag_name }}'), desired_state, job=job)
+    if result.failed:
+        return "FAILURE", "", result.summary()
     return "", "", ""
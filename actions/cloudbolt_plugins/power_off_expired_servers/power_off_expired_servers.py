@@ -1,4 +1,4 @@
-from utilities import events
+from shared_modules.bulk_power import power_servers
 
 
 def run(job, logger=None, **kwargs):
@@ -8,11 +8,14 @@ def run(job, logger=None, **kwargs):
     The expiration_date parameter is used to determine whether a server is expired.
 
     Also updates their history with the event & an explanation.
+
+    Servers are powered off in parallel, a few at a time per resource handler,
+    using the bulk_power Shared Module.
     """
-    for server in job.server_set.all():
-        if server.power_status != "POWEROFF":
-            job.set_progress("Powering off %s." % server.hostname)
-            server.power_off()
-            msg = "Server powered off because it expired at %s." % (server.expiration_date)
-            events.add_server_event('MODIFICATION', server, msg, job=job)
+    result = power_servers(
+        job.server_set.all(), 'OFF', job=job,
+        event_message=lambda server: "Server powered off because it expired at %s." % (server.expiration_date),
+    )
+    if result.failed:
+        return 'FAILURE', '', result.summary()
     return '', '', ''
@@ -2,12 +2,92 @@ from accounts.models import UserProfile
 from utilities.logger import ThreadLogger
 from utilities.mail import email
 import csv, datetime
-import tempfile
+import gzip
+import io
+import json
+import resource
+import time
 from reportengines.internal.export_utils import CustomServerReportTableConfig
 from infrastructure.models import Server
 CUSTOM_SERVER_REPORT_FILTERS_FORMSET_PREFIX = "filter_formset"
 logger = ThreadLogger(__name__)
 
+# Attachment format: 'csv' (gzip-compressed CSV), 'jsonl' (gzip-compressed
+# JSON Lines) or 'parquet' (needs pyarrow; falls back to csv without it)
+REPORT_FORMAT = 'csv'
+# Servers turned into report rows at a time; only one chunk of rows is in
+# memory at once, the attachment itself is kept compressed
+CHUNK_SIZE = 2000
+
+CONTENT_TYPES = {
+    'csv': ('csv.gz', 'application/gzip'),
+    'jsonl': ('jsonl.gz', 'application/gzip'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+
+
+def report_chunks(table_config, servers, chunk_size=CHUNK_SIZE):
+    """
+    Yield lists of report rows for ``servers``, ``chunk_size`` servers at a
+    time. Server ids are streamed with .iterator() and each chunk's rows are
+    built from a queryset of just those servers, with the related objects
+    the columns show fetched in the same query.
+    """
+    chunk_servers = servers.select_related('owner__user', 'group', 'environment')
+    ids = []
+    for server_id in servers.order_by('id').values_list('id', flat=True).iterator(chunk_size=chunk_size):
+        ids.append(server_id)
+        if len(ids) >= chunk_size:
+            yield table_config.get_rows(chunk_servers.filter(id__in=ids).order_by('id'))
+            ids = []
+    if ids:
+        yield table_config.get_rows(chunk_servers.filter(id__in=ids).order_by('id'))
+
+
+def write_csv(buffer, headings, chunks):
+    with gzip.GzipFile(fileobj=buffer, mode='wb') as compressed:
+        text = io.TextIOWrapper(compressed, encoding='utf-8', newline='')
+        writer = csv.writer(text, delimiter=',')
+        writer.writerow(headings)
+        count = 0
+        for rows in chunks:
+            writer.writerows(rows)
+            count += len(rows)
+        text.flush()
+        text.detach()
+    return count
+
+
+def write_jsonl(buffer, headings, chunks):
+    with gzip.GzipFile(fileobj=buffer, mode='wb') as compressed:
+        count = 0
+        for rows in chunks:
+            lines = [json.dumps(dict(zip(headings, row)), default=str) + '\n' for row in rows]
+            compressed.write(''.join(lines).encode('utf-8'))
+            count += len(rows)
+    return count
+
+
+def write_parquet(buffer, headings, chunks):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(heading, pa.string()) for heading in headings])
+    count = 0
+    with pq.ParquetWriter(buffer, schema, compression='snappy') as writer:
+        # One row group per chunk
+        for rows in chunks:
+            columns = [
+                pa.array([None if row[i] is None else str(row[i]) for row in rows], type=pa.string())
+                for i in range(len(headings))
+            ]
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+            count += len(rows)
+    return count
+
+
+WRITERS = {'csv': write_csv, 'jsonl': write_jsonl, 'parquet': write_parquet}
+
 
 def run(job=None, **kwargs):
     # The current time, used to build date strings
@@ -23,23 +103,33 @@ def run(job=None, **kwargs):
     servers = Server.objects_for_profile(profile)
     servers = servers.exclude(status__in=["HISTORICAL"])
     servers = servers.filter(group__name='Unassigned')
-    report_format = 'csv'
+    report_format = REPORT_FORMAT
+    if report_format == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            logger.warning("pyarrow is not installed, sending the report as CSV")
+            report_format = 'csv'
     table_config = CustomServerReportTableConfig(
                 profile, columns, plain_text=False if report_format == "json" else True
             )
-    table_config.aggregate_unfiltered_qs(servers)       
-    rows = table_config.get_rows(servers)
-
-    file = tempfile.NamedTemporaryFile()
 
-    with open(file.name, 'w') as f:
-        writer = csv.writer(f, delimiter=',')
-        writer.writerow(table_config.get_column_headings())
-        for l in rows:
-            writer.writerow(l)
+    # ru_maxrss is the high-water mark (KB on Linux) of the whole long-lived
+    # job process, so only its increase is down to this report
+    peak_rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    table_config.aggregate_unfiltered_qs(servers)
+    # The report is written compressed straight into the attachment buffer
+    buffer = io.BytesIO()
+    row_count = WRITERS[report_format](
+        buffer, table_config.get_column_headings(), report_chunks(table_config, servers))
+    elapsed = time.perf_counter() - started
+    peak_rss_increase = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - peak_rss_before
 
-    with open(file.name, 'r') as f:
-        email_attachments = [('{}_{}_{}.csv'.format('CustomServerReport', start_str, end_str), f.read(), 'text/csv')]
+    extension, content_type = CONTENT_TYPES[report_format]
+    email_attachments = [
+        ('{}_{}_{}.{}'.format('CustomServerReport', start_str, end_str, extension), buffer.getvalue(), content_type)
+    ]
 
     email_context = {'subject': 'Custom Server Report',}
     recipients = requestor_email
@@ -50,6 +140,10 @@ def run(job=None, **kwargs):
         context=email_context,
     )
 
-    file.close()
-    
-    return "", "", ""
+    output = (
+        "Generated a {} report of {} server(s) ({} KB) in {:.1f}s, "
+        "raising the job process's peak RSS by {:.1f} MB.".format(
+            report_format, row_count, len(email_attachments[0][1]) // 1024, elapsed, peak_rss_increase / 1024)
+    )
+    logger.info(output)
+    return "", output, ""
@@ -1,4 +1,14 @@
 from cbhooks.models import ServerAction
+from shared_modules.sub_job_scheduler import SubJobScheduler
+
+# Sub-jobs are started in rolling waves rather than all at once; see the
+# sub_job_scheduler Shared Module
+MAX_IN_FLIGHT = 25
+MAX_PER_ENVIRONMENT = 10
+MAX_PER_HANDLER = 10
+WAVE_SIZE = 250
+# Stop before the next wave if fewer than this fraction of a wave succeeded
+MIN_WAVE_SUCCESS = 0.9
 
 
 def run(job, *args, logger=None, **kwargs):
@@ -11,11 +21,12 @@ def run(job, *args, logger=None, **kwargs):
             return "FAILURE", "", "No 'server' or 'servers' argument found"
         # There's just one server, so no point in spawning a sub-job
         return action.run_hook(owner=job.owner, server=server, parent_job=job, **kwargs)
-        
-    jobs = []
-    for server in servers:
-        subjob = action.run_hook_as_job(owner=job.owner, server=server, parent_job=job, **kwargs)
-        jobs.append(subjob)
-    job.wait_for_sub_jobs()
-    
-    return "SUCCESS", f"Completed {len(jobs)} sub-jobs", ""
\ No newline at end of file
+
+    scheduler = SubJobScheduler(
+        job, max_in_flight=MAX_IN_FLIGHT, wave_size=WAVE_SIZE, min_wave_success=MIN_WAVE_SUCCESS,
+        max_per_environment=MAX_PER_ENVIRONMENT, max_per_handler=MAX_PER_HANDLER,
+    )
+    result = scheduler.run(
+        servers, lambda server: action.run_hook_as_job(owner=job.owner, server=server, parent_job=job, **kwargs)
+    )
+    return result.status, result.summary(), ""
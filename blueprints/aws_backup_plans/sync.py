@@ -1,33 +1,19 @@
-import boto3
-from botocore.client import ClientError
-from common.methods import set_progress
-from resourcehandlers.aws.models import AWSHandler
-from infrastructure.models import Environment
+from shared_modules.aws_discovery import discover_aws_resources
 
 
 RESOURCE_IDENTIFIER = 'backup_plan_name'
 
 def discover_resources(**kwargs):
-    discovered_security_groups = []    
-    for handler in AWSHandler.objects.all():
-        set_progress('Connecting to Amazon backup for handler: {}'.format(handler))
-        for region in handler.current_regions():
-            try:
-                client = boto3.client('backup',
-                        region_name=region,
-                        aws_access_key_id=handler.serviceaccount,
-                        aws_secret_access_key=handler.servicepasswd
-                        )            
-                for response in client.list_backup_plans()['BackupPlansList']:
-                    discovered_security_groups.append({
-                        "aws_region": region,
-                        "aws_rh_id": handler.id,
-                        "name": response['BackupPlanName'],
-                        "backup_plan_name": response['BackupPlanName'],
-                        "backup_plan_id": response['BackupPlanId'],
-                    })
-            except Exception as e:
-                set_progress('AWS ClientError: {}'.format(e))
-                continue
-            
-    return discovered_security_groups
\ No newline at end of file
+    def discover(client, handler, region):
+        for page in client.get_paginator('list_backup_plans').paginate():
+            for response in page['BackupPlansList']:
+                yield {
+                    "aws_region": region,
+                    "aws_rh_id": handler.id,
+                    "name": response['BackupPlanName'],
+                    "backup_plan_name": response['BackupPlanName'],
+                    "backup_plan_id": response['BackupPlanId'],
+                }
+
+    # Handlers and regions are searched concurrently, see shared_modules/aws_discovery.py
+    return discover_aws_resources('backup', discover)
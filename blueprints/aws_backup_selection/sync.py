@@ -1,37 +1,18 @@
-from django.contrib.admin.utils import flatten
-import boto3
-from botocore.client import ClientError
-from common.methods import set_progress
-from resourcehandlers.aws.models import AWSHandler
-from infrastructure.models import Environment
+from shared_modules.aws_discovery import discover_aws_resources
 
 
 RESOURCE_IDENTIFIER = 'selection_name'
 
 
 def discover_resources(**kwargs):
-    discovered_backup_selections = []
-    for handler in AWSHandler.objects.all():
-        set_progress(
-            'Connecting to Amazon RDS for handler: {}'.format(handler))
-        for region in handler.current_regions():
-            backup_plan_ids = []
-            backup_plans_client = boto3.client('backup',
-                                               region_name=region,
-                                               aws_access_key_id=handler.serviceaccount,
-                                               aws_secret_access_key=handler.servicepasswd
-                                               )
-            backup_plan_ids.append([backup_plan_id.get(
-                'BackupPlanId') for backup_plan_id in backup_plans_client.list_backup_plans().get('BackupPlansList')])
-            client = boto3.client('backup',
-                                  region_name=region,
-                                  aws_access_key_id=handler.serviceaccount,
-                                  aws_secret_access_key=handler.servicepasswd
-                                  )
-            try:
-                for backup_plan_id in flatten(backup_plan_ids):
-                    for backup_selection in client.list_backup_selections(BackupPlanId=backup_plan_id).get('BackupSelectionsList'):
-                        discovered_backup_selections.append({
+    def discover(client, handler, region):
+        for plans_page in client.get_paginator('list_backup_plans').paginate():
+            for backup_plan in plans_page['BackupPlansList']:
+                selections = client.get_paginator('list_backup_selections').paginate(
+                    BackupPlanId=backup_plan['BackupPlanId'])
+                for page in selections:
+                    for backup_selection in page['BackupSelectionsList']:
+                        yield {
                             "name": backup_selection.get('SelectionName'),
                             "selection_name": backup_selection.get('SelectionName'),
                             "aws_region": region,
@@ -39,9 +20,7 @@ def discover_resources(**kwargs):
                             "backup_plan_id": backup_selection.get('BackupPlanId'),
                             "iam_role_arn": backup_selection.get('IamRoleArn'),
                             "backup_selection_id": backup_selection.get('SelectionId'),
-                        })
-            except ClientError as e:
-                set_progress('AWS ClientError: {}'.format(e))
-                continue
+                        }
 
-    return discovered_backup_selections
+    # Handlers and regions are searched concurrently, see shared_modules/aws_discovery.py
+    return discover_aws_resources('backup', discover)
@@ -1,34 +1,18 @@
-from common.methods import set_progress
-from resourcehandlers.aws.models import AWSHandler
-from botocore.client import ClientError
+from shared_modules.aws_discovery import discover_aws_resources
 
 RESOURCE_IDENTIFIER = 'aws_stack_name'
 
 
 def discover_resources(**kwargs):
-    discovered_cloudformations = []
+    def discover(cloudformation, handler, region):
+        for page in cloudformation.get_paginator('list_stacks').paginate():
+            for stack in page['StackSummaries']:
+                yield {
+                    'aws_stack_name': stack['StackName'],
+                    'stack_status': stack['StackStatus'],
+                    "aws_rh_id": handler.id,
+                    "aws_region": region
+                }
 
-    for handler in AWSHandler.objects.all():
-        wrapper = handler.get_api_wrapper()
-        set_progress('Connecting to Amazon Cloudformation for \
-                      handler: {}'.format(handler))
-        for region in handler.current_regions():
-            cloudformation = wrapper.get_boto3_client(
-                'cloudformation',
-                handler.serviceaccount,
-                handler.servicepasswd,
-                region
-            )
-            try:
-                for stack in cloudformation.list_stacks()['StackSummaries']:
-                    discovered_cloudformations.append({
-                        'aws_stack_name': stack['StackName'],
-                        'stack_status': stack['StackStatus'],
-                        "aws_rh_id": handler.id,
-                        "aws_region": region
-                    })
-            except ClientError as e:
-                set_progress('AWS ClientError: {}'.format(e))
-                continue
-
-    return discovered_cloudformations
+    # Handlers and regions are searched concurrently, see shared_modules/aws_discovery.py
+    return discover_aws_resources('cloudformation', discover)
@@ -1,56 +1,27 @@
-from common.methods import set_progress
-from infrastructure.models import Environment
-
-import boto3
-
-
-def connect_to_elasticache(env):
-    """
-    Return boto connection to the elasticache in the specified environment's region.
-    """
-    rh = env.resource_handler.cast()
-    return boto3.client(
-        'elasticache',
-        region_name=env.aws_region,
-        aws_access_key_id=rh.serviceaccount,
-        aws_secret_access_key=rh.servicepasswd)
+from shared_modules.aws_discovery import discover_aws_resources, environment_region_units
 
 
 RESOURCE_IDENTIFIER = 'cluster_name'
 
 
 def discover_resources(**kwargs):
-    discovered_cache = []
-    cache = []
-
-    envs = Environment.objects.filter(
-        resource_handler__resource_technology__name="Amazon Web Services")
-
-    for env in envs:
-        if not env.aws_region:
-            continue
-        client = connect_to_elasticache(env)
-        try:
-            response = client.describe_cache_clusters()
-            if len(response.get('CacheClusters')) > 0:
-                res = response.get('CacheClusters')[0]
-                data = {
+    # One work unit per (handler, region); several environments can share one,
+    # the first of them is recorded on the discovered clusters.
+    units, env_ids = environment_region_units()
+
+    def discover(client, handler, region):
+        for page in client.get_paginator('describe_cache_clusters').paginate():
+            for res in page.get('CacheClusters', []):
+                yield {
                     'name': res.get('CacheClusterId'),
                     'cluster_name': res.get('CacheClusterId'),
                     'engine': res.get('Engine'),
-                    'aws_rh_id': env.resource_handler_id,
-                    'env_id': env.id,
+                    'aws_rh_id': handler.id,
+                    'env_id': env_ids[(handler.id, region)],
                 }
-                _ = {
-                    'cluster_name': res.get('CacheClusterId'),
-                    'engine': res.get('Engine'),
-                    'aws_rh_id': env.resource_handler_id,
-                }
-                if _ not in cache:
-                    if data not in discovered_cache:
-                        discovered_cache.append(data)
-                        cache.append(_)
-        except Exception as error:
-            set_progress(error)
-            continue
-    return discovered_cache
+
+    # Handlers and regions are searched concurrently, see shared_modules/aws_discovery.py
+    return discover_aws_resources(
+        'elasticache', discover, units=units,
+        unique_key=lambda data: (data['cluster_name'], data['engine'], data['aws_rh_id']),
+    )
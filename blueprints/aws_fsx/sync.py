@@ -1,7 +1,5 @@
-import boto3
-from common.methods import set_progress
-from resourcehandlers.aws.models import AWSHandler
 from infrastructure.models import CustomField
+from shared_modules.aws_discovery import discover_aws_resources
 
 RESOURCE_IDENTIFIER = 'file_system_id'
 
@@ -54,36 +52,18 @@ def discover_resources(**kwargs):
     # Just in case the custom fields do not exist.
     create_custom_fields_as_needed()
 
-    discovered_file_systems = []
+    def discover(fsx, handler, region):
+        for page in fsx.get_paginator('describe_file_systems').paginate():
+            for file_system in page.get('FileSystems', []):
+                yield {
+                    'name': file_system.get('FileSystemId'),
+                    'file_system_id': file_system.get('FileSystemId'),
+                    'aws_rh_id': handler.id,
+                    'aws_region': region,
+                    'subnet_ids': file_system.get('SubnetIds'),
+                    'storage_capacity': int(file_system.get('StorageCapacity')),
+                    'file_system_type': file_system.get('FileSystemType')
+                }
 
-    for handler in AWSHandler.objects.all():
-        set_progress('Connecting to Amazon FXs for handler: {}'.format(handler))
-
-        for region in handler.current_regions():
-
-            fsx = boto3.client(
-                'fsx',
-                region_name=region,
-                aws_access_key_id=handler.serviceaccount,
-                aws_secret_access_key=handler.servicepasswd,
-            )
-            try:
-                file_systems = fsx.describe_file_systems().get('FileSystems')
-                for file_system in file_systems:
-                    discovered_file_systems.append(
-                        {
-                            'name': file_system.get('FileSystemId'),
-                            'file_system_id': file_system.get('FileSystemId'),
-                            'aws_rh_id': handler.id,
-                            'aws_region': region,
-                            'subnet_ids': file_system.get('SubnetIds'),
-                            'storage_capacity': int(file_system.get('StorageCapacity')),
-                            'file_system_type': file_system.get('FileSystemType')
-                        }
-                    )
-
-            except Exception as e:
-                set_progress('AWS ClientError: {}'.format(e))
-                continue
-
-    return discovered_file_systems
+    # Handlers and regions are searched concurrently, see shared_modules/aws_discovery.py
+    return discover_aws_resources('fsx', discover)
@@ -1,33 +1,21 @@
-from botocore.client import ClientError
-from common.methods import set_progress
-from resourcehandlers.aws.models import AWSHandler
+from shared_modules.aws_discovery import discover_aws_resources
 
 
 RESOURCE_IDENTIFIER = 'db_identifier'
 
 
 def discover_resources(**kwargs):
-    discovered_mysql = []
-    for handler in AWSHandler.objects.all():
-        wrapper = handler.get_api_wrapper()
-        set_progress('Connecting to Amazon RDS for handler: {}'.format(handler))
-        for region in handler.current_regions():
-            rds = wrapper.get_boto3_client(
-                'rds',
-                handler.serviceaccount,
-                handler.servicepasswd,
-                region
-            )
-            try:
-                for db_instance in rds.describe_db_instances()['DBInstances']:
-                    if db_instance['Engine'] == 'mysql':
-                        discovered_mysql.append({
-                            'db_identifier': db_instance['DBInstanceIdentifier'],
-                            "aws_region": region,
-                            "aws_rh_id": handler.id
-                        })
-            except ClientError as e:
-                set_progress('AWS ClientError: {}'.format(e))
-                continue
+    def discover(rds, handler, region):
+        pages = rds.get_paginator('describe_db_instances').paginate(
+            Filters=[{'Name': 'engine', 'Values': ['mysql']}])
+        for page in pages:
+            for db_instance in page['DBInstances']:
+                if db_instance['Engine'] == 'mysql':
+                    yield {
+                        'db_identifier': db_instance['DBInstanceIdentifier'],
+                        "aws_region": region,
+                        "aws_rh_id": handler.id
+                    }
 
-    return discovered_mysql
+    # Handlers and regions are searched concurrently, see shared_modules/aws_discovery.py
+    return discover_aws_resources('rds', discover)
@@ -1,7 +1,6 @@
 from common.methods import set_progress
 from infrastructure.models import CustomField
-from resourcehandlers.aws.models import AWSHandler
-from botocore.client import ClientError
+from shared_modules.aws_discovery import discover_aws_resources
 from utilities.logger import ThreadLogger
 
 logger = ThreadLogger(__name__)
@@ -91,32 +90,11 @@ def discover_resources(**kwargs):
     # get or create custom fields
     get_or_create_custom_fields_as_needed()
     
-    discovered_rds_instances = []
-    
-    for handler in AWSHandler.objects.all():
-        try:
-            wrapper = handler.get_api_wrapper()
-            set_progress('Connecting to Amazon RDS Instance for handler: {}'.format(handler))
-        except Exception as e:
-            set_progress(f"Could not get wrapper: {e}")
-            continue
-
-        for region in handler.current_regions():
-            rds = wrapper.get_boto3_client(
-                'rds',
-                handler.serviceaccount,
-                handler.servicepasswd,
-                region
-            )
+    def discover(rds, handler, region):
+        for page in rds.get_paginator('describe_db_instances').paginate():
+            for instance in page['DBInstances']:
+                # convert instance to dict
+                yield boto_instance_to_dict(instance, region, handler)
 
-            try:
-                for instance in rds.describe_db_instances()['DBInstances']:
-                    
-                    # convert instance to dict and append in list
-                    discovered_rds_instances.append(boto_instance_to_dict(instance, region, handler))
-                    
-            except ClientError as e:
-                set_progress('AWS ClientError: {}'.format(e))
-                continue
-    
-    return discovered_rds_instances
\ No newline at end of file
+    # Handlers and regions are searched concurrently, see shared_modules/aws_discovery.py
+    return discover_aws_resources('rds', discover)
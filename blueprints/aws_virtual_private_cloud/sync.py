@@ -1,44 +1,38 @@
-from common.methods import set_progress
-from resourcehandlers.aws.models import AWSHandler
 from infrastructure.models import Environment
-from botocore.client import ClientError
-import boto3,json
+from resourcehandlers.aws.models import AWSHandler
+from shared_modules.aws_discovery import discover_aws_resources
+import json
 
 
 RESOURCE_IDENTIFIER = 'vpc_id'
 
 
 def discover_resources(**kwargs):
-    aws_vpcs = []
-    for handler in AWSHandler.objects.all():
-        set_progress('Connecting to AWS for handler: {}'.format(handler))
-        for env in handler.current_regions():
-            set_progress(
-                'Connecting to AWS regions for handler: {}'.format(handler))
-            conn = boto3.client('ec2',
-                                region_name=env,
-                                aws_access_key_id=handler.serviceaccount,
-                                aws_secret_access_key=handler.servicepasswd
-                                )
-            try:
-                for aws_vpc in conn.describe_vpcs()['Vpcs']:                    
-                    env_name = aws_vpc['VpcId']
-                    environment, _ = Environment.objects.get_or_create(
-                        name=env_name, resource_handler=handler)
-                    subnets=[]
-                    for subnet in conn.describe_subnets(Filters=[{'Name':'vpc-id','Values':[env_name]}])['Subnets']:
-                        subnets.append(subnet['SubnetId'])
-                    aws_vpcs.append({
-                        "name": env_name,
-                        "vpc_id": env_name,
-                        "aws_subnet_id": json.dumps(subnets),
-                        "aws_region": env,
-                        "aws_rh_id": handler.id,
-                        "env_id": environment.id,
-                        "env_url": '/environments/%i' % environment.id
-                    })
-            except ClientError as e:
-                set_progress('AWS ClientError: {}'.format(e))
-                continue
+    def discover(conn, handler, region):
+        # The subnets of every VPC in the region, in one paginated call
+        subnets = {}
+        for page in conn.get_paginator('describe_subnets').paginate():
+            for subnet in page['Subnets']:
+                subnets.setdefault(subnet['VpcId'], []).append(subnet['SubnetId'])
+        for page in conn.get_paginator('describe_vpcs').paginate():
+            for aws_vpc in page['Vpcs']:
+                yield {
+                    "name": aws_vpc['VpcId'],
+                    "vpc_id": aws_vpc['VpcId'],
+                    "aws_subnet_id": json.dumps(subnets.get(aws_vpc['VpcId'], [])),
+                    "aws_region": region,
+                    "aws_rh_id": handler.id,
+                }
+
+    # Handlers and regions are searched concurrently, see shared_modules/aws_discovery.py
+    aws_vpcs = discover_aws_resources('ec2', discover)
+
+    # Environments are created from this thread, once the AWS calls are done
+    handlers = {handler.id: handler for handler in AWSHandler.objects.all()}
+    for aws_vpc in aws_vpcs:
+        environment, _ = Environment.objects.get_or_create(
+            name=aws_vpc['vpc_id'], resource_handler=handlers[aws_vpc['aws_rh_id']])
+        aws_vpc["env_id"] = environment.id
+        aws_vpc["env_url"] = '/environments/%i' % environment.id
 
     return aws_vpcs
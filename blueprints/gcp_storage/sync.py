@@ -1,15 +1,19 @@
 from __future__ import unicode_literals
 
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional, Tuple, Union
 
 from accounts.models import Group
 from common.methods import set_progress
+from django.db import transaction
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import Resource as GCPResource
 from googleapiclient.discovery import build
 from googleapiclient.http import HttpError
 from infrastructure.models import CustomField
+from orders.models import CustomFieldValue
 from resourcehandlers.gcp.models import GCPHandler
 from resources.models import Resource, ResourceType
 from servicecatalog.models import ServiceBlueprint
@@ -20,6 +24,13 @@ logger = ThreadLogger(__name__)
 RESOURCE_IDENTIFIER = "bucket_name"
 api_dict = Dict[str, Union[str, List, Dict]]
 
+# Custom fields set on every discovered bucket Resource
+BUCKET_FIELDS = ("gcp_rh_id", "gcp_project_id", "bucket_name")
+# Projects listed at once for a handler
+MAX_PROJECT_WORKERS = 8
+# Rows written per bulk query, each batch in its own transaction
+BULK_BATCH_SIZE = 500
+
 
 # Helper functions for the main function below
 def create_custom_field_objects_if_missing():
@@ -83,29 +94,48 @@ def create_storage_api_wrapper(handler: GCPHandler) -> Optional[GCPResource]:
         set_progress(f"Handler {handler} is missing gcp api credentials.")
         return None
 
-    credentials_dict = json.loads(handler.gcp_api_credentials)
-    credentials = Credentials(**credentials_dict)
-
     set_progress(f"Connecting to GCP for handler: {handler}")
-    storage_wrapper: GCPResource = build(
-        "storage", "v1", credentials=credentials, cache_discovery=False
-    )
+    storage_wrapper = _build_storage_wrapper(handler)
     set_progress("Connection established")
 
     return storage_wrapper
 
 
+def _build_storage_wrapper(handler: GCPHandler) -> GCPResource:
+    credentials = Credentials(**json.loads(handler.gcp_api_credentials))
+    return build("storage", "v1", credentials=credentials, cache_discovery=False)
+
+
 def get_buckets_in_handler(handler: GCPHandler, wrapper: GCPResource) -> List[api_dict]:
     """
     Gets all buckets from imported projects on the Resource Handler.
+
+    Projects are listed concurrently. The underlying HTTP client is not thread
+    safe, so each worker thread builds its own API wrapper; ``wrapper`` is
+    used by the calling thread when there is a single project.
     """
-    imported_projects = handler.gcp_projects.filter(imported=True)
+    project_ids = list(
+        handler.gcp_projects.filter(imported=True).values_list("gcp_id", flat=True)
+    )
+    if len(project_ids) <= 1:
+        return [
+            bucket
+            for project_id in project_ids
+            for bucket in get_buckets_in_project(wrapper, project_id)
+        ]
 
-    buckets_in_handler = []
+    local = threading.local()
 
-    for project in imported_projects:
-        buckets_in_project = get_buckets_in_project(wrapper, project.gcp_id)
-        buckets_in_handler.extend(buckets_in_project)
+    def list_project(project_id):
+        if not hasattr(local, "wrapper"):
+            local.wrapper = _build_storage_wrapper(handler)
+        return get_buckets_in_project(local.wrapper, project_id)
+
+    buckets_in_handler = []
+    with ThreadPoolExecutor(max_workers=min(MAX_PROJECT_WORKERS, len(project_ids))) as executor:
+        # map() keeps the project order, so the result is deterministic
+        for buckets_in_project in executor.map(list_project, project_ids):
+            buckets_in_handler.extend(buckets_in_project)
 
     return buckets_in_handler
 
@@ -157,14 +187,128 @@ def get_buckets_in_project(wrapper: GCPResource, project_id: str) -> List[api_di
     return buckets
 
 
+def _batches(items: List, size: int = BULK_BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def sync_bucket_resources(
+    buckets: Dict[str, Dict], blueprint, group, resource_type
+) -> Tuple[int, int]:
+    """
+    Bring the blueprint's Resources in line with ``buckets`` (bucket name ->
+    {"gcp_rh_id", "gcp_project_id", "bucket_name"}) using bulk queries:
+    existing Resources are loaded once and diffed against the listing, then
+    missing Resources are created, inactive ones are reactivated and
+    attributes that changed are relinked to the right CustomFieldValues.
+
+    Returns the number of Resources created and updated.
+    """
+    existing = {
+        resource.name: resource
+        for resource in Resource.objects.filter(blueprint=blueprint, name__in=list(buckets))
+    }
+
+    to_create = [
+        Resource(
+            name=name,
+            blueprint=blueprint,
+            group=group,
+            resource_type=resource_type,
+            lifecycle="ACTIVE",
+        )
+        for name in buckets
+        if name not in existing
+    ]
+    to_update = [resource for resource in existing.values() if resource.lifecycle != "ACTIVE"]
+    for resource in to_update:
+        resource.lifecycle = "ACTIVE"
+
+    for batch in _batches(to_create):
+        with transaction.atomic():
+            Resource.objects.bulk_create(batch)
+    for batch in _batches(to_update):
+        with transaction.atomic():
+            Resource.objects.bulk_update(batch, ["lifecycle"])
+
+    # bulk_create does not return primary keys on every database, so look the
+    # new Resources up again.
+    if to_create:
+        existing.update(
+            (resource.name, resource)
+            for resource in Resource.objects.filter(
+                blueprint=blueprint, name__in=[resource.name for resource in to_create]
+            )
+        )
+
+    fields = {field.name: field for field in CustomField.objects.filter(name__in=BUCKET_FIELDS)}
+    field_names = {field.id: name for name, field in fields.items()}
+
+    def load_values():
+        return {
+            (cfv.field_id, str(cfv.value)): cfv.id
+            for cfv in CustomFieldValue.objects.filter(field__in=fields.values())
+        }
+
+    values = load_values()
+    missing_values = {
+        (fields[name].id, str(bucket[name]))
+        for bucket in buckets.values()
+        for name in BUCKET_FIELDS
+    } - set(values)
+    if missing_values:
+        new_values = [
+            CustomFieldValue(field=fields[field_names[field_id]], value=value)
+            for field_id, value in sorted(missing_values)
+        ]
+        for batch in _batches(new_values):
+            with transaction.atomic():
+                CustomFieldValue.objects.bulk_create(batch)
+        values = load_values()
+
+    through = Resource.attributes.through
+    resource_ids = {existing[name].id: name for name in buckets}
+    links = {}
+    for link_id, resource_id, field_id, cfv_id in through.objects.filter(
+        resource_id__in=list(resource_ids), customfieldvalue__field__in=fields.values()
+    ).values_list("id", "resource_id", "customfieldvalue__field_id", "customfieldvalue_id"):
+        links.setdefault((resource_id, field_id), []).append((link_id, cfv_id))
+
+    stale_links = []
+    new_links = []
+    changed_resources = set()
+    for resource_id, name in resource_ids.items():
+        bucket = buckets[name]
+        for field_name in BUCKET_FIELDS:
+            field_id = fields[field_name].id
+            wanted = values[(field_id, str(bucket[field_name]))]
+            current = links.get((resource_id, field_id), [])
+            if [cfv_id for _, cfv_id in current] == [wanted]:
+                continue
+            changed_resources.add(resource_id)
+            stale_links.extend(link_id for link_id, _ in current)
+            new_links.append(through(resource_id=resource_id, customfieldvalue_id=wanted))
+
+    for batch in _batches(stale_links):
+        with transaction.atomic():
+            through.objects.filter(id__in=batch).delete()
+    for batch in _batches(new_links):
+        with transaction.atomic():
+            through.objects.bulk_create(batch)
+
+    created_names = {resource.name for resource in to_create}
+    updated = {resource.id for resource in to_update} | {
+        resource_id for resource_id in changed_resources if resource_ids[resource_id] not in created_names
+    }
+    return len(to_create), len(updated)
+
+
 # The main function for this plugin
 def discover_resources(**kwargs) -> List[Dict]:
     """
     Finds all buckets in all projects in all GCP resource handlers currently imported
-    into CloudBolt
+    into CloudBolt, and creates or updates their Resources in bulk
     """
-    discovered_google_storage = []
-
     # Gather system information
     # gcp_storage_blueprint = ServiceBlueprint.objects.filter(
     #     name__iexact="GCP Storage"
@@ -185,6 +329,10 @@ def discover_resources(**kwargs) -> List[Dict]:
         set_progress(f"FAILURE: Could not sync GCP Buckets because {message}")
         return []
 
+    # Bucket names are globally unique, so the first handler to list a
+    # bucket owns it.
+    discovered_buckets = {}
+
     # Loop through all existing GCPHandlers
     for handler in GCPHandler.objects.all():
         wrapper = create_storage_api_wrapper(handler)
@@ -197,45 +345,31 @@ def discover_resources(**kwargs) -> List[Dict]:
         buckets = get_buckets_in_handler(handler, wrapper)
         set_progress(f"Found {len(buckets)} buckets in {handler}")
 
-        # Import the buckets
         for bucket in buckets:
             bucket_name = str(bucket.get("name", ""))
-            project_id = str(bucket.get("project_id", ""))
-
-            # See if we've found this bucket already
-            for storage in discovered_google_storage:
-                if storage["bucket_name"] == bucket_name:
-                    # Skip it if we have
-                    continue
-
-            # Create the Resource, or get the existing one
-            storage_bucket, created = Resource.objects.get_or_create(
-                name=bucket_name,
-                defaults={
-                    "blueprint": gcp_storage_blueprint,
-                    "group": group,
-                    "resource_type": storage_resource_type,
-                },
-            )
-
-            # Add extra information onto the Resource
-            logger.info(
-                f"Adding extra info on resource for bucket: {bucket_name} in project "
-                f"{project_id} on handler {handler}"
-            )
-            storage_bucket.gcp_rh_id = handler.id
-            storage_bucket.gcp_project_id = project_id
-            storage_bucket.bucket_name = bucket_name
-            storage_bucket.lifecycle = "ACTIVE"
-            storage_bucket.save()
-
-            # Save our changes to the return list
-            discovered_google_storage.append(
-                {
-                    "gcp_rh_id": handler.id,
-                    "bucket_name": bucket_name,
-                    "name": bucket_name,
-                }
-            )
+            # Skip it if we've found this bucket already
+            if bucket_name in discovered_buckets:
+                continue
+            discovered_buckets[bucket_name] = {
+                "gcp_rh_id": handler.id,
+                "gcp_project_id": str(bucket.get("project_id", "")),
+                "bucket_name": bucket_name,
+            }
+
+    # Create or update the Resources in bulk
+    created, updated = sync_bucket_resources(
+        discovered_buckets, gcp_storage_blueprint, group, storage_resource_type
+    )
+    set_progress(
+        f"Synced {len(discovered_buckets)} buckets: {created} Resource(s) created, "
+        f"{updated} updated."
+    )
 
-    return discovered_google_storage
+    return [
+        {
+            "gcp_rh_id": bucket["gcp_rh_id"],
+            "bucket_name": bucket_name,
+            "name": bucket_name,
+        }
+        for bucket_name, bucket in discovered_buckets.items()
+    ]
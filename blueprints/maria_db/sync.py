@@ -2,42 +2,28 @@
 Discover MariaDB records with some identifying attributes
 return a list of dictionaries from the 'discover_resoures' function
 """
-import boto3
-from botocore.client import ClientError
-from common.methods import set_progress
-from resourcehandlers.aws.models import AWSHandler
+from shared_modules.aws_discovery import discover_aws_resources
 
 RESOURCE_IDENTIFIER = 'db_identifier'
 
 
 def discover_resources(**kwargs):
-    discovered_mariadb = []
+    def discover(rds, handler, region):
+        pages = rds.get_paginator('describe_db_instances').paginate(
+            Filters=[{'Name': 'engine', 'Values': ['mariadb']}])
+        for page in pages:
+            for db in page['DBInstances']:
+                if db['Engine'] == 'mariadb':
+                    # Endpoint may not be returned if networking is not set up yet
+                    endpoint = db.get('Endpoint', {})
+                    yield {
+                        'name': 'RDS MariaDB - ' + db['DBInstanceIdentifier'],
+                        'db_address': endpoint.get('Address'),
+                        'db_port': endpoint.get('Port'),
+                        'db_identifier': db['DBInstanceIdentifier'],
+                        'aws_rh_id': handler.id,
+                        'aws_region': region
+                    }
 
-    for handler in AWSHandler.objects.all():
-        set_progress('Connecting to Amazon Maria DB for \
-                      handler: {}'.format(handler))
-        for region in handler.current_regions():
-            rds = boto3.client(
-                'rds',
-                region_name=region,
-                aws_access_key_id=handler.serviceaccount,
-                aws_secret_access_key=handler.servicepasswd
-            )
-            try:
-                for db in rds.describe_db_instances()['DBInstances']:
-                    if db['Engine'] == 'mariadb':
-                        discovered_mariadb.append(
-                            {
-                                'name': 'RDS MariaDB - ' + db['DBInstanceIdentifier'],
-                                'db_address': db['Endpoint']['Address'],
-                                'db_port': db['Endpoint']['Port'],
-                                'db_identifier': db['DBInstanceIdentifier'],
-                                'aws_rh_id': handler.id,
-                                'aws_region': region
-                            }
-                        )
-            except ClientError as e:
-                set_progress('AWS ClientError: {}'.format(e))
-                continue
-
-    return discovered_mariadb
+    # Handlers and regions are searched concurrently, see shared_modules/aws_discovery.py
+    return discover_aws_resources('rds', discover)
@@ -3,11 +3,19 @@ from jwt import encode as jwt_encode
 from requests import Session
 import os
 import json
+import shutil
+import urllib.parse
 from common.methods import set_progress
 from utilities.logger import ThreadLogger
 
 logger = ThreadLogger(__name__)
 
+# Above this many changed files the zipball is usually quicker to fetch than
+# the files one by one. GitHub's compare API lists at most 300 files.
+MAX_INCREMENTAL_FILES = 200
+# Bytes read at a time when streaming downloads to disk
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
 
 def run(job, **kwargs):
     app_id = '{{ github_app_id }}'
@@ -47,10 +55,28 @@ def run(job, **kwargs):
             set_progress("Branch has not changed, not downloading new zip.")
             return ("SUCCESS",
                     "Branch has not changed, not downloading new zip.", "")
-        s.save_repo_zip_to_file(zip_file_path)
+        # The new checkout is built next to the current one and swapped in
+        # once it is complete
+        version_path = get_version_path(repo_path, branch_sha)
+        changed_files = None
+        if local_branch_sha:
+            changed_files = s.get_changed_files(local_branch_sha, branch_sha)
+        if changed_files is not None:
+            set_progress(f"Updating {len(changed_files)} file(s) changed "
+                         f"since {local_branch_sha}.")
+            apply_changed_files(s, repo_path, version_path, changed_files,
+                                branch_sha)
+            message = f"Updated {len(changed_files)} changed file(s)."
+        else:
+            set_progress("Downloading a zip of the branch.")
+            s.save_repo_zip_to_file(zip_file_path)
+            unzip_file(zip_file_path, destination, version_path)
+            message = "Downloaded a zip of the branch."
 
-    repo_path = unzip_file(zip_file_path, destination, repo_path)
-    save_local_branch_sha(repo_path, branch_sha)
+    save_local_branch_sha(version_path, branch_sha)
+    swap_directory(version_path, repo_path)
+    set_progress(f"{message} {repo_path} is at {branch_sha}.")
+    return "SUCCESS", message, ""
 
 
 def format_private_key(private_key):
@@ -79,11 +105,14 @@ class GitHubAppSession(Session):
     """
 
     def __init__(self, app_id, private_key, installation_id=None, username=None,
-                 org=None, repo=None, branch="main"):
+                 org=None, repo=None, branch="main",
+                 base_url='https://api.github.com'):
         super(GitHubAppSession, self).__init__()
         self.headers.update({'User-Agent': 'CloudBolt GitHub Application'})
         self.headers.update({'Accept': 'application/vnd.github+json'})
-        self.base_url = 'https://api.github.com'
+        # Can be pointed at a GitHub Enterprise server, or a local stand-in
+        # serving recorded responses for testing
+        self.base_url = base_url
         self.app_id = app_id
         self.pk = private_key
         self.jwt = None
@@ -181,11 +210,57 @@ class GitHubAppSession(Session):
         """
         if not file_path.endswith('.zip'):
             raise Exception("file_path must be a zip file")
-        dir_path = "/".join(file_path.split('/')[0:-1])
-        mkdir_p(dir_path)
-        resp = self.get_repo_zip()
-        with open(file_path, 'wb') as f:
-            f.write(resp)
+        # Streamed straight to disk rather than held in memory
+        url = f"{self.base_url}/repos/{self.repo}/zipball/{self.branch}"
+        with self.get(url, stream=True) as resp:
+            resp.raise_for_status()
+            write_stream_to_file(resp, file_path)
+        return file_path
+
+    def get_changed_files(self, base_sha, head_sha):
+        """
+        Get the files changed between two commits with the compare API.
+        Returns None when the changes can't be applied file by file: the base
+        commit is gone or not an ancestor of head (e.g. after a force push),
+        or so many files changed that the zip is the better download.
+        :param base_sha: The sha of the local checkout
+        :param head_sha: The sha to update to
+        :return: The compare API's file entries, or None
+        """
+        url = (f"{self.base_url}/repos/{self.repo}/compare/"
+               f"{base_sha}...{head_sha}")
+        resp = self.get(url)
+        if resp.status_code != 200:
+            logger.info(f"Could not compare {base_sha}...{head_sha}: "
+                        f"{resp.status_code}")
+            return None
+        comparison = resp.json()
+        if comparison["status"] != "ahead":
+            logger.info(f"{head_sha} is {comparison['status']} of {base_sha}, "
+                        f"can't update incrementally")
+            return None
+        files = comparison.get("files", [])
+        if len(files) >= MAX_INCREMENTAL_FILES:
+            logger.info(f"{len(files)} files changed, downloading the zip "
+                        f"instead")
+            return None
+        return files
+
+    def save_file_to_path(self, path, ref, file_path):
+        """
+        Streams the raw contents of a file in the repo to file_path.
+        :param path: The path of the file in the repo
+        :param ref: The commit sha (or branch) to get the file at
+        :param file_path: The local path to save the file to
+        :return: The path to the file.
+        """
+        url = (f"{self.base_url}/repos/{self.repo}/contents/"
+               f"{urllib.parse.quote(path)}")
+        headers = {'Accept': 'application/vnd.github.raw'}
+        with self.get(url, params={'ref': ref}, headers=headers,
+                      stream=True) as resp:
+            resp.raise_for_status()
+            write_stream_to_file(resp, file_path)
         return file_path
 
     def get_branch(self):
@@ -216,16 +291,136 @@ def mkdir_p(path):
             raise
 
 
-def unzip_file(file_path, destination, repo_path):
+def write_stream_to_file(resp, file_path):
+    """
+    Writes a streamed response to file_path. The content goes to a temporary
+    file that then replaces file_path, so a file that is hard linked from
+    another checkout is replaced rather than overwritten.
+    :param resp: A requests Response opened with stream=True
+    :param file_path: The path to write to
+    """
+    mkdir_p(os.path.dirname(file_path))
+    tmp_path = f"{file_path}.download"
+    with open(tmp_path, 'wb') as f:
+        for chunk in resp.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            f.write(chunk)
+    os.replace(tmp_path, file_path)
+
+
+def get_version_path(repo_path, branch_sha):
+    """
+    The directory a checkout of branch_sha is built in. repo_path is a
+    symlink to the current one of these.
+    :param repo_path: The path to the repo directory
+    :param branch_sha: The sha of the checkout
+    """
+    parent, name = os.path.split(repo_path)
+    return f"{parent}/.{name}-{branch_sha[:12]}"
+
+
+def get_checkout_path(root, path):
     """
-    Unzips a file to the specified destination. will delete the zip file after
-    unzipping. Will also delete the destination directory recursively if it
-    already exists.
+    The local path of the repo file path in the checkout at root. Refuses
+    paths that would end up outside of root.
+    """
+    file_path = os.path.normpath(os.path.join(root, path))
+    if not file_path.startswith(f"{root}/"):
+        raise Exception(f"Refusing to write outside of {root}: {path}")
+    return file_path
+
+
+def remove_checkout_file(root, path):
+    """
+    Removes a file from the checkout at root, along with any directories it
+    leaves empty, as git doesn't keep empty directories.
+    """
+    file_path = get_checkout_path(root, path)
+    if os.path.lexists(file_path):
+        os.remove(file_path)
+    directory = os.path.dirname(file_path)
+    while directory != root and not os.listdir(directory):
+        os.rmdir(directory)
+        directory = os.path.dirname(directory)
+
+
+def apply_changed_files(session, repo_path, version_path, changed_files,
+                        branch_sha):
+    """
+    Builds the checkout of branch_sha in version_path from the current
+    checkout at repo_path and the files changed since, as returned by
+    GitHubAppSession.get_changed_files. Unchanged files are hard links to the
+    current checkout, so only the changed files are downloaded and written.
+    :param session: The GitHubAppSession to download the files with
+    :param repo_path: The path to the current checkout
+    :param version_path: The path to build the new checkout in
+    :param changed_files: The compare API's file entries
+    :param branch_sha: The sha to download changed files at
+    :return: The path to the new checkout.
+    """
+    if os.path.exists(version_path):
+        shutil.rmtree(version_path)
+    shutil.copytree(os.path.realpath(repo_path), version_path, symlinks=True,
+                    copy_function=os.link)
+    for changed_file in changed_files:
+        status = changed_file["status"]
+        path = changed_file["filename"]
+        if status == "removed":
+            remove_checkout_file(version_path, path)
+            continue
+        if status == "renamed":
+            previous_path = changed_file["previous_filename"]
+            if not changed_file.get("changes"):
+                # Moved without changes, no need to download it again
+                new_path = get_checkout_path(version_path, path)
+                mkdir_p(os.path.dirname(new_path))
+                os.rename(get_checkout_path(version_path, previous_path),
+                          new_path)
+                remove_checkout_file(version_path, previous_path)
+                continue
+            remove_checkout_file(version_path, previous_path)
+        logger.debug(f"Downloading {status} file {path}")
+        session.save_file_to_path(path, branch_sha,
+                                  get_checkout_path(version_path, path))
+    return version_path
+
+
+def swap_directory(version_path, repo_path):
+    """
+    Makes repo_path point at the checkout in version_path and deletes the
+    previous checkout. repo_path is a symlink that is replaced in one
+    rename, so anything reading the repo sees either the old or the new
+    checkout, never a partial one.
+    :param version_path: The path to the new checkout
+    :param repo_path: The path to the repo directory
+    """
+    link_path = f"{repo_path}.link"
+    if os.path.lexists(link_path):
+        os.remove(link_path)
+    os.symlink(os.path.basename(version_path), link_path)
+    previous_path = None
+    if os.path.islink(repo_path):
+        previous_path = os.path.realpath(repo_path)
+    elif os.path.isdir(repo_path):
+        # A checkout from before repo_path was a symlink, move it aside
+        previous_path = f"{repo_path}.previous"
+        if os.path.exists(previous_path):
+            shutil.rmtree(previous_path)
+        os.rename(repo_path, previous_path)
+    os.replace(link_path, repo_path)
+    if (previous_path and os.path.exists(previous_path) and
+            previous_path != os.path.realpath(version_path)):
+        shutil.rmtree(previous_path)
+
+
+def unzip_file(file_path, destination, version_path):
+    """
+    Unzips a file to version_path. Will delete the zip file after unzipping.
+    Will also delete version_path recursively if it already exists.
     :param file_path: The path to the zip file. Ex: /tmp/my_repo.zip
-    :param destination: The path to move the unzipped repo to. Must be a
+    :param destination: The directory the repo is synced to. Must be a
         subdirectory of /var/opt/cloudbolt/proserv/.
         Ex: /var/opt/cloudbolt/proserv/my_repo
-    :param repo: The repo to download. Should be in the format: {owner}/{repo}
+    :param version_path: The path to unzip the repo to, in destination
     :return: The path to the unzipped repo.
     """
     import zipfile
@@ -238,31 +433,25 @@ def unzip_file(file_path, destination, repo_path):
         return "FAILURE", "", ("destination must be a subdirectory of "
                                "/var/opt/cloudbolt/proserv/")
 
-    # Unzip the file
-    unzip_path = "/var/tmp"
+    # If a directory exists at the path already delete it recursively
+    unzip_path = f"{version_path}.unzip"
+    for path in (version_path, unzip_path):
+        if os.path.exists(path):
+            shutil.rmtree(path)
+    # Ensure that the parent directory exists
+    mkdir_p(destination)
+    # Unzip the file next to version_path, so it can be renamed into place
     with zipfile.ZipFile(file_path, 'r') as zip_ref:
         relative_path, = zipfile.Path(zip_ref).iterdir()
-        root_dir = f'{unzip_path}/{relative_path.name}'
         zip_ref.extractall(unzip_path)
     # Delete the zip file
     os.remove(file_path)
-    # Set the repo name and final path repo of test/test will end up being
-    # test-test
-
-    # If a directory exists at the path already delete it recursively
-    if os.path.exists(repo_path):
-        import shutil
-        import getpass
-        logger.debug("Effective user is [%s]" % (getpass.getuser()))
-        shutil.rmtree(repo_path)
-    # Ensure that the parent directory exists
-    mkdir_p(destination)
     # Move and rename the root_dir - GitHub zips have a root dir that is the
-    # repo name and sha, want to rename this to just the repo name and move it
-    # to the correct destination.
-    os.rename(root_dir, repo_path)
+    # repo name and sha, want to rename this to the version path.
+    os.rename(f'{unzip_path}/{relative_path.name}', version_path)
+    os.rmdir(unzip_path)
 
-    return repo_path
+    return version_path
 
 
 def get_local_branch_sha(repo_path):
@@ -289,8 +478,12 @@ def save_local_branch_sha(repo_path, branch_sha):
     """
 
     branch_sha_file = f"{repo_path}/branch_sha.json"
-    with open(branch_sha_file, 'w') as f:
+    # Replaced rather than overwritten, it may be hard linked from the
+    # previous checkout
+    tmp_file = f"{branch_sha_file}.tmp"
+    with open(tmp_file, 'w') as f:
         json.dump({'sha': branch_sha}, f)
+    os.replace(tmp_file, branch_sha_file)
     return branch_sha_file
 
 
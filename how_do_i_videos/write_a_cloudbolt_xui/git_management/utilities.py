@@ -1,7 +1,9 @@
 import base64
+import hashlib
 import json
 import os
 import urllib
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 from urllib.parse import urlencode
@@ -18,6 +20,14 @@ from utilities.logger import ThreadLogger
 
 logger = ThreadLogger(__name__)
 
+# Blob uploads running at once when exporting to GitHub
+MAX_BLOB_UPLOADS = 8
+# Largest request body (base64 file content) sent in one GitLab commit; bigger
+# exports are split across several commits
+MAX_GITLAB_COMMIT_BYTES = 10 * 1024 * 1024
+# Items per page when listing a GitLab repository tree
+GITLAB_PAGE_SIZE = 100
+
 
 def get_all_blueprints():
     bps = ServiceBlueprint.objects.filter(status="ACTIVE")
@@ -453,6 +463,62 @@ def format_xuis_for_template(xuis):
     return formatted_xuis
 
 
+def git_blob_sha(content):
+    """
+    Return the git object id of a blob with ``content`` (bytes), the same id
+    GitHub and GitLab report for files in a tree
+    """
+    header = f"blob {len(content)}\0".encode()
+    return hashlib.sha1(header + content).hexdigest()
+
+
+def get_git_content_directory(tmp_dir, root_content_directory):
+    """
+    Return the path in the repo that the exported content in tmp_dir is
+    committed to. ex. "cloudbolt_content/blueprints/my_blueprint"
+    """
+    content_dir = slugify(tmp_dir.split("/")[-1]).replace('-', '_')
+    return f'{root_content_directory}/{content_dir}'
+
+
+def get_local_files(tmp_dir, content_dir):
+    """
+    Map the repo path of every file exported to tmp_dir to its local path and
+    git blob sha
+    :return: {git_file_path: (file_path, blob_sha)}
+    """
+    files = {}
+    for root, dirs, file_names in os.walk(tmp_dir):
+        for file in file_names:
+            file_path = os.path.join(root, file)
+            git_file_path = file_path.replace(tmp_dir, content_dir)
+            with open(file_path, 'rb') as f:
+                files[git_file_path] = (file_path, git_blob_sha(f.read()))
+    return files
+
+
+def batch_actions(actions, max_bytes=MAX_GITLAB_COMMIT_BYTES):
+    """
+    Split GitLab commit actions into batches whose file content adds up to at
+    most max_bytes, so each commit request stays under GitLab's request size
+    limit. A single file larger than max_bytes gets a batch of its own.
+    """
+    batches = []
+    batch = []
+    batch_bytes = 0
+    for action in actions:
+        action_bytes = len(action.get("content", "")) + len(action["file_path"])
+        if batch and batch_bytes + action_bytes > max_bytes:
+            batches.append(batch)
+            batch = []
+            batch_bytes = 0
+        batch.append(action)
+        batch_bytes += action_bytes
+    if batch:
+        batches.append(batch)
+    return batches
+
+
 class GitHubWrapper(object):
     """
     Wrapper for the GitHub API
@@ -641,7 +707,7 @@ class GitHubWrapper(object):
         :return: The sha of the blob
         """
         url = f"/repos/{self.repo}/git/blobs"
-        file_content_encoded = base64.b64encode(content)
+        file_content_encoded = base64.b64encode(content).decode("ascii")
         data = {
             "content": file_content_encoded,
             "encoding": "base64",
@@ -659,7 +725,8 @@ class GitHubWrapper(object):
         # With the Contents API, we have to get the parent directory then loop
         # through each tree in the directory to get the tree we are looking for
         # This is because the trees API does not support getting a tree by path
-        contents = self.get(f"/repos/{self.repo}/contents/{parent_path}")
+        contents = self.get(
+            f"/repos/{self.repo}/contents/{parent_path}?ref={self.branch}")
         for content in contents:
             if content["type"] == "dir" and content["name"] == dir_name:
                 return content["sha"]
@@ -763,68 +830,90 @@ class GitHubWrapper(object):
         return ref_url
 
     def create_commit_from_directory(self, tmp_dir, git_comment, content_type):
+        """
+        Commit the exported content in tmp_dir to the branch, uploading only
+        the files that changed. When nothing changed no commit is made and the
+        url of the current head commit is returned.
+        """
         root_content_directory = get_root_content_directory(self.root_directory,
                                                             content_type)
-        branch_sha = self.get_branch_sha()
+        branch = self.get_branch()
+        branch_sha = branch["commit"]["sha"]
+        base_tree_sha = branch["commit"]["commit"]["tree"]["sha"]
         tree_sha = self.create_tree_from_directory(tmp_dir,
                                                    root_content_directory,
-                                                   branch_sha)
-        commit_sha = self.create_commit(git_comment, tree_sha, branch_sha)
-        ref_url = self.update_branch_ref(commit_sha)
-        html_url = self.get_commit(commit_sha)["html_url"]
-        return html_url
+                                                   base_tree_sha)
+        if not tree_sha:
+            logger.info(f"No changes to commit from {tmp_dir}")
+            return branch["commit"]["html_url"]
+        commit = self.post(f"/repos/{self.repo}/git/commits", {
+            "message": git_comment,
+            "tree": tree_sha,
+            "parents": [branch_sha],
+        })
+        self.update_branch_ref(commit["sha"])
+        return commit["html_url"]
 
     def create_tree_from_directory(self, tmp_dir, root_content_directory,
-                                   branch_sha):
+                                   base_tree_sha):
+        """
+        Create a tree from base_tree_sha with the content directory replaced by
+        the files in tmp_dir. Blobs are only uploaded for files whose git sha
+        differs from the one already in the repo.
+        :return: the sha of the new tree, or None if nothing changed
+        """
         logger.info(f"Creating tree from directory {tmp_dir}")
-        tree = []
-        content_dir = slugify(tmp_dir.split("/")[-1]).replace('-', '_')
-        content_dir = f'{root_content_directory}/{content_dir}'
-        for root, dirs, files in os.walk(tmp_dir):
-            for file in files:
-                file_path = os.path.join(root, file)
-                file_content = open(file_path, 'rb').read()
-                git_file_path = file_path.replace(tmp_dir, content_dir)
-                blob_sha = self.create_blob(file_content)
-                tree.append({
-                    "path": git_file_path,
-                    "mode": "100644",
-                    "type": "blob",
-                    "sha": blob_sha
-                })
-        tree = self.update_tree_to_remove_deleted_files(tree, content_dir)
-        return self.create_tree(branch_sha, tree)
-
-    def update_tree_to_remove_deleted_files(self, tree, content_dir):
-        """
-        Remove files from the tree that have been deleted from the CloudBolt content
-        We only want to impact files that are in the content directory. We don't
-        want to remove files that are in any directories outside the content dir.
-        :param tree: the tree to update
+        content_dir = get_git_content_directory(tmp_dir, root_content_directory)
+        local_files = get_local_files(tmp_dir, content_dir)
+        current_blobs = self.get_blob_shas_in_directory(content_dir)
+
+        changed = [path for path, (_, sha) in local_files.items()
+                   if current_blobs.get(path) != sha]
+        deleted = set(current_blobs) - set(local_files)
+        if not changed and not deleted:
+            return None
+        logger.info(f"Uploading {len(changed)} changed file(s), removing "
+                    f"{len(deleted)}, {len(local_files) - len(changed)} "
+                    f"unchanged")
+
+        def upload(path):
+            with open(local_files[path][0], 'rb') as f:
+                return self.create_blob(f.read())
+
+        with ThreadPoolExecutor(max_workers=MAX_BLOB_UPLOADS) as executor:
+            blob_shas = list(executor.map(upload, changed))
+        tree = [
+            {"path": path, "mode": "100644", "type": "blob", "sha": sha}
+            for path, sha in zip(changed, blob_shas)
+        ]
+        for path in sorted(deleted):
+            logger.info(f"Removing file {path} from tree - it does not exist "
+                        f"in the new tree")
+            tree.append(
+                {"path": path, "mode": "100644", "type": "blob", "sha": None})
+        return self.create_tree(base_tree_sha, tree)
+
+    def get_blob_shas_in_directory(self, content_dir):
+        """
+        Get the sha of every file under content_dir on the branch, with one
+        recursive tree request. We only want to impact files that are in the
+        content directory, not in any directories outside of it.
         :param content_dir: the root directory for the content
+        :return: {git_file_path: blob_sha}
         """
         current_tree_sha = self.get_tree_sha_from_path(content_dir)
         if not current_tree_sha:
-            # If the dir (tree) doesn't already exist there wouldn't be any files
-            # to remove. Just return the original tree that we built.
-            return tree
+            # If the dir (tree) doesn't already exist there aren't any files
+            return {}
         query_params = [{"recursive": "true"}]
         current_tree = self.get_tree(current_tree_sha, query_params)
-        new_tree_files = [f["path"] for f in tree]
-        for item in current_tree["tree"]:
-            if item["type"] == "blob":
-                tree_path = f'{content_dir}/{item["path"]}'
-                if tree_path not in new_tree_files:
-                    logger.info(
-                        f"Removing file {tree_path} from tree - it does not"
-                        f" exist in the new tree")
-                    tree.append({
-                        "path": tree_path,
-                        "mode": item["mode"],
-                        "type": item["type"],
-                        "sha": None,
-                    })
-        return tree
+        if current_tree.get("truncated"):
+            raise Exception(f"The tree for {content_dir} is too large to be "
+                            f"listed by the GitHub API")
+        return {
+            f'{content_dir}/{item["path"]}': item["sha"]
+            for item in current_tree["tree"] if item["type"] == "blob"
+        }
 
 
 class GitLabWrapper(object):
@@ -871,14 +960,19 @@ class GitLabWrapper(object):
 
     def _request(self, url, method="GET", data=None):
         """
-        Return the json of a Request to the GitHub API
+        Return the json of a Request to the GitLab API
+        """
+        return self._send(f"{self.base_url}{url}", method, data).json()
+
+    def _send(self, request_url, method="GET", data=None):
+        """
+        Send a Request to the GitLab API and return the response
         """
         headers = {
             'PRIVATE-TOKEN': self.token,
             'Accept': 'application/json',
             'Content-Type': 'application/json'
         }
-        request_url = f"{self.base_url}{url}"
         r = requests.request(
             method,
             request_url,
@@ -897,7 +991,21 @@ class GitLabWrapper(object):
             logger.error(f"Error: {e}")
             logger.error(f"Error Message: {err_message}")
             raise e
-        return r.json()
+        return r
+
+    def get_all_pages(self, url):
+        """
+        Return the combined json lists of every page of a paginated GET,
+        following the Link headers GitLab returns
+        """
+        separator = "&" if "?" in url else "?"
+        request_url = f"{self.base_url}{url}{separator}per_page={GITLAB_PAGE_SIZE}"
+        items = []
+        while request_url:
+            r = self._send(request_url)
+            items.extend(r.json())
+            request_url = r.links.get("next", {}).get("url")
+        return items
 
     def get_project(self):
         """
@@ -1005,12 +1113,27 @@ class GitLabWrapper(object):
         return ref_url
 
     def create_commit_from_directory(self, tmp_dir, git_comment, content_type):
+        """
+        Commit the exported content in tmp_dir to the branch, only touching
+        files that changed. Large changes are split across several commits.
+        When nothing changed no commit is made and the url of the current head
+        commit is returned.
+        """
         root_content_directory = get_root_content_directory(self.root_directory,
                                                             content_type)
 
         actions = self.generate_actions_from_directory(tmp_dir,
                                                        root_content_directory)
-        commit = self.create_commit(git_comment, actions)
+        if not actions:
+            logger.info(f"No changes to commit from {tmp_dir}")
+            return self.get_branch()["commit"]["web_url"]
+        batches = batch_actions(actions)
+        commit = None
+        for number, batch in enumerate(batches, 1):
+            comment = git_comment
+            if len(batches) > 1:
+                comment = f"{git_comment} (part {number}/{len(batches)})"
+            commit = self.create_commit(comment, batch)
 
         return commit["web_url"]
 
@@ -1032,37 +1155,42 @@ class GitLabWrapper(object):
 
     def generate_actions_from_directory(self, tmp_dir, root_content_directory):
         """
-        Generate a list of actions to perform in the commit
+        Generate a list of actions to perform in the commit: create or update
+        for files whose git blob id differs from the one in the repo (or that
+        are new), and delete for files no longer in the exported content.
         :param tmp_dir: The directory to generate the actions from
         :param root_content_directory: The root directory for the content
         """
         actions = []
-        content_dir = slugify(tmp_dir.split("/")[-1]).replace('-', '_')
-        content_dir = f'{root_content_directory}/{content_dir}'
-        for root, dirs, files in os.walk(tmp_dir):
-            for file in files:
-                file_path = os.path.join(root, file)
-                git_file_path = file_path.replace(tmp_dir, content_dir)
-                try:
-                    # Check if the file exists in the repo
-                    self.get_file(git_file_path)
-                    action_mode = "update"
-                except HTTPError as e:
-                    logger.debug(f"File {git_file_path} does not exist in "
-                                 f"repo. Creating.")
-                    action_mode = "create"
-                with open(file_path, "rb") as f:
-                    content_bytes = f.read()
-                    base64_bytes = base64.b64encode(content_bytes)
-                    base64_content = base64_bytes.decode("ascii")
-                    action = {
-                        "action": action_mode,
-                        "file_path": git_file_path,
-                        "content": base64_content,
-                        "encoding": "base64",
-                    }
-                    actions.append(action)
-        actions = self.set_deleted_files(actions, content_dir)
+        content_dir = get_git_content_directory(tmp_dir, root_content_directory)
+        local_files = get_local_files(tmp_dir, content_dir)
+        current_blobs = {
+            item["path"]: item["id"]
+            for item in self.get_repository_tree(content_dir)
+            if item["type"] == "blob"
+        }
+        for git_file_path, (file_path, blob_sha) in local_files.items():
+            current_sha = current_blobs.get(git_file_path)
+            if current_sha == blob_sha:
+                continue
+            with open(file_path, "rb") as f:
+                base64_content = base64.b64encode(f.read()).decode("ascii")
+            actions.append({
+                "action": "create" if current_sha is None else "update",
+                "file_path": git_file_path,
+                "content": base64_content,
+                "encoding": "base64",
+            })
+        for git_file_path in sorted(set(current_blobs) - set(local_files)):
+            logger.info(
+                f"Removing file {git_file_path} from tree - it does not"
+                f" exist in the new tree")
+            actions.append({
+                "action": "delete",
+                "file_path": git_file_path,
+            })
+        logger.info(f"{len(actions)} file(s) changed out of "
+                    f"{len(local_files)} exported")
         return actions
 
     def get_file(self, file_path):
@@ -1076,38 +1204,19 @@ class GitLabWrapper(object):
               f"{enc_file_path}?ref={self.branch}"
         return self.get(url)
 
-    def set_deleted_files(self, actions, content_dir):
-        """
-        Set files that have been deleted from the CloudBolt content directory to
-        delete. We only want to impact files that are in the content directory.
-        We don't want to remove files that are in any directories outside the
-        content dir.
-        :param actions: the actions list to update
-        :param content_dir: the base path to the content directory
-        """
-        new_action_paths = [f["file_path"] for f in actions]
-        tree = self.get_repository_tree(content_dir)
-        for item in tree:
-            if item["type"] != "blob":
-                continue
-            action_path = item["path"]
-            if action_path not in new_action_paths:
-                logger.info(
-                    f"Removing file {action_path} from tree - it does not"
-                    f" exist in the new tree")
-                actions.append({
-                    "action": "delete",
-                    "file_path": action_path,
-                })
-        return actions
-
     def get_repository_tree(self, content_dir):
         """
-        Get the tree for the repo recursively
+        Get the tree for the repo recursively, every page of it
         :param content_dir: the directory to get the tree for
-        :return:
+        :return: the tree items, each with the path, type and blob id
         """
+        path = urllib.parse.quote(content_dir, safe='')
         url = f"/projects/{self.project_path}/repository/tree" \
-              f"?ref={self.branch}&path={content_dir}&recursive=true"
-        return self.get(url)
-
+              f"?ref={self.branch}&path={path}&recursive=true"
+        try:
+            return self.get_all_pages(url)
+        except HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                # The content directory isn't in the repo yet
+                return []
+            raise
@@ -0,0 +1,134 @@
+"""
+Benchmark and smoke test for shared_modules/health_check_engine.py against a local stub
+HTTP server. Does not need CloudBolt.
+
+The stub server answers on every loopback address, so checks are spread
+over several "hosts" (127.0.0.1, 127.0.0.2, ...) to exercise the per-host
+limit. Paths:
+    /ok        200 after --latency seconds
+    /fail      500 after --latency seconds
+    /flaky     500 on the first request for a given query string, then 200
+
+The serial baseline is the previous check() loop: requests.get per attempt
+and time.sleep(retry_interval_seconds) between attempts.
+
+Usage:
+    python benchmark_health_checks.py [--checks 200] [--hosts 8] [--latency 0.2]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+# The repository root, so shared_modules can be imported
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from shared_modules.health_check_engine import HealthCheck, HealthCheckEngine  # noqa: E402
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    seen = set()
+    seen_lock = threading.Lock()
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        status = 200
+        if self.path.startswith('/fail'):
+            status = 500
+        elif self.path.startswith('/flaky'):
+            with self.seen_lock:
+                if self.path not in self.seen:
+                    self.seen.add(self.path)
+                    status = 500
+        body = b'ok' if status == 200 else b'error'
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def build_checks(port: int, count: int, hosts: int, run_id: str):
+    checks = []
+    for index in range(count):
+        host = f"127.0.0.{index % hosts + 1}"
+        path = ['ok', 'ok', 'ok', 'flaky', 'fail'][index % 5]
+        checks.append(HealthCheck(
+            key=index,
+            name=f"check-{index}",
+            url=f"http://{host}:{port}/{path}?run={run_id}&check={index}",
+            accepted_status_codes=[200],
+            timeout_seconds=5,
+            max_retries=2,
+            retry_interval_seconds=0.1,
+            retry_backoff=1,
+        ))
+    return checks
+
+
+def run_serial(checks):
+    """The previous check() loop: one request at a time, sleeping between retries."""
+    passed = []
+    for check in checks:
+        retry_attempts = 0
+        ok = False
+        while retry_attempts <= check.max_retries:
+            try:
+                status_code = requests.get(check.url, timeout=check.timeout_seconds).status_code
+                if check.accepts(status_code):
+                    ok = True
+                    break
+            except Exception:
+                pass
+            retry_attempts += 1
+            time.sleep(check.retry_interval_seconds)
+        passed.append(ok)
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark HealthCheckEngine against a stub HTTP server')
+    parser.add_argument('--checks', type=int, default=200, help='Number of health checks (default: 200)')
+    parser.add_argument('--hosts', type=int, default=8, help='Number of loopback hosts (default: 8)')
+    parser.add_argument('--latency', type=float, default=0.2, help='Stub response time in seconds (default: 0.2)')
+    parser.add_argument('--skip-serial', action='store_true', help='Only run the concurrent engine')
+    args = parser.parse_args()
+
+    StubHandler.latency = args.latency
+    server = ThreadingHTTPServer(('', 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    try:
+        engine = HealthCheckEngine(max_workers=32, max_per_host=4)
+        start = time.perf_counter()
+        outcomes = engine.run(build_checks(port, args.checks, args.hosts, 'engine'))
+        engine_time = time.perf_counter() - start
+        engine_passed = [outcome.passed for outcome in outcomes]
+        print(f"engine   {engine_time:8.2f}s  {sum(engine_passed)}/{len(outcomes)} passed, "
+              f"{sum(o.attempts for o in outcomes)} requests")
+
+        if not args.skip_serial:
+            start = time.perf_counter()
+            serial_passed = run_serial(build_checks(port, args.checks, args.hosts, 'serial'))
+            serial_time = time.perf_counter() - start
+            print(f"serial   {serial_time:8.2f}s  {sum(serial_passed)}/{len(serial_passed)} passed")
+            print(f"Speedup: {serial_time / engine_time:.1f}x")
+            if serial_passed != engine_passed:
+                print("MISMATCH between serial and engine results")
+                sys.exit(1)
+            print("Results identical.")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
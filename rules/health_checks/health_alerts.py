@@ -1,6 +1,8 @@
 """
 Uses the results of the Resource Health Checks condition to alert users
-if any resources have health check failures exceeding their threshold for failures.
+if any resources have health check failures exceeding their threshold for failures,
+health checks whose p95 latency regressed against their history, or health
+checks that keep flapping between passing and failing.
 See health_checks/README.md for more setup instructions for the rule this plugin runs in.
 
 Note: This Action assumes that you have one or more configured Alert Channels
@@ -22,6 +24,15 @@ from utilities.logger import ThreadLogger
 
 ALERT_CHANNEL_NAMES: List[str] = []
 
+# Alert when a check's recent p95 latency is this many times its baseline p95...
+LATENCY_REGRESSION_RATIO = 1.5
+# ...and at least this many milliseconds slower, to ignore noise on fast endpoints
+LATENCY_REGRESSION_MIN_MS = 100
+# Alert when a check changed between passing and failing this many times
+# within the sliding window of recent runs (see FLAP_WINDOW_SAMPLES in
+# resource_health_checks.py)
+FLAP_THRESHOLD = 4
+
 logger = ThreadLogger(__name__)
 
 
@@ -29,18 +40,26 @@ class ResourceHealthAlert:
     def __init__(self, context):
         self.health_stats = context['health_check_results']
         self.over_threshold = []
+        self.latency_regressions = []
+        self.flapping = []
 
     def __call__(self):
         """
         Iterate over all health stats for resources and check whether
-        there were over-threshold failures to alert on, save them and alert if so.
+        there were over-threshold failures, latency regressions or flapping
+        checks to alert on, save them and alert if so.
         """
 
         for result_dict in self.health_stats:
             self.__check_threshold(result_dict)
+            self.__check_history(result_dict)
 
         if self.over_threshold:
             self.__alert_over_threshold()
+        if self.latency_regressions:
+            self.__alert_latency_regressions()
+        if self.flapping:
+            self.__alert_flapping()
 
     def __check_threshold(self, result_dict):
         """
@@ -49,7 +68,7 @@ class ResourceHealthAlert:
         """
 
         time = result_dict.get('time')
-        failing_checks = result_dict.get('failing_checks', 0)
+        failing_checks = result_dict.get('failing_health_checks', 0)
         resource_name = result_dict.get('resource_name')
         resource_id = result_dict.get('resource_id')
 
@@ -58,6 +77,35 @@ class ResourceHealthAlert:
 
         return
 
+    def __check_history(self, result_dict):
+        """
+        Checks each of the resource's health checks for a p95 latency
+        regression against its baseline and for flapping, and stores them if so.
+        """
+        time = result_dict.get('time')
+        resource_name = result_dict.get('resource_name')
+        resource_id = result_dict.get('resource_id')
+
+        for check in result_dict.get('health_checks', []):
+            p95 = check.get('latency_p95_ms')
+            baseline = check.get('baseline_latency_p95_ms')
+            if p95 is not None and baseline and (
+                    p95 >= baseline * LATENCY_REGRESSION_RATIO and p95 - baseline >= LATENCY_REGRESSION_MIN_MS):
+                self.latency_regressions.append(
+                    (str(time), resource_name, resource_id, check.get('name'), round(p95), round(baseline)))
+
+            flaps = check.get('flaps', 0)
+            if flaps >= FLAP_THRESHOLD:
+                self.flapping.append((str(time), resource_name, resource_id, check.get('name'), flaps))
+
+        return
+
+    def __send(self, message):
+        set_progress(message)
+
+        for _channel_name in ALERT_CHANNEL_NAMES:
+            alert("health_check", message)
+
     def __alert_over_threshold(self):
         """
         Send alert for all resource health checks that exceed the threshold.
@@ -69,10 +117,37 @@ class ResourceHealthAlert:
             f"The following resources exceeded their health check failure threshold:"
             f"{instance_json}"
         )
-        set_progress(message)
+        self.__send(message)
 
-        for _channel_name in ALERT_CHANNEL_NAMES:
-            alert("health_check", message)
+        return None
+
+    def __alert_latency_regressions(self):
+        """
+        Send alert for all health checks whose recent p95 latency regressed.
+        """
+        keys = ["Timestamp", "Resource", "ID", "Health Check", "p95 Latency (ms)", "Baseline p95 Latency (ms)"]
+        instance_dict = [dict(zip(keys, i)) for i in self.latency_regressions]
+        instance_json = json.dumps(instance_dict, indent=4)
+        message = (
+            f"The following health checks are responding slower than usual:"
+            f"{instance_json}"
+        )
+        self.__send(message)
+
+        return None
+
+    def __alert_flapping(self):
+        """
+        Send alert for all health checks that keep changing between passing and failing.
+        """
+        keys = ["Timestamp", "Resource", "ID", "Health Check", "Status Changes"]
+        instance_dict = [dict(zip(keys, i)) for i in self.flapping]
+        instance_json = json.dumps(instance_dict, indent=4)
+        message = (
+            f"The following health checks are flapping between passing and failing:"
+            f"{instance_json}"
+        )
+        self.__send(message)
 
         return None
 
@@ -25,12 +25,11 @@ Read more instructions for setting up this rule in health_checks/README.md
 """
 import datetime
 import json
-import time
-
-import requests
 import sys
 
 from common.methods import set_progress
+from shared_modules.health_check_engine import HealthCheck, HealthCheckEngine
+from shared_modules.health_check_history import DAY, DEFAULT_HISTORY_DB, HOUR, HealthCheckHistory
 from jobs.models import Job
 from resources.models import Resource
 from utilities.logger import ThreadLogger
@@ -38,6 +37,18 @@ from utilities.logger import ThreadLogger
 
 logger = ThreadLogger(__name__)
 
+# Health check requests in flight at once, across all resources
+MAX_CONCURRENT_CHECKS = 32
+# Health check requests in flight at once to any single host
+MAX_CONCURRENT_CHECKS_PER_HOST = 4
+
+# Recent latency is the p95 over this window...
+LATENCY_WINDOW_SECONDS = HOUR
+# ...and is compared to the typical hourly p95 over this window before it
+BASELINE_WINDOW_SECONDS = 7 * DAY
+# Number of most recent runs looked at when counting pass/fail flaps
+FLAP_WINDOW_SAMPLES = 10
+
 
 def get_config_value(resource):
     health_check_config = resource.attributes.get(field__name="health_check_config").value
@@ -60,79 +71,107 @@ def get_config_value(resource):
     return config
 
 
+def record_history(outcomes, history_db=DEFAULT_HISTORY_DB):
+    """
+    Append this run's outcomes to the health check history and summarize
+    each check's recent behaviour for the alerting action.
+
+    Returns a dict of resource id -> list of per-check summaries with the
+    current status and latency, the recent and baseline p95 latency in
+    milliseconds and the number of pass/fail flaps over the last
+    FLAP_WINDOW_SAMPLES runs.
+    """
+    now = int(datetime.datetime.now().timestamp())
+    latencies_ms = [
+        outcome.latency_seconds * 1000 if outcome.latency_seconds is not None else None
+        for outcome in outcomes
+    ]
+    history = HealthCheckHistory(history_db)
+    try:
+        history.record(
+            ((outcome.check.key, outcome.check.name, outcome.passed, latency_ms)
+             for outcome, latency_ms in zip(outcomes, latencies_ms)),
+            ts=now,
+        )
+        history.compact(now=now)
+
+        recent_since = now - LATENCY_WINDOW_SECONDS
+        checks_by_resource = {}
+        for outcome, latency_ms in zip(outcomes, latencies_ms):
+            resource_id, name = outcome.check.key, outcome.check.name
+            checks_by_resource.setdefault(resource_id, []).append({
+                'name': name,
+                'passed': outcome.passed,
+                'latency_ms': latency_ms,
+                'latency_p95_ms': history.latency_percentile(resource_id, name, recent_since, 95),
+                'baseline_latency_p95_ms': history.baseline_latency_p95(
+                    resource_id, name, recent_since - BASELINE_WINDOW_SECONDS, recent_since),
+                'flaps': history.flap_count(resource_id, name, FLAP_WINDOW_SAMPLES),
+            })
+    finally:
+        history.close()
+    return checks_by_resource
+
+
 def check(job, logger, **kwargs):
     """
     Run health checks for all active resources with the health_check_config parameter set.
     If the number of failing checks exceed the threshold for failure for a given resource,
     compile that into a report for the alerting action to run after this plugin.
+
+    All resources' checks run concurrently through HealthCheckEngine; retries
+    are rescheduled rather than slept on, so slow endpoints do not hold up
+    the rest of the job. Every outcome is also recorded in the health check
+    history so the alerting action can look at latency trends and flapping.
     """
-    resources = Resource.objects.filter(
+    resources = list(Resource.objects.filter(
         attributes__field__name="health_check_config",
         lifecycle='ACTIVE'
-    ).distinct()
+    ).distinct())
     set_progress(
-        f"Will run health checks for {resources.count()} resource(s): "
+        f"Will run health checks for {len(resources)} resource(s): "
         f"{[resource.name for resource in resources]}")
 
-    check_results = []
-
+    health_checks = []
     for resource in resources:
         logger.info(f"Will run health checks for resource '{resource.name}'.")
         config_dict = get_config_value(resource)
-        failing_health_checks = 0
-
-        # Run all the health checks configured for this resource.
         for health_check in config_dict.get('health_checks', {}):
-            max_retries = health_check.get('max_retries', 3)
-            retry_interval_seconds = health_check.get('retry_interval_seconds', 1)
-
-            name = health_check.get('name')
-            job.set_progress(f"Beginning health check '{name}'.")
-            url = health_check.get('url')
-            accepted_statuses = health_check.get('accepted_status_codes')
-            timeout_seconds = health_check.get('timeout_seconds', 3)
-
-            retry_attempts = 0
-            while retry_attempts <= max_retries:
-                try:
-                    if retry_attempts > 1:
-                        logger.info(f"On retry attempt {retry_attempts}.")
-                    status_code = requests.get(url, timeout=timeout_seconds).status_code
-
-                    if accepted_statuses and status_code not in accepted_statuses:
-                        # Failure.
-                        msg = (
-                            f"HTTP Request returned {status_code}, "
-                            f"which is not in the accepted statuses: {accepted_statuses}"
-                            f"for health check '{name}'."
-                        )
-                        logger.debug(msg)
-                        retry_attempts += 1
-                    else:
-                        # Pass - We got a valid status. We can stop now.
-                        logger.info(f"Health check '{name}' completed with success.")
-                        break
-
-                except Exception as e:
-                    # Bad, could be ConnectionError, which will count as a failure.
-                    logger.debug(e)
-                    retry_attempts += 1
-
-                # Wait for the specified retry interval before trying again
-                time.sleep(retry_interval_seconds)
-
-            if retry_attempts == max_retries:
-                job.set_progress(f"Max retries exceeded for health check '{name}'.")
-                failing_health_checks += 1
-
-        # Summarize this resource's health check results.
+            health_checks.append(HealthCheck.from_config(resource.id, health_check))
+
+    def report_outcome(outcome):
+        name = outcome.check.name
+        if outcome.passed:
+            logger.info(f"Health check '{name}' completed with success.")
+        else:
+            job.set_progress(f"Max retries exceeded for health check '{name}'.")
+
+    job.set_progress(f"Beginning {len(health_checks)} health check(s).")
+    engine = HealthCheckEngine(
+        max_workers=MAX_CONCURRENT_CHECKS,
+        max_per_host=MAX_CONCURRENT_CHECKS_PER_HOST,
+        logger=logger,
+    )
+    outcomes = engine.run(health_checks, on_complete=report_outcome)
+
+    failing_by_resource = {resource.id: 0 for resource in resources}
+    for outcome in outcomes:
+        if not outcome.passed:
+            failing_by_resource[outcome.check.key] += 1
+
+    checks_by_resource = record_history(outcomes)
+
+    # Summarize each resource's health check results.
+    check_results = []
+    now = datetime.datetime.now()
+    for resource in resources:
         data_dict = {
-            'time': datetime.datetime.now(),
+            'time': now,
             'resource_id': resource.id,
             'resource_name': resource.name,
-            'failing_health_checks': failing_health_checks,
+            'failing_health_checks': failing_by_resource[resource.id],
+            'health_checks': checks_by_resource.get(resource.id, []),
         }
-
         check_results.append(data_dict)
 
     context = {
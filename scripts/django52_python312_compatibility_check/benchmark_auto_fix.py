@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the Django 5.2.x / Python 3.12.x auto-fix rewrite engine.
+
+Generates large synthetic modules and rewrites them in memory with both the
+original per-pattern loop (finditer + full sub per pattern, line numbers from
+counting newlines in the prefix) and AutoFixer.apply_fixes. The rewritten
+content and the set of fixes must be identical; the script exits non-zero if
+they differ. No files outside a temporary directory are touched.
+
+Line numbers are not compared: apply_fixes reports them against the original
+file, while the original loop reported them against partially rewritten
+content.
+
+Usage:
+    ./benchmark_auto_fix.py [--files 10] [--lines 20000] [--seed 1]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from django52_python312_auto_fix import AutoFixer, FixResult  # noqa: E402
+
+# Ordinary lines that make up most of a module
+CLEAN_LINES = [
+    "def run(job, logger=None, **kwargs):",
+    "    server = job.server_set.first()",
+    "    logger.info('Provisioning {}'.format(server.hostname))",
+    "    for disk in server.disks.all():",
+    "        total += disk.disk_size",
+    "    return 'SUCCESS', '', ''",
+    "",
+    "class Helper(object):",
+    "    def __init__(self, name):",
+    "        self.name = name",
+]
+
+# Lines the fixer rewrites, including some that several patterns match
+FIXABLE_LINES = [
+    "from django.conf.urls import url, include",
+    "    url(r'^admin/', admin.site.urls),",
+    "from django.utils.translation import ugettext as _",
+    "from django.utils.encoding import force_text, smart_text",
+    "    value = force_text(obj) + smart_text(obj)",
+    "import six",
+    "    isinstance(value, six.string_types) or isinstance(value, six.text_type)",
+    "    flag = models.NullBooleanField(default=None)",
+    "    if request.is_ajax():",
+    "from distutils.version import LooseVersion",
+    "    isinstance(f, collections.Callable) or isinstance(m, collections.Mapping)",
+    "from django.utils.timezone import utc",
+    "    now = django.utils.timezone.utc",
+    "    if request.user.is_authenticated():",
+    "import pytz",
+    "    tz = pytz.timezone('US/Eastern'); now = pytz.utc",
+    "USE_L10N = True",
+    "    mapping: typing.Dict[str, typing.List[int]] = {}",
+    "    serializer.is_valid(True)",
+    "    flag = serializers.NullBooleanField()",
+    "    agg = ArrayAgg('name', ordering='-name')",
+    # Fixed by one pattern, then again by a later pattern matching the
+    # text the first one wrote
+    "from pytz import utc",
+    "from pytz import utc, timezone",
+]
+
+
+def generate_module(rng: random.Random, lines: int) -> str:
+    """Return a synthetic module of ``lines`` lines."""
+    body = []
+    for _ in range(lines):
+        if rng.random() < 0.02:
+            body.append(rng.choice(FIXABLE_LINES))
+        else:
+            body.append(rng.choice(CLEAN_LINES))
+    return '\n'.join(body)
+
+
+def apply_fixes_reference(fixer: AutoFixer, content: str, file_path: str):
+    """The original fix_file loop, without the file I/O."""
+    modified_content = content
+    fixes_applied = []
+    for fix_info in fixer.FIX_PATTERNS:
+        compiled = fix_info['compiled']
+        replacement = fix_info['replacement']
+        for match in list(compiled.finditer(modified_content)):
+            original_text = match.group(0)
+            fixed_text = compiled.sub(replacement, original_text, count=1)
+            if fixed_text != original_text:
+                line_start = modified_content[:match.start()].count('\n') + 1
+                fixes_applied.append(FixResult(
+                    file_path=file_path,
+                    original_line=original_text.strip(),
+                    fixed_line=fixed_text.strip(),
+                    line_number=line_start,
+                    fix_type=fix_info['fix_type'],
+                    success=True,
+                    message=fix_info['description'],
+                ))
+        modified_content = compiled.sub(replacement, modified_content)
+    return modified_content, fixes_applied
+
+
+def fix_signature(fixes):
+    """Fixes as a sorted list of comparable tuples, ignoring line numbers."""
+    return sorted((f.fix_type, f.original_line, f.fixed_line) for f in fixes)
+
+
+def time_fixes(label: str, apply, modules):
+    """Run ``apply`` over every module and print elapsed time."""
+    start = time.perf_counter()
+    results = [apply(content, f"module_{index}.py") for index, content in enumerate(modules)]
+    elapsed = time.perf_counter() - start
+    fixes = sum(len(fixes) for _, fixes in results)
+    print(f"{label:<12} {elapsed:8.3f}s  {fixes} fixes")
+    return results, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark AutoFixer.apply_fixes')
+    parser.add_argument('--files', type=int, default=10, help='Number of modules to generate (default: 10)')
+    parser.add_argument('--lines', type=int, default=20000, help='Lines per generated module (default: 20000)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the modules (default: 1)')
+    args = parser.parse_args()
+
+    fixer = AutoFixer(dry_run=True, create_backup=False)
+    rng = random.Random(args.seed)
+    modules = [generate_module(rng, args.lines) for _ in range(args.files)]
+    print(f"Modules: {args.files} x {args.lines} lines, {len(fixer.FIX_PATTERNS)} fix patterns")
+
+    reference, reference_time = time_fixes(
+        'reference', lambda content, path: apply_fixes_reference(fixer, content, path), modules
+    )
+    current, current_time = time_fixes('apply_fixes', fixer.apply_fixes, modules)
+    print(f"Speedup: {reference_time / current_time:.1f}x")
+
+    for index, ((expected_content, expected_fixes), (actual_content, actual_fixes)) in enumerate(
+            zip(reference, current)):
+        if expected_content != actual_content or fix_signature(expected_fixes) != fix_signature(actual_fixes):
+            print(f"MISMATCH in module_{index}.py")
+            sys.exit(1)
+    print("Results identical.")
+
+
+if __name__ == '__main__':
+    main()
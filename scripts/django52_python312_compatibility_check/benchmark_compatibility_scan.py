@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the Django 5.2.x / Python 3.12.x compatibility scanner.
+
+Generates a synthetic corpus of plugin-like Python files, then scans it with
+both the original "every pattern over every line" loop and the single-pass
+PatternMatcher used by CompatibilityScanner.scan_file. The two must produce
+identical CompatibilityIssue lists; the script exits non-zero if they differ.
+
+Usage:
+    ./benchmark_compatibility_scan.py [--files 500] [--lines 400] [--seed 1]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from django52_python312_compatibility_check import (  # noqa: E402
+    CompatibilityIssue,
+    CompatibilityScanner,
+    ScanResult,
+)
+
+# Ordinary lines that make up most of a customer plugin
+CLEAN_LINES = [
+    "def run(job, logger=None, **kwargs):",
+    "    server = job.server_set.first()",
+    "    resource = kwargs.get('resource')",
+    "    logger.info('Provisioning {}'.format(server.hostname))",
+    "    for disk in server.disks.all():",
+    "        total += disk.disk_size",
+    "    return 'SUCCESS', '', ''",
+    "from common.methods import set_progress",
+    "from resourcehandlers.aws.models import AWSHandler",
+    "import json",
+    "    data = json.loads(response.text)",
+    "    if not handler:",
+    "        raise CloudBoltException('No handler found')",
+    "    # Check if the instance is already tagged",
+    "",
+    "class Helper(object):",
+    "    def __init__(self, name):",
+    "        self.name = name",
+]
+
+# Lines that trigger one or more compatibility patterns
+ISSUE_LINES = [
+    "from django.conf.urls import url, include",
+    "    url(r'^admin/', admin.site.urls),",
+    "from django.utils.translation import ugettext as _, ugettext_lazy",
+    "    label = ugettext('Name') + ugettext_lazy('Other')",
+    "    if request.is_ajax():",
+    "from django.utils.encoding import force_text, smart_text",
+    "    value = force_text(obj) + smart_text(obj)",
+    "import distutils.version",
+    "from distutils.util import strtobool",
+    "import imp",
+    "import six",
+    "from six import text_type",
+    "    isinstance(value, six.string_types)",
+    "@asyncio.coroutine",
+    "    tasks = asyncio.Task.all_tasks()",
+    "    isinstance(f, collections.Callable) or isinstance(m, collections.Mapping)",
+    "from typing import Dict, List, Tuple, Set",
+    "import pytz",
+    "    tz = pytz.timezone('US/Eastern'); now = pytz.utc",
+    "    now = datetime.datetime.now(); then = datetime.utcnow()",
+    "    if request.user.is_authenticated():",
+    "    serializer.is_valid(True)",
+    "    flag = serializers.NullBooleanField()",
+    "    count = Server.objects.all().count()",
+    "    qs = Order.objects.filter(owner=instance)",
+    "    {% if items|length_is:'4' %}",
+    "    MIDDLEWARE_CLASSES = []",
+    "import simplejson",
+]
+
+
+def generate_corpus(directory: str, files: int, lines: int, seed: int):
+    """Write ``files`` synthetic plugin modules of ``lines`` lines each."""
+    rng = random.Random(seed)
+    for index in range(files):
+        body = []
+        for _ in range(lines):
+            if rng.random() < 0.03:
+                body.append(rng.choice(ISSUE_LINES))
+            else:
+                body.append(rng.choice(CLEAN_LINES))
+        path = os.path.join(directory, f"plugin_{index:05d}.py")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(body))
+
+
+def scan_file_reference(scanner: CompatibilityScanner, file_path: str) -> ScanResult:
+    """The original scan_file loop: every compiled pattern over every line."""
+    result = ScanResult(file_path=file_path)
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+        lines = f.read().split('\n')
+    for pattern_info in scanner.all_patterns:
+        compiled = pattern_info['compiled']
+        for line_num, line in enumerate(lines, 1):
+            for match in compiled.finditer(line):
+                result.issues.append(CompatibilityIssue(
+                    file_path=file_path,
+                    line_number=line_num,
+                    issue_type=pattern_info['issue_type'],
+                    severity=pattern_info['severity'].value,
+                    description=pattern_info['description'],
+                    deprecated_code=match.group(0).strip(),
+                    recommended_fix=pattern_info['recommended_fix'],
+                    django_version=pattern_info.get('django_version', ''),
+                    python_version=pattern_info.get('python_version', ''),
+                ))
+    return result
+
+
+def time_scan(label: str, scan, paths):
+    """Run ``scan`` over every path and print elapsed time."""
+    start = time.perf_counter()
+    results = [scan(path) for path in paths]
+    elapsed = time.perf_counter() - start
+    issues = sum(len(r.issues) for r in results)
+    print(f"{label:<12} {elapsed:8.3f}s  {len(paths) / elapsed:9.1f} files/s  {issues} issues")
+    return results, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark CompatibilityScanner.scan_file')
+    parser.add_argument('--files', type=int, default=500, help='Number of files to generate (default: 500)')
+    parser.add_argument('--lines', type=int, default=400, help='Lines per generated file (default: 400)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the corpus (default: 1)')
+    args = parser.parse_args()
+
+    scanner = CompatibilityScanner()
+    corpus_dir = tempfile.mkdtemp(prefix='cb_compat_bench_')
+    try:
+        generate_corpus(corpus_dir, args.files, args.lines, args.seed)
+        paths = sorted(os.path.join(corpus_dir, name) for name in os.listdir(corpus_dir))
+        print(f"Corpus: {args.files} files x {args.lines} lines, {len(scanner.all_patterns)} patterns")
+
+        reference, reference_time = time_scan('reference', lambda p: scan_file_reference(scanner, p), paths)
+        current, current_time = time_scan('scan_file', scanner.scan_file, paths)
+        print(f"Speedup: {reference_time / current_time:.1f}x")
+
+        for expected, actual in zip(reference, current):
+            if expected.to_dict() != actual.to_dict():
+                print(f"MISMATCH in {expected.file_path}")
+                sys.exit(1)
+        print("Results identical.")
+    finally:
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
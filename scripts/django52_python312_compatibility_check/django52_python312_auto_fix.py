@@ -14,6 +14,7 @@ Options:
     --report-file       Path to JSON report from compatibility scanner
     --scan-and-fix      Scan and fix in one pass (default)
     --output-file       Path for the fix report
+    --jobs N            Fix files in N worker processes (0 = all CPUs)
 
 Run as root or cloudbolt user to access all directories.
 This script can use CloudBolt's Django environment if available, or run standalone.
@@ -84,14 +85,21 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
 # =============================================================================
 
 import argparse
+import bisect
 import json
 import re
 import shutil
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Set
+from typing import Dict, Iterator, List, Optional, Tuple, Set
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
 
 # =============================================================================
 # FIX DEFINITIONS
@@ -122,8 +130,59 @@ class FileFixReport:
         return len([f for f in self.fixes_applied if f.success])
 
 
+# Fixer instance used by process pool workers (see AutoFixer.iter_fix_files)
+_worker_fixer = None
+
+
+def _init_fix_worker(dry_run: bool, create_backup: bool, verbose: bool):
+    """Process pool initializer: build one fixer per worker process."""
+    global _worker_fixer
+    _worker_fixer = AutoFixer(dry_run=dry_run, create_backup=create_backup, verbose=verbose)
+
+
+def _fix_file_in_worker(file_path: str) -> FileFixReport:
+    """Fix a single file in a process pool worker."""
+    return _worker_fixer.fix_file(file_path)
+
+
+def required_literals(pattern: str) -> List[str]:
+    """
+    Return literal substrings that every match of ``pattern`` must contain.
+    
+    Only top-level literal runs are collected, so a file missing any of them
+    cannot match and the pattern can be skipped without running the regex.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except Exception:
+        return []
+    if parsed.state.flags & (re.IGNORECASE | re.VERBOSE):
+        return []
+    
+    runs = []
+    current = []
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            current.append(chr(av))
+        else:
+            runs.append(''.join(current))
+            current = []
+    runs.append(''.join(current))
+    return [run for run in runs if run]
+
+
+def line_start_offsets(content: str) -> List[int]:
+    """Return the offset at which each line of ``content`` starts."""
+    offsets = [0]
+    offsets.extend(match.end() for match in re.finditer('\n', content))
+    return offsets
+
+
 class AutoFixer:
     """Automatically fixes Django and Python compatibility issues."""
+    
+    # Upper bound on files per work unit sent to a worker process
+    MAX_CHUNK_SIZE = 16
 
     # Define fix patterns: (pattern_to_find, replacement, fix_type, description)
     FIX_PATTERNS = [
@@ -592,10 +651,13 @@ class AutoFixer:
         },
     ]
     
-    def __init__(self, dry_run: bool = False, create_backup: bool = True, verbose: bool = False):
+    def __init__(self, dry_run: bool = False, create_backup: bool = True, verbose: bool = False,
+                 jobs: int = 1):
         self.dry_run = dry_run
         self.create_backup = create_backup
         self.verbose = verbose
+        # Number of worker processes for fixing files; 0 means one per CPU
+        self.jobs = jobs if jobs > 0 else (os.cpu_count() or 1)
         self.backup_dir = '/var/tmp/cloudbolt_compatibility_backups'
         self._compile_patterns()
     
@@ -603,6 +665,7 @@ class AutoFixer:
         """Pre-compile all regex patterns."""
         for fix_info in self.FIX_PATTERNS:
             fix_info['compiled'] = re.compile(fix_info['pattern'], re.MULTILINE)
+            fix_info['literals'] = required_literals(fix_info['pattern'])
     
     def log(self, message: str):
         """Print log message if verbose mode is enabled."""
@@ -649,43 +712,7 @@ class AutoFixer:
             report.error = f"Error reading file: {e}"
             return report
         
-        # Track changes
-        modified_content = original_content
-        fixes_applied = []
-        
-        # Apply each fix pattern
-        for fix_info in self.FIX_PATTERNS:
-            compiled = fix_info['compiled']
-            replacement = fix_info['replacement']
-            fix_type = fix_info['fix_type']
-            description = fix_info['description']
-            
-            # Find all matches
-            matches = list(compiled.finditer(modified_content))
-            
-            for match in matches:
-                original_text = match.group(0)
-                
-                # Apply replacement
-                fixed_text = compiled.sub(replacement, original_text, count=1)
-                
-                if fixed_text != original_text:
-                    # Find line number
-                    line_start = modified_content[:match.start()].count('\n') + 1
-                    
-                    fix_result = FixResult(
-                        file_path=file_path,
-                        original_line=original_text.strip(),
-                        fixed_line=fixed_text.strip(),
-                        line_number=line_start,
-                        fix_type=fix_type,
-                        success=True,
-                        message=description
-                    )
-                    fixes_applied.append(fix_result)
-            
-            # Apply all replacements for this pattern
-            modified_content = compiled.sub(replacement, modified_content)
+        modified_content, fixes_applied = self.apply_fixes(original_content, file_path)
         
         # Check if any changes were made
         if modified_content != original_content:
@@ -711,17 +738,176 @@ class AutoFixer:
         
         return report
     
+    def _collect_edits(self, content: str, scans: Dict[int, Optional[List[tuple]]],
+                       protected: List[tuple]) -> Tuple[List[tuple], Set[int]]:
+        """
+        Find the edits the fix patterns in ``scans`` would make to ``content``.
+        
+        ``scans`` maps a pattern index to None to use every match of the
+        pattern, or to position-sorted (start, end) regions to only use
+        matches touching one of them.
+        
+        Returns (edits, deferred). Edits are non-overlapping
+        (start, end, pattern_index, original_text, fixed_text) tuples sorted by
+        position. When two matches overlap, the pattern listed first in
+        FIX_PATTERNS wins and the other pattern is added to ``deferred`` so the
+        caller can retry it on the rewritten content, as applying patterns one
+        after another would.
+        
+        ``protected`` holds (start, end, pattern_index) regions written by
+        earlier rounds. A pattern never matches inside text written by itself
+        or by a pattern listed after it, since it would have run before them.
+        """
+        edits = []
+        edit_starts = []
+        deferred = set()
+        for pattern_index in sorted(scans):
+            fix_info = self.FIX_PATTERNS[pattern_index]
+            # Cheap substring checks rule out most patterns for a given file
+            if not all(literal in content for literal in fix_info['literals']):
+                continue
+            regions = scans[pattern_index]
+            region_starts = [region[0] for region in regions] if regions is not None else None
+            replacement = fix_info['replacement']
+            for match in fix_info['compiled'].finditer(content):
+                start, end = match.span()
+                if regions is not None:
+                    # Regions don't overlap, so their ends are sorted too
+                    r = bisect.bisect_right(region_starts, end)
+                    if r == 0 or regions[r - 1][1] < start:
+                        continue
+                original_text = match.group(0)
+                fixed_text = match.expand(replacement)
+                if fixed_text == original_text:
+                    continue
+                if any(p_start < end and start < p_end and p_index >= pattern_index
+                       for p_start, p_end, p_index in protected):
+                    continue
+                i = bisect.bisect_left(edit_starts, start)
+                if (i > 0 and edits[i - 1][1] > start) or (i < len(edits) and edits[i][0] < end):
+                    deferred.add(pattern_index)
+                    continue
+                edit_starts.insert(i, start)
+                edits.insert(i, (start, end, pattern_index, original_text, fixed_text))
+        return edits, deferred
+    
+    @staticmethod
+    def _splice(content: str, edits: List[tuple], protected: List[tuple]) -> Tuple[str, List[tuple]]:
+        """
+        Apply position-sorted ``edits`` to ``content`` in one pass.
+        
+        Returns the new content and the protected regions (see _collect_edits):
+        first one region per edit, in order, then the existing regions moved
+        to their new offsets. Regions that an edit overlaps are dropped.
+        """
+        pieces = []
+        regions = []
+        # (old_end, shift) after each edit, for moving the existing regions
+        shifts = []
+        position = 0
+        shift = 0
+        for start, end, pattern_index, _, fixed_text in edits:
+            pieces.append(content[position:start])
+            pieces.append(fixed_text)
+            new_start = start + shift
+            regions.append((new_start, new_start + len(fixed_text), pattern_index))
+            shift += len(fixed_text) - (end - start)
+            shifts.append((end, shift))
+            position = end
+        pieces.append(content[position:])
+        
+        edit_ends = [end for end, _ in shifts]
+        for p_start, p_end, p_index in protected:
+            i = bisect.bisect_right(edit_ends, p_start)
+            if i < len(edits) and edits[i][0] < p_end:
+                continue
+            offset = shifts[i - 1][1] if i else 0
+            regions.append((p_start + offset, p_end + offset, p_index))
+        return ''.join(pieces), regions
+    
+    def apply_fixes(self, content: str, file_path: str) -> Tuple[str, List[FixResult]]:
+        """
+        Apply all fix patterns to ``content`` and return (new_content, fixes).
+        
+        Each round collects the edits of every pattern in one scan, looks up
+        line numbers in a precomputed line-offset index and splices all edits
+        in at once. The result is the same as applying the patterns one after
+        another, so further rounds rerun:
+        
+        * patterns whose matches overlapped an earlier pattern's edit, over
+          the whole content, and
+        * patterns listed after a pattern that made an edit, over just the
+          text that edit wrote, as they would have seen that text.
+        
+        Line numbers refer to the content the round started from, i.e. the
+        original file for all first-round fixes.
+        """
+        fixes = []
+        scans = {pattern_index: None for pattern_index in range(len(self.FIX_PATTERNS))}
+        protected = []
+        while scans:
+            edits, deferred = self._collect_edits(content, scans, protected)
+            if not edits:
+                break
+            
+            line_starts = line_start_offsets(content)
+            for start, end, pattern_index, original_text, fixed_text in sorted(edits, key=lambda e: (e[2], e[0])):
+                fix_info = self.FIX_PATTERNS[pattern_index]
+                fixes.append(FixResult(
+                    file_path=file_path,
+                    original_line=original_text.strip(),
+                    fixed_line=fixed_text.strip(),
+                    line_number=bisect.bisect_right(line_starts, start),
+                    fix_type=fix_info['fix_type'],
+                    success=True,
+                    message=fix_info['description']
+                ))
+            
+            content, protected = self._splice(content, edits, protected)
+            written = protected[:len(edits)]
+            # Every pattern scanned next comes after one that made an edit in
+            # this round, so the lowest pattern index grows each round
+            scans = {pattern_index: None for pattern_index in deferred}
+            for pattern_index in range(min(edit[2] for edit in edits) + 1, len(self.FIX_PATTERNS)):
+                if pattern_index in scans:
+                    continue
+                regions = [(start, end) for start, end, index in written if index < pattern_index]
+                if regions:
+                    scans[pattern_index] = regions
+        return content, fixes
+    
+    def iter_fix_files(self, file_paths: List[str]) -> Iterator[FileFixReport]:
+        """
+        Fix files and yield their reports in the order of ``file_paths``.
+        
+        With jobs > 1 the files are spread across a process pool in chunks.
+        Each file is read, fixed, backed up and written by a single worker.
+        """
+        if self.jobs <= 1 or len(file_paths) <= 1:
+            for file_path in file_paths:
+                yield self.fix_file(file_path)
+            return
+        
+        workers = min(self.jobs, len(file_paths))
+        chunksize = max(1, min(self.MAX_CHUNK_SIZE, len(file_paths) // (workers * 4)))
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_fix_worker,
+            initargs=(self.dry_run, self.create_backup, self.verbose),
+        ) as executor:
+            yield from executor.map(_fix_file_in_worker, file_paths, chunksize=chunksize)
+    
     def fix_directory(self, directory: str, extensions: Set[str] = None) -> List[FileFixReport]:
         """Apply fixes to all Python files in a directory."""
         if extensions is None:
             extensions = {'.py'}
         
-        reports = []
+        file_paths = []
         directory_path = Path(directory)
         
         if not directory_path.exists():
             self.log(f"Directory does not exist: {directory}")
-            return reports
+            return []
         
         for file_path in directory_path.rglob('*'):
             if file_path.suffix in extensions and file_path.is_file():
@@ -732,11 +918,12 @@ class AutoFixer:
                     continue
                 
                 self.log(f"Processing: {file_path}")
-                report = self.fix_file(str(file_path))
-                if report.fixes_applied or report.error:
-                    reports.append(report)
+                file_paths.append(str(file_path))
         
-        return reports
+        return [
+            report for report in self.iter_fix_files(file_paths)
+            if report.fixes_applied or report.error
+        ]
     
     def fix_from_report(self, report_path: str) -> List[FileFixReport]:
         """Fix issues from a JSON compatibility report."""
@@ -762,9 +949,10 @@ class AutoFixer:
             if file_path and os.path.exists(file_path):
                 files_to_fix.add(file_path)
         
-        for file_path in files_to_fix:
+        file_paths = sorted(files_to_fix)
+        for file_path in file_paths:
             self.log(f"Processing: {file_path}")
-            report = self.fix_file(file_path)
+        for report in self.iter_fix_files(file_paths):
             if report.fixes_applied or report.error:
                 reports.append(report)
         
@@ -881,6 +1069,12 @@ def main():
         nargs='*',
         help='Additional paths to scan and fix'
     )
+    parser.add_argument(
+        '--jobs', '-j',
+        type=int,
+        default=1,
+        help='Number of worker processes for fixing files; 0 uses all CPUs (default: 1)'
+    )
     
     args = parser.parse_args()
     
@@ -897,7 +1091,8 @@ def main():
     fixer = AutoFixer(
         dry_run=args.dry_run,
         create_backup=not args.no_backup,
-        verbose=args.verbose
+        verbose=args.verbose,
+        jobs=args.jobs
     )
     
     all_reports = []
@@ -6,7 +6,7 @@ This script scans customer customizations to identify code that is incompatible
 with Django 5.2.x and Python 3.12.x.
 
 Usage:
-    ./django52_python312_compatibility_check.py [--output-format json|html|text] [--output-file report.txt]
+    ./django52_python312_compatibility_check.py [--output-format json|jsonl|html|text] [--output-file report.txt]
 
 Run as root or cloudbolt user to access all directories.
 This script can use CloudBolt's Django environment if available, or run standalone.
@@ -27,6 +27,9 @@ CB_ROOT = "/opt/cloudbolt"
 CB_SRC = os.path.join(CB_ROOT, "src")
 CB_VENV = os.path.join(CB_ROOT, "venv")
 
+# Persistent cache of scan results for unchanged files (see ScanCache)
+DEFAULT_CACHE_FILE = "/var/tmp/cloudbolt_compatibility_scan_cache.sqlite3"
+
 # Add CloudBolt source to Python path
 if os.path.isdir(CB_SRC) and CB_SRC not in sys.path:
     sys.path.insert(0, CB_SRC)
@@ -39,14 +42,25 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
 # =============================================================================
 
 import argparse
+import bisect
+import hashlib
+import html
+import io
 import json
 import re
+import sqlite3
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass, field, asdict
 from datetime import datetime
 from enum import Enum
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Set
+from typing import Dict, Iterator, List, Optional, Tuple, Set
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
 
 # Try to import Django (should work on CloudBolt appliance)
 DJANGO_AVAILABLE = False
@@ -885,11 +899,306 @@ PACKAGE_PATTERNS = [
 ]
 
 
+def extract_required_literals(pattern: str) -> List[str]:
+    """
+    Return the literal substrings that every match of ``pattern`` must contain.
+
+    Only top-level literal runs are considered; groups, alternations, classes,
+    repeats and anchors end the current run. This keeps the extraction
+    conservative: a line missing any of the literals can never match the
+    pattern. An empty list means no literal could be determined.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except Exception:
+        return []
+    if parsed.state.flags & (re.IGNORECASE | re.VERBOSE):
+        return []
+
+    runs = []
+    current = []
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            current.append(chr(av))
+        else:
+            runs.append(''.join(current))
+            current = []
+    runs.append(''.join(current))
+
+    return [run for run in runs if run and '\n' not in run]
+
+
+def build_trie_regex(literals: List[str]) -> str:
+    """
+    Build a regex alternation for ``literals`` factored by common prefix.
+
+    Python's re engine tries alternatives one by one, so a trie-shaped
+    alternation is much cheaper than a flat one. Longer continuations are
+    tried before a shorter literal ends, so the match is the longest literal
+    starting at a given position.
+    """
+    trie = {}
+    for literal in literals:
+        node = trie
+        for char in literal:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            return '(?:' + body + ')?'
+        return body
+
+    return build(trie)
+
+
+class PatternMatcher:
+    """
+    Single-pass matcher for a list of compatibility patterns.
+
+    Each pattern is indexed by the literals it requires (see
+    extract_required_literals). A file is scanned once with a combined
+    lookahead trie over all literals to find which lines contain which
+    literals; the full regex then only runs on lines containing all of its
+    pattern's literals. Patterns without a usable literal are run against
+    every line, as before.
+
+    match_lines() yields (pattern_info, line_number, match) in the same order
+    as the plain "every pattern over every line" loop.
+    """
+
+    # Literals shorter than this filter too little to be worth indexing
+    MIN_LITERAL_LENGTH = 2
+
+    def __init__(self, patterns: List[dict]):
+        self.patterns = patterns
+        self.pattern_literals = []
+        for pattern_info in patterns:
+            literals = [
+                lit for lit in extract_required_literals(pattern_info['pattern'])
+                if len(lit) >= self.MIN_LITERAL_LENGTH
+            ]
+            self.pattern_literals.append(literals)
+
+        all_literals = {lit for literals in self.pattern_literals for lit in literals}
+        ordered = sorted(all_literals, key=lambda lit: (-len(lit), lit))
+        self.literal_ids = {lit: idx for idx, lit in enumerate(ordered)}
+        # When a literal matches at a position, every other literal that is a
+        # prefix of it matches there too; the lookahead only reports the
+        # longest one, so expand hits through this table.
+        self.implied_literals = [
+            [self.literal_ids[other] for other in ordered if lit.startswith(other)]
+            for lit in ordered
+        ]
+        if ordered:
+            self.literal_regex = re.compile('(?=(' + build_trie_regex(ordered) + '))')
+        else:
+            self.literal_regex = None
+
+    def _literal_lines(self, content: str, line_starts: List[int]) -> Dict[int, Set[int]]:
+        """Map literal id -> set of 0-based line indexes containing that literal."""
+        hits = defaultdict(set)
+        if self.literal_regex is None:
+            return hits
+        literal_ids = self.literal_ids
+        implied = self.implied_literals
+        for match in self.literal_regex.finditer(content):
+            line_index = bisect.bisect_right(line_starts, match.start()) - 1
+            for literal_id in implied[literal_ids[match.group(1)]]:
+                hits[literal_id].add(line_index)
+        return hits
+
+    def match_lines(self, content: str):
+        """Yield (pattern_info, line_number, match) for every match in content."""
+        lines = content.split('\n')
+        line_starts = [0]
+        for line in lines[:-1]:
+            line_starts.append(line_starts[-1] + len(line) + 1)
+
+        hits = self._literal_lines(content, line_starts)
+        all_lines = range(len(lines))
+        for pattern_info, literals in zip(self.patterns, self.pattern_literals):
+            if literals:
+                candidates = hits.get(self.literal_ids[literals[0]], set())
+                for literal in literals[1:]:
+                    if not candidates:
+                        break
+                    candidates = candidates & hits.get(self.literal_ids[literal], set())
+                line_indexes = sorted(candidates)
+            else:
+                line_indexes = all_lines
+            compiled = pattern_info['compiled']
+            for line_index in line_indexes:
+                for match in compiled.finditer(lines[line_index]):
+                    yield pattern_info, line_index + 1, match
+
+
+def compute_pattern_version(patterns: List[dict]) -> str:
+    """
+    Return a hash identifying a pattern set.
+    
+    Any change to a pattern's regex or reported fields (severity, description,
+    fix, versions) yields a new value, which invalidates cached scan results.
+    """
+    digest = hashlib.sha256()
+    for pattern_info in patterns:
+        fields = {
+            key: (value.value if isinstance(value, Severity) else value)
+            for key, value in pattern_info.items()
+            if key != 'compiled'
+        }
+        digest.update(json.dumps(fields, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ScanCache:
+    """
+    Persistent SQLite cache of per-file scan results.
+    
+    Entries are keyed by path and hold the file's mtime, size and SHA-256 at
+    scan time plus the pattern set version. A stored result is reused when the
+    pattern version matches and either the mtime/size are unchanged or the
+    content hash still matches (e.g. a file that was only touched). Entries
+    from other pattern versions are dropped when the cache is opened.
+    """
+    
+    SCHEMA_VERSION = 1
+    
+    def __init__(self, cache_file: str, pattern_version: str):
+        self.cache_file = cache_file
+        self.pattern_version = f"{self.SCHEMA_VERSION}:{pattern_version}"
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(cache_file)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS scan_cache ('
+            ' path TEXT PRIMARY KEY,'
+            ' mtime_ns INTEGER NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' content_hash TEXT NOT NULL,'
+            ' pattern_version TEXT NOT NULL,'
+            ' result TEXT NOT NULL)'
+        )
+        self.conn.execute('DELETE FROM scan_cache WHERE pattern_version != ?', (self.pattern_version,))
+        self.conn.commit()
+    
+    @staticmethod
+    def _hash_file(file_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    def check(self, file_path: str) -> Tuple[bool, Optional[tuple]]:
+        """
+        Return (is_cached, fingerprint) for a file.
+        
+        Cached results are fetched separately with load() so that callers do
+        not need to hold them all in memory. The fingerprint is
+        (mtime_ns, size, content_hash) and must be passed to store() after a
+        miss; it is None when the file cannot be read, and such files are
+        never cached.
+        """
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            self.misses += 1
+            return False, None
+        row = self.conn.execute(
+            'SELECT mtime_ns, size, content_hash FROM scan_cache'
+            ' WHERE path = ? AND pattern_version = ?',
+            (file_path, self.pattern_version),
+        ).fetchone()
+        
+        if row and row[0] == stat.st_mtime_ns and row[1] == stat.st_size:
+            self.hits += 1
+            return True, None
+        
+        try:
+            content_hash = self._hash_file(file_path)
+        except OSError:
+            self.misses += 1
+            return False, None
+        
+        if row and row[2] == content_hash:
+            # Touched but unchanged; refresh the stat fields
+            self.conn.execute(
+                'UPDATE scan_cache SET mtime_ns = ?, size = ? WHERE path = ?',
+                (stat.st_mtime_ns, stat.st_size, file_path),
+            )
+            self.hits += 1
+            return True, None
+        
+        self.misses += 1
+        return False, (stat.st_mtime_ns, stat.st_size, content_hash)
+    
+    def load(self, file_path: str) -> ScanResult:
+        """Return the cached result for a file that check() reported as cached."""
+        row = self.conn.execute(
+            'SELECT result FROM scan_cache WHERE path = ?', (file_path,)
+        ).fetchone()
+        return self._load_result(row[0])
+    
+    def store(self, file_path: str, fingerprint: tuple, result: ScanResult):
+        """Record a freshly scanned result. Results with read errors are skipped."""
+        if fingerprint is None or result.error:
+            return
+        mtime_ns, size, content_hash = fingerprint
+        self.conn.execute(
+            'INSERT OR REPLACE INTO scan_cache'
+            ' (path, mtime_ns, size, content_hash, pattern_version, result)'
+            ' VALUES (?, ?, ?, ?, ?, ?)',
+            (file_path, mtime_ns, size, content_hash, self.pattern_version,
+             json.dumps(result.to_dict())),
+        )
+    
+    @staticmethod
+    def _load_result(data: str) -> ScanResult:
+        stored = json.loads(data)
+        return ScanResult(
+            file_path=stored['file_path'],
+            issues=[CompatibilityIssue(**issue) for issue in stored['issues']],
+            error=stored['error'],
+        )
+    
+    def commit(self):
+        self.conn.commit()
+    
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+# Scanner instance used by process pool workers (see CompatibilityScanner.iter_scan_files)
+_worker_scanner = None
+
+
+def _init_scan_worker(verbose: bool):
+    """Process pool initializer: build one scanner per worker process."""
+    global _worker_scanner
+    _worker_scanner = CompatibilityScanner(verbose=verbose)
+
+
+def _scan_file_in_worker(file_path: str) -> ScanResult:
+    """Scan a single file in a process pool worker."""
+    return _worker_scanner.scan_file(file_path)
+
+
 class CompatibilityScanner:
     """Scans files for Django and Python compatibility issues."""
     
-    def __init__(self, verbose: bool = False):
+    # Upper bound on files per work unit sent to a worker process
+    MAX_CHUNK_SIZE = 64
+    
+    def __init__(self, verbose: bool = False, jobs: int = 1, cache_file: Optional[str] = None):
         self.verbose = verbose
+        # Number of worker processes for scanning; 0 means one per CPU
+        self.jobs = jobs if jobs > 0 else (os.cpu_count() or 1)
         # Combine all pattern lists for upgrade path: Django 3.2 → 4.2 → 5.2
         self.all_patterns = (
             DJANGO_PATTERNS +
@@ -905,11 +1214,20 @@ class CompatibilityScanner:
             PACKAGE_PATTERNS
         )
         self._compile_patterns()
+        self.pattern_version = compute_pattern_version(self.all_patterns)
+        
+        self.cache = None
+        if cache_file:
+            try:
+                self.cache = ScanCache(cache_file, self.pattern_version)
+            except sqlite3.Error as e:
+                print(f"[WARNING] Scan cache disabled, could not open {cache_file}: {e}")
     
     def _compile_patterns(self):
         """Pre-compile all regex patterns for efficiency."""
         for pattern_info in self.all_patterns:
             pattern_info['compiled'] = re.compile(pattern_info['pattern'])
+        self.matcher = PatternMatcher(self.all_patterns)
     
     def log(self, message: str):
         """Log message if verbose mode is enabled."""
@@ -923,42 +1241,84 @@ class CompatibilityScanner:
         try:
             with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
                 content = f.read()
-                lines = content.split('\n')
         except Exception as e:
             result.error = f"Error reading file: {str(e)}"
             return result
         
-        for pattern_info in self.all_patterns:
-            compiled = pattern_info['compiled']
-            for line_num, line in enumerate(lines, 1):
-                matches = compiled.finditer(line)
-                for match in matches:
-                    issue = CompatibilityIssue(
-                        file_path=file_path,
-                        line_number=line_num,
-                        issue_type=pattern_info['issue_type'],
-                        severity=pattern_info['severity'].value,
-                        description=pattern_info['description'],
-                        deprecated_code=match.group(0).strip(),
-                        recommended_fix=pattern_info['recommended_fix'],
-                        django_version=pattern_info.get('django_version', ''),
-                        python_version=pattern_info.get('python_version', ''),
-                    )
-                    result.issues.append(issue)
+        for pattern_info, line_num, match in self.matcher.match_lines(content):
+            issue = CompatibilityIssue(
+                file_path=file_path,
+                line_number=line_num,
+                issue_type=pattern_info['issue_type'],
+                severity=pattern_info['severity'].value,
+                description=pattern_info['description'],
+                deprecated_code=match.group(0).strip(),
+                recommended_fix=pattern_info['recommended_fix'],
+                django_version=pattern_info.get('django_version', ''),
+                python_version=pattern_info.get('python_version', ''),
+            )
+            result.issues.append(issue)
         
         return result
     
-    def scan_directory(self, directory: str, extensions: Set[str] = None) -> List[ScanResult]:
-        """Scan all Python files in a directory recursively."""
+    def iter_scan_files(self, file_paths: List[str]) -> Iterator[ScanResult]:
+        """
+        Scan files and yield their results in the order of ``file_paths``.
+        
+        Files with a valid entry in the scan cache are not rescanned. The rest
+        are scanned (in parallel when jobs > 1) and their results are stored.
+        """
+        if self.cache is None:
+            yield from self._scan_uncached(file_paths)
+            return
+        
+        checks = [self.cache.check(file_path) for file_path in file_paths]
+        misses = [file_path for file_path, (cached, _) in zip(file_paths, checks) if not cached]
+        self.log(f"Scan cache: {len(file_paths) - len(misses)} unchanged, {len(misses)} to scan")
+        
+        scanned = self._scan_uncached(misses)
+        for file_path, (cached, fingerprint) in zip(file_paths, checks):
+            if cached:
+                yield self.cache.load(file_path)
+            else:
+                result = next(scanned)
+                self.cache.store(file_path, fingerprint, result)
+                yield result
+        self.cache.commit()
+    
+    def _scan_uncached(self, file_paths: List[str]) -> Iterator[ScanResult]:
+        """
+        Scan files and yield their results in the order of ``file_paths``.
+        
+        With jobs > 1 the files are spread across a process pool in chunks;
+        results are streamed back as they complete but always in input order,
+        so reports stay identical to a serial run.
+        """
+        if self.jobs <= 1 or len(file_paths) <= 1:
+            for file_path in file_paths:
+                yield self.scan_file(file_path)
+            return
+        
+        workers = min(self.jobs, len(file_paths))
+        chunksize = max(1, min(self.MAX_CHUNK_SIZE, len(file_paths) // (workers * 4)))
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_scan_worker,
+            initargs=(self.verbose,),
+        ) as executor:
+            yield from executor.map(_scan_file_in_worker, file_paths, chunksize=chunksize)
+    
+    def find_files(self, directory: str, extensions: Set[str] = None) -> List[str]:
+        """List the files under a directory that scan_directory would scan."""
         if extensions is None:
             extensions = {'.py'}
         
-        results = []
+        file_paths = []
         directory_path = Path(directory)
         
         if not directory_path.exists():
             self.log(f"Directory does not exist: {directory}")
-            return results
+            return file_paths
         
         for file_path in directory_path.rglob('*'):
             if file_path.suffix in extensions and file_path.is_file():
@@ -967,20 +1327,32 @@ class CompatibilityScanner:
                     continue
                 if '/migrations/' in str(file_path) and file_path.name != '__init__.py':
                     continue
-                    
+                
                 self.log(f"Scanning: {file_path}")
-                result = self.scan_file(str(file_path))
-                results.append(result)
+                file_paths.append(str(file_path))
         
-        return results
+        return file_paths
+    
+    def iter_scan_directory(self, directory: str, extensions: Set[str] = None) -> Iterator[ScanResult]:
+        """Scan all Python files in a directory recursively, yielding results as they are ready."""
+        return self.iter_scan_files(self.find_files(directory, extensions))
+    
+    def scan_directory(self, directory: str, extensions: Set[str] = None) -> List[ScanResult]:
+        """Scan all Python files in a directory recursively."""
+        return list(self.iter_scan_directory(directory, extensions))
     
     def scan_database_plugins(self) -> List[ScanResult]:
         """Scan CloudBolt plugins stored in the database."""
-        results = []
-        
+        return list(self.iter_scan_database_plugins())
+    
+    def iter_scan_database_plugins(self) -> Iterator[ScanResult]:
+        """Scan CloudBolt plugins stored in the database, yielding results as they are ready."""
         if not DJANGO_AVAILABLE:
             self.log("Django not available, skipping database plugin scan")
-            return results
+            return
+        
+        # (report label, path) for every plugin file, scanned together below
+        plugin_files = []
         
         try:
             from cbhooks.models import CloudBoltHook, ServerAction, ResourceAction, SharedModule
@@ -992,9 +1364,7 @@ class CompatibilityScanner:
                         file_path = hook.module_file.path
                         if os.path.exists(file_path):
                             self.log(f"Scanning plugin: {hook.name} ({file_path})")
-                            result = self.scan_file(file_path)
-                            result.file_path = f"[Plugin: {hook.name}] {file_path}"
-                            results.append(result)
+                            plugin_files.append((f"[Plugin: {hook.name}] {file_path}", file_path))
                     except Exception as e:
                         self.log(f"Error scanning plugin {hook.name}: {e}")
             
@@ -1005,116 +1375,242 @@ class CompatibilityScanner:
                         file_path = module.module_file.path
                         if os.path.exists(file_path):
                             self.log(f"Scanning shared module: {module.name} ({file_path})")
-                            result = self.scan_file(file_path)
-                            result.file_path = f"[SharedModule: {module.name}] {file_path}"
-                            results.append(result)
+                            plugin_files.append((f"[SharedModule: {module.name}] {file_path}", file_path))
                     except Exception as e:
                         self.log(f"Error scanning shared module {module.name}: {e}")
-                        
+            
         except Exception as e:
             self.log(f"Error scanning database plugins: {e}")
         
-        return results
+        file_paths = [file_path for _, file_path in plugin_files]
+        for (label, _), result in zip(plugin_files, self.iter_scan_files(file_paths)):
+            result.file_path = label
+            yield result
 
 
-class ReportGenerator:
-    """Generates compatibility reports in various formats."""
-    
-    def __init__(self, report: CompatibilityReport):
-        self.report = report
-    
-    def to_json(self) -> str:
-        """Generate JSON report."""
-        return json.dumps(self.report.to_dict(), indent=2, default=str)
-    
-    def to_text(self) -> str:
-        """Generate plain text report."""
-        lines = []
-        r = self.report
-        
-        lines.append("=" * 80)
-        lines.append("CLOUDBOLT DJANGO 5.2.x / PYTHON 3.12.x COMPATIBILITY REPORT")
-        lines.append("=" * 80)
-        lines.append("")
-        lines.append(f"Scan Date: {r.scan_date}")
-        lines.append(f"CloudBolt Version: {r.cloudbolt_version}")
-        lines.append(f"Current Django Version: {r.current_django_version}")
-        lines.append(f"Current Python Version: {r.current_python_version}")
-        lines.append(f"Target Django Version: {r.target_django_version}")
-        lines.append(f"Target Python Version: {r.target_python_version}")
-        lines.append("")
-        lines.append("-" * 80)
-        lines.append("SUMMARY")
-        lines.append("-" * 80)
-        lines.append(f"Total Files Scanned: {r.total_files_scanned}")
-        lines.append(f"Total Issues Found: {r.total_issues}")
-        lines.append("")
-        lines.append(f"  CRITICAL: {r.critical_count}")
-        lines.append(f"  HIGH:     {r.high_count}")
-        lines.append(f"  MEDIUM:   {r.medium_count}")
-        lines.append(f"  LOW:      {r.low_count}")
-        lines.append(f"  INFO:     {r.info_count}")
-        lines.append("")
-        
-        if r.issues_by_type:
-            lines.append("-" * 80)
-            lines.append("ISSUES BY TYPE")
-            lines.append("-" * 80)
-            for issue_type, count in sorted(r.issues_by_type.items(), key=lambda x: -x[1]):
+class ReportStats:
+    """
+    Running totals for a compatibility report.
+
+    Updated one ScanResult at a time so that results never need to be held
+    in memory. Exposes the same summary attributes as CompatibilityReport.
+    """
+
+    def __init__(self):
+        self.total_files_scanned = 0
+        self.total_issues = 0
+        self.severity_counts = {severity.value: 0 for severity in Severity}
+        self.issues_by_type = defaultdict(int)
+
+    def add(self, result: ScanResult):
+        """Count a single file's results."""
+        self.total_files_scanned += 1
+        self.total_issues += len(result.issues)
+        for issue in result.issues:
+            self.severity_counts[issue.severity] = self.severity_counts.get(issue.severity, 0) + 1
+            self.issues_by_type[issue.issue_type] += 1
+
+    @property
+    def critical_count(self) -> int:
+        return self.severity_counts[Severity.CRITICAL.value]
+
+    @property
+    def high_count(self) -> int:
+        return self.severity_counts[Severity.HIGH.value]
+
+    @property
+    def medium_count(self) -> int:
+        return self.severity_counts[Severity.MEDIUM.value]
+
+    @property
+    def low_count(self) -> int:
+        return self.severity_counts[Severity.LOW.value]
+
+    @property
+    def info_count(self) -> int:
+        return self.severity_counts[Severity.INFO.value]
+
+
+# Report metadata known before scanning starts, in report order
+REPORT_HEADER_FIELDS = [
+    'scan_date',
+    'cloudbolt_version',
+    'current_django_version',
+    'current_python_version',
+    'target_django_version',
+    'target_python_version',
+]
+
+# Summary fields written once scanning is finished, in report order
+REPORT_SUMMARY_FIELDS = [
+    'total_files_scanned',
+    'total_issues',
+    'critical_count',
+    'high_count',
+    'medium_count',
+    'low_count',
+    'info_count',
+]
+
+
+class StreamingReportWriter:
+    """
+    Base class for report writers that stream findings to a file object.
+
+    Call start(header) once, write_result() for every ScanResult as soon as it
+    is available, then finish(stats). Only files with issues or errors are
+    written. ``stats`` is a ReportStats or a CompatibilityReport.
+    """
+
+    extension = 'txt'
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.files_written = 0
+
+    def start(self, header: Dict[str, str]):
+        raise NotImplementedError
+
+    def write_result(self, result: ScanResult):
+        if result.issues or result.error:
+            self._write_result(result)
+            self.files_written += 1
+
+    def _write_result(self, result: ScanResult):
+        raise NotImplementedError
+
+    def finish(self, stats):
+        raise NotImplementedError
+
+
+class TextReportWriter(StreamingReportWriter):
+    """Plain text report. The summary follows the detailed findings."""
+
+    extension = 'txt'
+
+    def _write_lines(self, lines: List[str]):
+        self.stream.write('\n'.join(lines) + '\n')
+
+    def start(self, header):
+        self._write_lines([
+            "=" * 80,
+            "CLOUDBOLT DJANGO 5.2.x / PYTHON 3.12.x COMPATIBILITY REPORT",
+            "=" * 80,
+            "",
+            f"Scan Date: {header['scan_date']}",
+            f"CloudBolt Version: {header['cloudbolt_version']}",
+            f"Current Django Version: {header['current_django_version']}",
+            f"Current Python Version: {header['current_python_version']}",
+            f"Target Django Version: {header['target_django_version']}",
+            f"Target Python Version: {header['target_python_version']}",
+            "",
+            "-" * 80,
+            "DETAILED FINDINGS",
+            "-" * 80,
+        ])
+
+    def _write_result(self, result):
+        lines = ["", f"FILE: {result.file_path}"]
+        if result.error:
+            lines.append(f"  ERROR: {result.error}")
+        for issue in result.issues:
+            lines.append(f"  Line {issue.line_number}: [{issue.severity}] {issue.issue_type}")
+            lines.append(f"    Description: {issue.description}")
+            lines.append(f"    Found: {issue.deprecated_code}")
+            lines.append(f"    Fix: {issue.recommended_fix}")
+            if issue.django_version:
+                lines.append(f"    Django: {issue.django_version}")
+            if issue.python_version:
+                lines.append(f"    Python: {issue.python_version}")
+        self._write_lines(lines)
+
+    def finish(self, stats):
+        lines = [
+            "",
+            "-" * 80,
+            "SUMMARY",
+            "-" * 80,
+            f"Total Files Scanned: {stats.total_files_scanned}",
+            f"Total Issues Found: {stats.total_issues}",
+            "",
+            f"  CRITICAL: {stats.critical_count}",
+            f"  HIGH:     {stats.high_count}",
+            f"  MEDIUM:   {stats.medium_count}",
+            f"  LOW:      {stats.low_count}",
+            f"  INFO:     {stats.info_count}",
+            "",
+        ]
+        if stats.issues_by_type:
+            lines.extend(["-" * 80, "ISSUES BY TYPE", "-" * 80])
+            for issue_type, count in sorted(stats.issues_by_type.items(), key=lambda x: -x[1]):
                 lines.append(f"  {issue_type}: {count}")
             lines.append("")
-        
-        lines.append("-" * 80)
-        lines.append("DETAILED FINDINGS")
-        lines.append("-" * 80)
-        
-        for result in r.scan_results:
-            if result.issues or result.error:
-                lines.append("")
-                lines.append(f"FILE: {result.file_path}")
-                if result.error:
-                    lines.append(f"  ERROR: {result.error}")
-                for issue in result.issues:
-                    lines.append(f"  Line {issue.line_number}: [{issue.severity}] {issue.issue_type}")
-                    lines.append(f"    Description: {issue.description}")
-                    lines.append(f"    Found: {issue.deprecated_code}")
-                    lines.append(f"    Fix: {issue.recommended_fix}")
-                    if issue.django_version:
-                        lines.append(f"    Django: {issue.django_version}")
-                    if issue.python_version:
-                        lines.append(f"    Python: {issue.python_version}")
-        
-        lines.append("")
-        lines.append("=" * 80)
-        lines.append("END OF REPORT")
-        lines.append("=" * 80)
-        
-        return "\n".join(lines)
-    
-    def to_html(self) -> str:
-        """Generate HTML report."""
-        r = self.report
-        
-        # Count issues by severity for each file
-        critical_files = []
-        high_files = []
-        
-        for result in r.scan_results:
-            has_critical = any(i.severity == 'CRITICAL' for i in result.issues)
-            has_high = any(i.severity == 'HIGH' for i in result.issues)
-            if has_critical:
-                critical_files.append(result.file_path)
-            elif has_high:
-                high_files.append(result.file_path)
-        
-        html = f'''<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>CloudBolt Compatibility Report</title>
-    <style>
-        :root {{
+        lines.extend(["=" * 80, "END OF REPORT", "=" * 80])
+        self.stream.write('\n'.join(lines))
+
+
+class JsonReportWriter(StreamingReportWriter):
+    """
+    Single JSON document with the same keys as CompatibilityReport.to_dict().
+
+    scan_results is streamed as an array; the summary keys follow it.
+    """
+
+    extension = 'json'
+
+    def start(self, header):
+        self.stream.write('{\n')
+        for key in REPORT_HEADER_FIELDS:
+            self.stream.write(f'  {json.dumps(key)}: {json.dumps(header[key], default=str)},\n')
+        self.stream.write('  "scan_results": [')
+
+    def _write_result(self, result):
+        separator = ',' if self.files_written else ''
+        body = json.dumps(result.to_dict(), indent=2, default=str).replace('\n', '\n    ')
+        self.stream.write(f'{separator}\n    {body}')
+
+    def finish(self, stats):
+        self.stream.write('\n  ]' if self.files_written else ']')
+        for key in REPORT_SUMMARY_FIELDS:
+            self.stream.write(f',\n  {json.dumps(key)}: {getattr(stats, key)}')
+        issues_by_type = json.dumps(dict(stats.issues_by_type), indent=2).replace('\n', '\n  ')
+        self.stream.write(f',\n  "issues_by_type": {issues_by_type}\n}}\n')
+
+
+class JsonLinesReportWriter(StreamingReportWriter):
+    """
+    JSON Lines report: a "header" record, one "file" record per file with
+    findings, and a closing "summary" record.
+    """
+
+    extension = 'jsonl'
+
+    def _write_record(self, record_type: str, data: dict):
+        record = {'record_type': record_type}
+        record.update(data)
+        self.stream.write(json.dumps(record, default=str) + '\n')
+
+    def start(self, header):
+        self._write_record('header', {key: header[key] for key in REPORT_HEADER_FIELDS})
+
+    def _write_result(self, result):
+        self._write_record('file', result.to_dict())
+
+    def finish(self, stats):
+        summary = {key: getattr(stats, key) for key in REPORT_SUMMARY_FIELDS}
+        summary['issues_by_type'] = dict(stats.issues_by_type)
+        self._write_record('summary', summary)
+
+
+class HtmlReportWriter(StreamingReportWriter):
+    """
+    HTML report. Findings are written as they arrive; the summary cards are
+    appended at the end and displayed above the findings via CSS order.
+    """
+
+    extension = 'html'
+
+    STYLE = """        :root {
             --critical: #dc3545;
             --high: #fd7e14;
             --medium: #ffc107;
@@ -1125,357 +1621,426 @@ class ReportGenerator:
             --text-primary: #eee;
             --text-secondary: #aaa;
             --border: #0f3460;
-        }}
+        }
         
-        * {{ box-sizing: border-box; margin: 0; padding: 0; }}
+        * { box-sizing: border-box; margin: 0; padding: 0; }
         
-        body {{
+        body {
             font-family: 'Segoe UI', system-ui, sans-serif;
             background: var(--bg-dark);
             color: var(--text-primary);
             line-height: 1.6;
             padding: 2rem;
-        }}
+        }
         
-        .container {{ max-width: 1400px; margin: 0 auto; }}
+        /* Findings are streamed before the summary is known; flex order
+           shows the summary above them when the page is rendered. */
+        .container {
+            max-width: 1400px;
+            margin: 0 auto;
+            display: flex;
+            flex-direction: column;
+        }
         
-        h1 {{
+        .report-header { order: 1; }
+        .report-summary { order: 2; }
+        .report-findings { order: 3; }
+        
+        h1 {
             font-size: 2rem;
             margin-bottom: 0.5rem;
             background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
             -webkit-background-clip: text;
             -webkit-text-fill-color: transparent;
             background-clip: text;
-        }}
+        }
         
-        .subtitle {{ color: var(--text-secondary); margin-bottom: 2rem; }}
+        .subtitle { color: var(--text-secondary); margin-bottom: 2rem; }
         
-        .meta-grid {{
+        .meta-grid {
             display: grid;
             grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
             gap: 1rem;
             margin-bottom: 2rem;
-        }}
+        }
         
-        .meta-card {{
+        .meta-card {
             background: var(--bg-card);
             border: 1px solid var(--border);
             border-radius: 8px;
             padding: 1rem;
-        }}
+        }
         
-        .meta-card label {{
+        .meta-card label {
             display: block;
             font-size: 0.8rem;
             color: var(--text-secondary);
             text-transform: uppercase;
             letter-spacing: 0.05em;
-        }}
+        }
         
-        .meta-card .value {{
+        .meta-card .value {
             font-size: 1.25rem;
             font-weight: 600;
-        }}
+        }
         
-        .summary-grid {{
+        .summary-grid {
             display: grid;
             grid-template-columns: repeat(5, 1fr);
             gap: 1rem;
             margin-bottom: 2rem;
-        }}
+        }
         
-        .severity-card {{
+        .severity-card {
             background: var(--bg-card);
             border-radius: 8px;
             padding: 1.5rem;
             text-align: center;
             border-left: 4px solid;
-        }}
+        }
         
-        .severity-card.critical {{ border-color: var(--critical); }}
-        .severity-card.high {{ border-color: var(--high); }}
-        .severity-card.medium {{ border-color: var(--medium); }}
-        .severity-card.low {{ border-color: var(--low); }}
-        .severity-card.info {{ border-color: var(--info); }}
+        .severity-card.critical { border-color: var(--critical); }
+        .severity-card.high { border-color: var(--high); }
+        .severity-card.medium { border-color: var(--medium); }
+        .severity-card.low { border-color: var(--low); }
+        .severity-card.info { border-color: var(--info); }
         
-        .severity-card .count {{
+        .severity-card .count {
             font-size: 2.5rem;
             font-weight: 700;
             line-height: 1;
-        }}
+        }
         
-        .severity-card.critical .count {{ color: var(--critical); }}
-        .severity-card.high .count {{ color: var(--high); }}
-        .severity-card.medium .count {{ color: var(--medium); }}
-        .severity-card.low .count {{ color: var(--low); }}
-        .severity-card.info .count {{ color: var(--info); }}
+        .severity-card.critical .count { color: var(--critical); }
+        .severity-card.high .count { color: var(--high); }
+        .severity-card.medium .count { color: var(--medium); }
+        .severity-card.low .count { color: var(--low); }
+        .severity-card.info .count { color: var(--info); }
         
-        .severity-card .label {{
+        .severity-card .label {
             font-size: 0.9rem;
             color: var(--text-secondary);
             margin-top: 0.5rem;
-        }}
+        }
         
-        .section {{
+        .section {
             background: var(--bg-card);
             border: 1px solid var(--border);
             border-radius: 8px;
             margin-bottom: 1.5rem;
             overflow: hidden;
-        }}
+        }
         
-        .section-header {{
+        .section-header {
             background: rgba(255,255,255,0.05);
             padding: 1rem 1.5rem;
             border-bottom: 1px solid var(--border);
             font-weight: 600;
-        }}
+        }
         
-        .section-content {{ padding: 1.5rem; }}
+        .section-content { padding: 1.5rem; }
         
-        .issue-list {{ list-style: none; }}
+        .issue-list { list-style: none; }
         
-        .issue-item {{
+        .issue-item {
             background: rgba(0,0,0,0.2);
             border-radius: 6px;
             padding: 1rem;
             margin-bottom: 0.75rem;
             border-left: 3px solid;
-        }}
+        }
         
-        .issue-item.CRITICAL {{ border-color: var(--critical); }}
-        .issue-item.HIGH {{ border-color: var(--high); }}
-        .issue-item.MEDIUM {{ border-color: var(--medium); }}
-        .issue-item.LOW {{ border-color: var(--low); }}
-        .issue-item.INFO {{ border-color: var(--info); }}
+        .issue-item.CRITICAL { border-color: var(--critical); }
+        .issue-item.HIGH { border-color: var(--high); }
+        .issue-item.MEDIUM { border-color: var(--medium); }
+        .issue-item.LOW { border-color: var(--low); }
+        .issue-item.INFO { border-color: var(--info); }
         
-        .issue-header {{
+        .issue-header {
             display: flex;
             justify-content: space-between;
             align-items: center;
             margin-bottom: 0.5rem;
-        }}
+        }
         
-        .issue-type {{ font-weight: 600; }}
+        .issue-type { font-weight: 600; }
         
-        .badge {{
+        .badge {
             font-size: 0.7rem;
             padding: 0.2rem 0.5rem;
             border-radius: 3px;
             text-transform: uppercase;
             font-weight: 600;
-        }}
+        }
         
-        .badge.CRITICAL {{ background: var(--critical); }}
-        .badge.HIGH {{ background: var(--high); color: #000; }}
-        .badge.MEDIUM {{ background: var(--medium); color: #000; }}
-        .badge.LOW {{ background: var(--low); }}
-        .badge.INFO {{ background: var(--info); }}
+        .badge.CRITICAL { background: var(--critical); }
+        .badge.HIGH { background: var(--high); color: #000; }
+        .badge.MEDIUM { background: var(--medium); color: #000; }
+        .badge.LOW { background: var(--low); }
+        .badge.INFO { background: var(--info); }
         
-        .issue-details {{
+        .issue-details {
             font-size: 0.9rem;
             color: var(--text-secondary);
-        }}
+        }
         
-        .issue-details p {{ margin: 0.25rem 0; }}
+        .issue-details p { margin: 0.25rem 0; }
         
-        .code {{
+        .code {
             font-family: 'Fira Code', 'Consolas', monospace;
             background: rgba(0,0,0,0.3);
             padding: 0.2rem 0.4rem;
             border-radius: 3px;
             font-size: 0.85rem;
-        }}
+        }
         
-        .fix {{
+        .fix {
             color: #4ade80;
             font-style: italic;
-        }}
+        }
         
-        .file-path {{
+        .file-path {
             word-break: break-all;
             font-family: monospace;
             font-size: 0.9rem;
             color: #60a5fa;
-        }}
+        }
         
-        .collapsible {{
+        .collapsible {
             cursor: pointer;
-        }}
+        }
         
-        .collapsible:after {{
+        .collapsible:after {
             content: ' ▼';
             font-size: 0.7rem;
-        }}
+        }
         
-        .issues-by-type {{
+        .issues-by-type {
             display: grid;
             grid-template-columns: repeat(auto-fill, minmax(250px, 1fr));
             gap: 0.5rem;
-        }}
+        }
         
-        .type-item {{
+        .type-item {
             display: flex;
             justify-content: space-between;
             padding: 0.5rem;
             background: rgba(0,0,0,0.2);
             border-radius: 4px;
-        }}
+        }
         
-        .no-issues {{
+        .no-issues {
             text-align: center;
             padding: 3rem;
             color: #4ade80;
             font-size: 1.2rem;
-        }}
+        }
         
-        @media (max-width: 768px) {{
-            .summary-grid {{ grid-template-columns: repeat(2, 1fr); }}
-            .meta-grid {{ grid-template-columns: 1fr; }}
-        }}
-    </style>
+        @media (max-width: 768px) {
+            .summary-grid { grid-template-columns: repeat(2, 1fr); }
+            .meta-grid { grid-template-columns: 1fr; }
+        }
+"""
+
+    def start(self, header):
+        e = html.escape
+        self.stream.write(f'''<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>CloudBolt Compatibility Report</title>
+    <style>
+{self.STYLE}    </style>
 </head>
 <body>
     <div class="container">
-        <h1>CloudBolt Compatibility Report</h1>
-        <p class="subtitle">Django 5.2.x / Python 3.12.x</p>
-        
-        <div class="meta-grid">
-            <div class="meta-card">
-                <label>Scan Date</label>
-                <div class="value">{r.scan_date}</div>
-            </div>
-            <div class="meta-card">
-                <label>CloudBolt Version</label>
-                <div class="value">{r.cloudbolt_version}</div>
-            </div>
-            <div class="meta-card">
-                <label>Current Django</label>
-                <div class="value">{r.current_django_version}</div>
-            </div>
-            <div class="meta-card">
-                <label>Current Python</label>
-                <div class="value">{r.current_python_version}</div>
-            </div>
-            <div class="meta-card">
-                <label>Target Django</label>
-                <div class="value">{r.target_django_version}</div>
-            </div>
-            <div class="meta-card">
-                <label>Target Python</label>
-                <div class="value">{r.target_python_version}</div>
-            </div>
-            <div class="meta-card">
-                <label>Files Scanned</label>
-                <div class="value">{r.total_files_scanned}</div>
-            </div>
-            <div class="meta-card">
-                <label>Total Issues</label>
-                <div class="value">{r.total_issues}</div>
-            </div>
-        </div>
-        
-        <div class="summary-grid">
-            <div class="severity-card critical">
-                <div class="count">{r.critical_count}</div>
-                <div class="label">Critical</div>
-            </div>
-            <div class="severity-card high">
-                <div class="count">{r.high_count}</div>
-                <div class="label">High</div>
-            </div>
-            <div class="severity-card medium">
-                <div class="count">{r.medium_count}</div>
-                <div class="label">Medium</div>
-            </div>
-            <div class="severity-card low">
-                <div class="count">{r.low_count}</div>
-                <div class="label">Low</div>
-            </div>
-            <div class="severity-card info">
-                <div class="count">{r.info_count}</div>
-                <div class="label">Info</div>
-            </div>
-        </div>
-'''
-        
-        # Issues by type section
-        if r.issues_by_type:
-            html += '''
-        <div class="section">
-            <div class="section-header">Issues by Type</div>
-            <div class="section-content">
-                <div class="issues-by-type">
-'''
-            for issue_type, count in sorted(r.issues_by_type.items(), key=lambda x: -x[1]):
-                html += f'''                    <div class="type-item">
-                        <span>{issue_type}</span>
-                        <span><strong>{count}</strong></span>
-                    </div>
-'''
-            html += '''                </div>
+        <div class="report-header">
+            <h1>CloudBolt Compatibility Report</h1>
+            <p class="subtitle">Django 5.2.x / Python 3.12.x</p>
+
+            <div class="meta-grid">
+                <div class="meta-card">
+                    <label>Scan Date</label>
+                    <div class="value">{e(header['scan_date'])}</div>
+                </div>
+                <div class="meta-card">
+                    <label>CloudBolt Version</label>
+                    <div class="value">{e(header['cloudbolt_version'])}</div>
+                </div>
+                <div class="meta-card">
+                    <label>Current Django</label>
+                    <div class="value">{e(header['current_django_version'])}</div>
+                </div>
+                <div class="meta-card">
+                    <label>Current Python</label>
+                    <div class="value">{e(header['current_python_version'])}</div>
+                </div>
+                <div class="meta-card">
+                    <label>Target Django</label>
+                    <div class="value">{e(header['target_django_version'])}</div>
+                </div>
+                <div class="meta-card">
+                    <label>Target Python</label>
+                    <div class="value">{e(header['target_python_version'])}</div>
+                </div>
             </div>
         </div>
-'''
-        
-        # Detailed findings
-        files_with_issues = [res for res in r.scan_results if res.issues or res.error]
-        
-        if files_with_issues:
-            html += '''
-        <div class="section">
+''')
+
+    def _write_result(self, result):
+        e = html.escape
+        out = []
+        if not self.files_written:
+            out.append('''
+        <div class="section report-findings">
             <div class="section-header">Detailed Findings</div>
             <div class="section-content">
-'''
-            for result in files_with_issues:
-                html += f'''
+''')
+        out.append(f'''
                 <div style="margin-bottom: 2rem;">
-                    <div class="file-path" style="margin-bottom: 0.5rem;">{result.file_path}</div>
-'''
-                if result.error:
-                    html += f'                    <p style="color: var(--critical);">Error: {result.error}</p>\n'
-                
-                if result.issues:
-                    html += '                    <ul class="issue-list">\n'
-                    for issue in result.issues:
-                        html += f'''                        <li class="issue-item {issue.severity}">
+                    <div class="file-path" style="margin-bottom: 0.5rem;">{e(result.file_path)}</div>
+''')
+        if result.error:
+            out.append(f'                    <p style="color: var(--critical);">Error: {e(result.error)}</p>\n')
+        if result.issues:
+            out.append('                    <ul class="issue-list">\n')
+            for issue in result.issues:
+                out.append(f'''                        <li class="issue-item {issue.severity}">
                             <div class="issue-header">
-                                <span class="issue-type">{issue.issue_type}</span>
+                                <span class="issue-type">{e(issue.issue_type)}</span>
                                 <span class="badge {issue.severity}">{issue.severity}</span>
                             </div>
                             <div class="issue-details">
-                                <p><strong>Line {issue.line_number}:</strong> {issue.description}</p>
-                                <p>Found: <code class="code">{issue.deprecated_code}</code></p>
-                                <p class="fix">Fix: {issue.recommended_fix}</p>
-'''
-                        if issue.django_version:
-                            html += f'                                <p><small>Django: {issue.django_version}</small></p>\n'
-                        if issue.python_version:
-                            html += f'                                <p><small>Python: {issue.python_version}</small></p>\n'
-                        html += '''                            </div>
+                                <p><strong>Line {issue.line_number}:</strong> {e(issue.description)}</p>
+                                <p>Found: <code class="code">{e(issue.deprecated_code)}</code></p>
+                                <p class="fix">Fix: {e(issue.recommended_fix)}</p>
+''')
+                if issue.django_version:
+                    out.append(f'                                <p><small>Django: {e(issue.django_version)}</small></p>\n')
+                if issue.python_version:
+                    out.append(f'                                <p><small>Python: {e(issue.python_version)}</small></p>\n')
+                out.append('''                            </div>
                         </li>
-'''
-                    html += '                    </ul>\n'
-                html += '                </div>\n'
-            
-            html += '''            </div>
+''')
+            out.append('                    </ul>\n')
+        out.append('                </div>\n')
+        self.stream.write(''.join(out))
+
+    def finish(self, stats):
+        out = []
+        if self.files_written:
+            out.append('''            </div>
         </div>
-'''
+''')
         else:
-            html += '''
-        <div class="section">
+            out.append('''
+        <div class="section report-findings">
             <div class="section-content no-issues">
                 No compatibility issues found.
             </div>
         </div>
-'''
-        
-        html += '''
+''')
+        out.append(f'''
+        <div class="report-summary">
+            <div class="meta-grid">
+                <div class="meta-card">
+                    <label>Files Scanned</label>
+                    <div class="value">{stats.total_files_scanned}</div>
+                </div>
+                <div class="meta-card">
+                    <label>Total Issues</label>
+                    <div class="value">{stats.total_issues}</div>
+                </div>
+            </div>
+
+            <div class="summary-grid">
+                <div class="severity-card critical">
+                    <div class="count">{stats.critical_count}</div>
+                    <div class="label">Critical</div>
+                </div>
+                <div class="severity-card high">
+                    <div class="count">{stats.high_count}</div>
+                    <div class="label">High</div>
+                </div>
+                <div class="severity-card medium">
+                    <div class="count">{stats.medium_count}</div>
+                    <div class="label">Medium</div>
+                </div>
+                <div class="severity-card low">
+                    <div class="count">{stats.low_count}</div>
+                    <div class="label">Low</div>
+                </div>
+                <div class="severity-card info">
+                    <div class="count">{stats.info_count}</div>
+                    <div class="label">Info</div>
+                </div>
+            </div>
+''')
+        if stats.issues_by_type:
+            out.append('''
+            <div class="section">
+                <div class="section-header">Issues by Type</div>
+                <div class="section-content">
+                    <div class="issues-by-type">
+''')
+            for issue_type, count in sorted(stats.issues_by_type.items(), key=lambda x: -x[1]):
+                out.append(f'''                        <div class="type-item">
+                            <span>{html.escape(issue_type)}</span>
+                            <span><strong>{count}</strong></span>
+                        </div>
+''')
+            out.append('''                    </div>
+                </div>
+            </div>
+''')
+        out.append('''        </div>
     </div>
 </body>
 </html>
-'''
-        return html
+''')
+        self.stream.write(''.join(out))
+
+
+# --output-format choices and the writer for each
+REPORT_WRITERS = {
+    'text': TextReportWriter,
+    'json': JsonReportWriter,
+    'jsonl': JsonLinesReportWriter,
+    'html': HtmlReportWriter,
+}
+
+
+class ReportGenerator:
+    """Generates compatibility reports in various formats from a complete CompatibilityReport."""
+
+    def __init__(self, report: CompatibilityReport):
+        self.report = report
+
+    def _render(self, writer_class) -> str:
+        buffer = io.StringIO()
+        writer = writer_class(buffer)
+        writer.start({key: getattr(self.report, key) for key in REPORT_HEADER_FIELDS})
+        for result in self.report.scan_results:
+            writer.write_result(result)
+        writer.finish(self.report)
+        return buffer.getvalue()
+
+    def to_json(self) -> str:
+        """Generate JSON report."""
+        return self._render(JsonReportWriter)
+
+    def to_jsonl(self) -> str:
+        """Generate JSON Lines report."""
+        return self._render(JsonLinesReportWriter)
+
+    def to_text(self) -> str:
+        """Generate plain text report."""
+        return self._render(TextReportWriter)
+
+    def to_html(self) -> str:
+        """Generate HTML report."""
+        return self._render(HtmlReportWriter)
 
 
 def get_version_info() -> Tuple[str, str, str]:
@@ -1543,7 +2108,7 @@ def main():
     )
     parser.add_argument(
         '--output-format', 
-        choices=['json', 'html', 'text'], 
+        choices=['json', 'jsonl', 'html', 'text'], 
         default='text',
         help='Output format for the report (default: text)'
     )
@@ -1567,11 +2132,31 @@ def main():
         nargs='*',
         help='Additional paths to scan'
     )
+    parser.add_argument(
+        '--jobs', '-j',
+        type=int,
+        default=1,
+        help='Number of worker processes for scanning files; 0 uses all CPUs (default: 1)'
+    )
+    parser.add_argument(
+        '--cache-file',
+        default=DEFAULT_CACHE_FILE,
+        help=f'SQLite cache of results for unchanged files (default: {DEFAULT_CACHE_FILE})'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Rescan every file and do not read or update the scan cache'
+    )
     
     args = parser.parse_args()
     
     # Initialize scanner
-    scanner = CompatibilityScanner(verbose=args.verbose)
+    scanner = CompatibilityScanner(
+        verbose=args.verbose,
+        jobs=args.jobs,
+        cache_file=None if args.no_cache else args.cache_file,
+    )
     
     # Get version info
     cloudbolt_version, django_version, python_version = get_version_info()
@@ -1587,8 +2172,6 @@ def main():
     print("=" * 60)
     print()
     
-    all_results = []
-    
     # Standard customer directories to scan
     customer_directories = [
         '/var/opt/cloudbolt/proserv/',
@@ -1600,101 +2183,77 @@ def main():
     if args.additional_paths:
         customer_directories.extend(args.additional_paths)
     
-    # Scan directories
-    for directory in customer_directories:
-        print(f"Scanning directory: {directory}")
-        results = scanner.scan_directory(directory)
-        all_results.extend(results)
-        issues_count = sum(len(r.issues) for r in results)
-        print(f"  Found {len(results)} files, {issues_count} issues")
-    
-    # Scan database plugins
-    if args.scan_database:
-        print("\nScanning database plugins...")
-        db_results = scanner.scan_database_plugins()
-        all_results.extend(db_results)
-        issues_count = sum(len(r.issues) for r in db_results)
-        print(f"  Found {len(db_results)} plugins, {issues_count} issues")
-    
-    print()
-    
-    # Calculate statistics
-    total_issues = sum(len(r.issues) for r in all_results)
-    critical_count = sum(1 for r in all_results for i in r.issues if i.severity == 'CRITICAL')
-    high_count = sum(1 for r in all_results for i in r.issues if i.severity == 'HIGH')
-    medium_count = sum(1 for r in all_results for i in r.issues if i.severity == 'MEDIUM')
-    low_count = sum(1 for r in all_results for i in r.issues if i.severity == 'LOW')
-    info_count = sum(1 for r in all_results for i in r.issues if i.severity == 'INFO')
-    
-    issues_by_type = defaultdict(int)
-    for result in all_results:
-        for issue in result.issues:
-            issues_by_type[issue.issue_type] += 1
-    
-    # Create report
-    report = CompatibilityReport(
-        scan_date=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        cloudbolt_version=cloudbolt_version,
-        current_django_version=django_version,
-        current_python_version=python_version,
-        target_django_version='5.2.x',
-        target_python_version='3.12.x',
-        total_files_scanned=len(all_results),
-        total_issues=total_issues,
-        critical_count=critical_count,
-        high_count=high_count,
-        medium_count=medium_count,
-        low_count=low_count,
-        info_count=info_count,
-        issues_by_type=dict(issues_by_type),
-        scan_results=all_results,
-    )
-    
-    # Generate report
-    generator = ReportGenerator(report)
-    
     # Default output directory
     output_dir = '/var/tmp'
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    writer_class = REPORT_WRITERS[args.output_format]
+    default_file = f'{output_dir}/cloudbolt_compatibility_report_{timestamp}.{writer_class.extension}'
+    output_file = args.output_file or default_file
     
-    if args.output_format == 'json':
-        output = generator.to_json()
-        default_file = f'{output_dir}/cloudbolt_compatibility_report_{timestamp}.json'
-    elif args.output_format == 'html':
-        output = generator.to_html()
-        default_file = f'{output_dir}/cloudbolt_compatibility_report_{timestamp}.html'
-    else:
-        output = generator.to_text()
-        default_file = f'{output_dir}/cloudbolt_compatibility_report_{timestamp}.txt'
+    header = {
+        'scan_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'cloudbolt_version': cloudbolt_version,
+        'current_django_version': django_version,
+        'current_python_version': python_version,
+        'target_django_version': '5.2.x',
+        'target_python_version': '3.12.x',
+    }
     
-    # Write output
-    output_file = args.output_file or default_file
+    # Each file's findings are written to the report as soon as it is scanned,
+    # so memory use does not grow with the number of issues.
+    stats = ReportStats()
+    with open(output_file, 'w', encoding='utf-8') as f:
+        writer = writer_class(f)
+        writer.start(header)
+        
+        # Scan directories
+        for directory in customer_directories:
+            print(f"Scanning directory: {directory}")
+            directory_stats = ReportStats()
+            for result in scanner.iter_scan_directory(directory):
+                stats.add(result)
+                directory_stats.add(result)
+                writer.write_result(result)
+            print(f"  Found {directory_stats.total_files_scanned} files, {directory_stats.total_issues} issues")
+        
+        # Scan database plugins
+        if args.scan_database:
+            print("\nScanning database plugins...")
+            db_stats = ReportStats()
+            for result in scanner.iter_scan_database_plugins():
+                stats.add(result)
+                db_stats.add(result)
+                writer.write_result(result)
+            print(f"  Found {db_stats.total_files_scanned} plugins, {db_stats.total_issues} issues")
+        
+        writer.finish(stats)
     
-    if output_file:
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(output)
-        print(f"Report written to: {output_file}")
-    else:
-        print(output)
+    if scanner.cache is not None:
+        print(f"\nScan cache: {scanner.cache.hits} unchanged files reused, "
+              f"{scanner.cache.misses} scanned ({scanner.cache.cache_file})")
+        scanner.cache.close()
+    
+    print()
+    print(f"Report written to: {output_file}")
     
     # Print summary
     print()
     print("=" * 60)
     print("SUMMARY")
     print("=" * 60)
-    print(f"Total Files Scanned: {len(all_results)}")
-    print(f"Total Issues Found: {total_issues}")
-    print(f"  CRITICAL: {critical_count}")
-    print(f"  HIGH:     {high_count}")
-    print(f"  MEDIUM:   {medium_count}")
-    print(f"  LOW:      {low_count}")
-    print(f"  INFO:     {info_count}")
+    print(f"Total Files Scanned: {stats.total_files_scanned}")
+    print(f"Total Issues Found: {stats.total_issues}")
+    print(f"  CRITICAL: {stats.critical_count}")
+    print(f"  HIGH:     {stats.high_count}")
+    print(f"  MEDIUM:   {stats.medium_count}")
+    print(f"  LOW:      {stats.low_count}")
+    print(f"  INFO:     {stats.info_count}")
     print()
     
-    if critical_count > 0:
+    if stats.critical_count > 0:
         print("CRITICAL issues found. Fix before upgrading.")
         sys.exit(1)
-    elif high_count > 0:
+    elif stats.high_count > 0:
         print("HIGH priority issues found. Fix before upgrading.")
         sys.exit(0)
     else:
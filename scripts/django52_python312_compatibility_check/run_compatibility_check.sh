@@ -11,9 +11,10 @@
 #   ./run_compatibility_check.sh [options]
 #
 # Options:
-#   --format <json|html|text>   Output format (default: text)
+#   --format <json|jsonl|html|text> Output format (default: text)
 #   --output <filename>         Output file name
 #   --verbose                   Enable verbose output
+#   --jobs <N>                  Worker processes for scanning (0 = all CPUs)
 #   --help                      Show this help message
 #
 
@@ -30,6 +31,7 @@ NC='\033[0m' # No Color
 OUTPUT_FORMAT="text"
 OUTPUT_FILE=""
 VERBOSE=""
+JOBS=""
 SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 PYTHON_SCRIPT="${SCRIPT_DIR}/django52_python312_compatibility_check.py"
 
@@ -48,9 +50,10 @@ print_help() {
     echo "Usage: $0 [options]"
     echo ""
     echo "Options:"
-    echo "  --format <json|html|text>   Output format (default: text)"
+    echo "  --format <json|jsonl|html|text> Output format (default: text)"
     echo "  --output <filename>         Output file path (default: /var/tmp/)"
     echo "  --verbose                   Enable verbose output"
+    echo "  --jobs <N>                  Worker processes for scanning (0 = all CPUs)"
     echo "  --help                      Show this help message"
     echo ""
     echo "Output Location: ${OUTPUT_DIR}/"
@@ -60,6 +63,7 @@ print_help() {
     echo "  $0 --format json            # Generate JSON report in /var/tmp/"
     echo "  $0 --format html            # Generate HTML report in /var/tmp/"
     echo "  $0 --verbose                # Show detailed scanning progress"
+    echo "  $0 --jobs 0                 # Scan files in parallel on all CPUs"
     echo ""
     echo "Note: This script automatically uses CloudBolt's Python environment."
 }
@@ -121,6 +125,10 @@ parse_args() {
                 VERBOSE="--verbose"
                 shift
                 ;;
+            --jobs|-j)
+                JOBS="$2"
+                shift 2
+                ;;
             --help|-h)
                 print_help
                 exit 0
@@ -135,10 +143,10 @@ parse_args() {
     
     # Validate format
     case $OUTPUT_FORMAT in
-        json|html|text)
+        json|jsonl|html|text)
             ;;
         *)
-            echo -e "${RED}Invalid format: ${OUTPUT_FORMAT}. Use json, html, or text.${NC}"
+            echo -e "${RED}Invalid format: ${OUTPUT_FORMAT}. Use json, jsonl, html, or text.${NC}"
             exit 1
             ;;
     esac
@@ -160,6 +168,10 @@ run_scan() {
         CMD="${CMD} ${VERBOSE}"
     fi
     
+    if [ -n "${JOBS}" ]; then
+        CMD="${CMD} --jobs ${JOBS}"
+    fi
+    
     # Run the scanner
     eval ${CMD}
     EXIT_CODE=$?
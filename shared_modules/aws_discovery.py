@@ -0,0 +1,273 @@
+"""
+Concurrent discovery executor for AWS blueprint sync.py plugins.
+
+Discovery plugins used to loop over every AWS resource handler and every one
+of its regions, making one blocking boto3 call after another. This Shared
+Module fans the (handler, region) work units out over a bounded thread pool
+instead:
+
+* One boto3 client is created per (account, region, service), through the
+  handler's API wrapper so its credential and proxy settings apply, and is
+  reused by every unit that needs it.
+* At most `max_per_account` units run against the same account at once, so a
+  large sync does not trip the account's API rate limits. A unit that is
+  throttled anyway is re-run after a jittered exponential backoff, and its
+  account's limit is halved, then raised again one unit at a time as its
+  units succeed.
+* Results are merged in unit order (handlers by id, regions sorted), so the
+  discovered list is the same from one run to the next regardless of which
+  calls finish first.
+
+Consume this Shared Module in a discovery plugin:
+from shared_modules.aws_discovery import discover_aws_resources
+
+def discover_resources(**kwargs):
+    def discover(client, handler, region):
+        for page in client.get_paginator('describe_file_systems').paginate():
+            for efs in page['FileSystems']:
+                yield {'name': efs['FileSystemId'], 'aws_rh_id': handler.id, 'aws_region': region}
+
+    return discover_aws_resources('efs', discover)
+"""
+import heapq
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from botocore.exceptions import ClientError
+
+from common.methods import set_progress
+from infrastructure.models import Environment
+from resourcehandlers.aws.models import AWSHandler
+from utilities.logger import ThreadLogger
+
+logger = ThreadLogger(__name__)
+
+# Work units running at once, across all accounts
+MAX_WORKERS = 16
+# Work units running at once against any single account
+MAX_PER_ACCOUNT = 4
+# Times a throttled work unit is run before giving up on it
+MAX_ATTEMPTS = 5
+# Backoff before re-running a throttled unit, in seconds: BACKOFF_BASE doubled
+# for each attempt, capped at BACKOFF_MAX, then jittered between half and all
+# of that
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+# ClientError codes AWS services use for rate limiting
+THROTTLING_CODES = frozenset(
+    ['Throttling', 'ThrottlingException', 'RequestLimitExceeded', 'TooManyRequestsException'])
+
+
+def is_throttling(error):
+    """Whether ``error`` is an AWS rate limiting error."""
+    return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in THROTTLING_CODES
+
+
+def backoff_delay(attempt):
+    """Seconds to wait before running a unit throttled ``attempt`` times again."""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+    return random.uniform(delay / 2, delay)
+
+
+def handler_region_units(handlers=None, per_region=True):
+    """
+    Return the (handler, region) work units for ``handlers`` (all AWS resource
+    handlers by default), ordered by handler id and region name. With
+    ``per_region=False`` each handler gets a single unit with region None, for
+    global services such as S3.
+    """
+    if handlers is None:
+        handlers = AWSHandler.objects.all()
+    units = []
+    for handler in sorted(handlers, key=lambda h: h.id):
+        if not per_region:
+            units.append((handler, None))
+            continue
+        try:
+            regions = sorted({region for region in handler.current_regions() if region})
+        except Exception as e:
+            set_progress(f"Could not get regions for handler {handler}: {e}")
+            continue
+        units.extend((handler, region) for region in regions)
+    return units
+
+
+def environment_region_units(environments=None):
+    """
+    Return (units, env_ids) for plugins that record an environment on the
+    discovered resources: one (handler, region) unit per region used by
+    ``environments`` (all AWS environments by default), and a dict mapping
+    (handler id, region) to the id of the first environment in that region.
+    """
+    if environments is None:
+        environments = Environment.objects.filter(
+            resource_handler__resource_technology__name="Amazon Web Services")
+    env_ids = {}
+    units = []
+    for env in environments.order_by('id'):
+        if not env.aws_region:
+            continue
+        key = (env.resource_handler_id, env.aws_region)
+        if key not in env_ids:
+            env_ids[key] = env.id
+            units.append((env.resource_handler.cast(), env.aws_region))
+    return units, env_ids
+
+
+class AWSDiscoveryExecutor:
+    """
+    Runs a discovery function over (handler, region) work units concurrently.
+
+    ``discover(client, handler, region)`` is called once per unit from a worker
+    thread with a boto3 client for that account and region, and returns or
+    yields the discovered resource dicts. It should only make AWS calls; the
+    Django ORM and set_progress are used from the calling thread.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, max_per_account=MAX_PER_ACCOUNT, max_attempts=MAX_ATTEMPTS):
+        self.max_workers = max_workers
+        self.max_per_account = max_per_account
+        self.max_attempts = max_attempts
+        # API wrappers by handler id, created from the calling thread
+        self._wrappers = {}
+        # Each client is built once, under its own lock, so clients for
+        # different accounts and regions are built in parallel; _lock only
+        # guards the two dicts
+        self._lock = threading.Lock()
+        self._client_locks = defaultdict(threading.Lock)
+        self._clients = {}
+
+    def client(self, handler, region, service):
+        """Return the shared boto3 client for this account, region and service."""
+        key = (handler.id, region, service)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                return client
+            key_lock = self._client_locks[key]
+        with key_lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self._wrappers[handler.id].get_boto3_client(
+                    service, handler.serviceaccount, handler.servicepasswd, region)
+                with self._lock:
+                    self._clients[key] = client
+        return client
+
+    def _prepare_wrappers(self, units):
+        """
+        Get the API wrapper of every handler in ``units``, and return the units
+        of the handlers that have one.
+        """
+        ready = []
+        for handler, region in units:
+            if handler.id not in self._wrappers:
+                try:
+                    self._wrappers[handler.id] = handler.get_api_wrapper()
+                except Exception as e:
+                    set_progress(f"Could not get wrapper for handler {handler}: {e}")
+                    self._wrappers[handler.id] = None
+            if self._wrappers[handler.id] is not None:
+                ready.append((handler, region))
+        return ready
+
+    def _run_unit(self, service, discover, handler, region):
+        return list(discover(self.client(handler, region, service), handler, region))
+
+    def run(self, units, service, discover, unique_key=None):
+        """
+        Discover resources for every (handler, region) in ``units`` and return
+        them merged in unit order. Throttled units are retried up to
+        max_attempts times; units that still fail, or raise anything else, are
+        reported and skipped. When ``unique_key`` is given, only the first
+        resource for each key is kept.
+        """
+        units = self._prepare_wrappers(units)
+        results = [[] for _ in units]
+        pending = defaultdict(deque)
+        for index, (handler, _region) in enumerate(units):
+            pending[handler.id].append(index)
+        # Units waiting out a backoff, as (time to run again, index)
+        delayed = []
+        attempts = defaultdict(int)
+        # Units allowed at once per account, lowered while it is throttled
+        account_limit = defaultdict(lambda: self.max_per_account)
+        account_in_flight = defaultdict(int)
+        in_flight = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while in_flight or delayed or any(pending.values()):
+                now = time.monotonic()
+                while delayed and delayed[0][0] <= now:
+                    index = heapq.heappop(delayed)[1]
+                    pending[units[index][0].id].appendleft(index)
+
+                # Round-robin over accounts so one large account does not
+                # take every worker
+                submitted = True
+                while submitted and len(in_flight) < self.max_workers:
+                    submitted = False
+                    for account, queue in pending.items():
+                        if (queue and account_in_flight[account] < account_limit[account]
+                                and len(in_flight) < self.max_workers):
+                            index = queue.popleft()
+                            handler, region = units[index]
+                            account_in_flight[account] += 1
+                            attempts[index] += 1
+                            future = executor.submit(self._run_unit, service, discover, handler, region)
+                            in_flight[future] = index
+                            submitted = True
+
+                timeout = max(0, delayed[0][0] - time.monotonic()) if delayed else None
+                if not in_flight:
+                    time.sleep(timeout)
+                    continue
+                done, _ = wait(list(in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = in_flight.pop(future)
+                    handler, region = units[index]
+                    account_in_flight[handler.id] -= 1
+                    where = f"handler {handler}" + (f" in {region}" if region else "")
+                    try:
+                        results[index] = future.result()
+                    except Exception as e:
+                        if is_throttling(e) and attempts[index] < self.max_attempts:
+                            account_limit[handler.id] = max(1, account_limit[handler.id] // 2)
+                            delay = backoff_delay(attempts[index])
+                            logger.info(f"Throttled discovering {service} resources for {where}, retrying in "
+                                        f"{delay:.1f}s with at most {account_limit[handler.id]} unit(s) at once")
+                            heapq.heappush(delayed, (time.monotonic() + delay, index))
+                            continue
+                        set_progress(f"Could not discover {service} resources for {where}: {e}")
+                        continue
+                    account_limit[handler.id] = min(self.max_per_account, account_limit[handler.id] + 1)
+                    logger.debug(f"Discovered {len(results[index])} {service} resource(s) for {where}")
+
+        merged = []
+        seen = set()
+        for unit_results in results:
+            for resource in unit_results:
+                if unique_key is not None:
+                    key = unique_key(resource)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                merged.append(resource)
+        return merged
+
+
+def discover_aws_resources(service, discover, handlers=None, units=None, per_region=True, unique_key=None,
+                           max_workers=MAX_WORKERS, max_per_account=MAX_PER_ACCOUNT):
+    """
+    Run ``discover`` for every AWS resource handler and region (or the given
+    ``units``) and return the merged list of discovered resources. See
+    AWSDiscoveryExecutor.run for the arguments.
+    """
+    if units is None:
+        units = handler_region_units(handlers, per_region=per_region)
+    set_progress(f"Discovering {service} resources in {len(units)} handler/region pair(s).")
+    executor = AWSDiscoveryExecutor(max_workers=max_workers, max_per_account=max_per_account)
+    return executor.run(units, service, discover, unique_key=unique_key)
@@ -0,0 +1,163 @@
+"""
+Bulk power operations for CloudBolt Plugins that power many servers on or off.
+
+Calling server.power_off() for one server after another means a large
+end-of-day shutdown takes as long as every power call added up. This Shared
+Module runs the calls on a bounded thread pool instead:
+
+* The target servers are loaded with one query (resource handlers included),
+  e.g. every server with a tag via servers_with_tag().
+* Servers already in the requested state are skipped.
+* At most `max_per_handler` calls run against the same resource handler at
+  once, so one vCenter or cloud account is not flooded, and handlers are
+  served round-robin so a large one does not take every worker.
+* Progress and failures are reported in aggregate, and server history events
+  are written from the calling thread in batches once the calls are done.
+
+Consume this Shared Module in a CloudBolt Plugin:
+from shared_modules.bulk_power import power_servers
+
+def run(job, **kwargs):
+    result = power_servers(job.server_set.all(), 'OFF', job=job,
+                           event_message=lambda server: 'Powered off at end of day.')
+    if result.failed:
+        return 'FAILURE', '', result.summary()
+    return '', '', ''
+"""
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+
+from common.methods import set_progress
+from infrastructure.models import Server
+from tags.models import TaggedItem
+from utilities import events
+from utilities.logger import ThreadLogger
+
+logger = ThreadLogger(__name__)
+
+# Power calls running at once, across all resource handlers
+MAX_WORKERS = 16
+# Power calls running at once against any single resource handler
+MAX_PER_HANDLER = 4
+# Report progress every this many finished servers
+PROGRESS_EVERY = 100
+# Server history events written per transaction
+EVENT_BATCH_SIZE = 200
+
+# desired state -> (Server method, power_status that means it is already done)
+POWER_ACTIONS = {
+    'ON': ('power_on', 'POWERON'),
+    'OFF': ('power_off', 'POWEROFF'),
+}
+
+
+def servers_with_tag(tag_name):
+    """All servers tagged ``tag_name``, with their resource handlers, in one query."""
+    tagged_ids = TaggedItem.objects.filter(
+        tag__name=tag_name,
+        content_type=ContentType.objects.get_for_model(Server),
+    ).values('object_id')
+    return Server.objects.filter(id__in=tagged_ids).select_related('resource_handler')
+
+
+class BulkPowerResult:
+    """Outcome of a bulk power operation."""
+
+    def __init__(self, desired_state):
+        self.desired_state = desired_state
+        self.succeeded = []
+        self.skipped = []
+        # [(server, error message)]
+        self.failed = []
+
+    def summary(self):
+        lines = [
+            f"Powered {self.desired_state.lower()} {len(self.succeeded)} server(s), "
+            f"{len(self.skipped)} already {self.desired_state.lower()}, {len(self.failed)} failed."
+        ]
+        lines.extend(f"{server.hostname}: {error}" for server, error in self.failed)
+        return "\n".join(lines)
+
+
+def _power(server, method):
+    try:
+        return getattr(server, method)()
+    finally:
+        # Worker threads get their own database connection; don't leave it open
+        connection.close()
+
+
+def _record_events(servers, event_message, job):
+    for start in range(0, len(servers), EVENT_BATCH_SIZE):
+        with transaction.atomic():
+            for server in servers[start:start + EVENT_BATCH_SIZE]:
+                events.add_server_event('MODIFICATION', server, event_message(server), job=job)
+
+
+def power_servers(servers, desired_state, job=None, event_message=None,
+                  max_workers=MAX_WORKERS, max_per_handler=MAX_PER_HANDLER):
+    """
+    Power ``servers`` (a queryset or list) to ``desired_state`` ('ON' or
+    'OFF'), skipping those already there, and return a BulkPowerResult.
+
+    When ``event_message(server)`` is given, a MODIFICATION history event with
+    that message is added for each server powered successfully.
+    """
+    method, done_status = POWER_ACTIONS[desired_state]
+    if hasattr(servers, 'select_related'):
+        servers = servers.select_related('resource_handler')
+    progress = job.set_progress if job else set_progress
+
+    result = BulkPowerResult(desired_state)
+    pending = defaultdict(deque)
+    total = 0
+    for server in servers:
+        if server.power_status == done_status:
+            result.skipped.append(server)
+            continue
+        pending[server.resource_handler_id].append(server)
+        total += 1
+    progress(f"Powering {desired_state.lower()} {total} server(s) on {len(pending)} resource handler(s), "
+             f"{len(result.skipped)} already {desired_state.lower()}.")
+
+    handler_in_flight = defaultdict(int)
+    in_flight = {}
+    finished = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while in_flight or any(pending.values()):
+            # Round-robin over resource handlers so one large handler does
+            # not take every worker
+            submitted = True
+            while submitted and len(in_flight) < max_workers:
+                submitted = False
+                for handler_id, queue in pending.items():
+                    if (queue and handler_in_flight[handler_id] < max_per_handler
+                            and len(in_flight) < max_workers):
+                        server = queue.popleft()
+                        handler_in_flight[handler_id] += 1
+                        in_flight[executor.submit(_power, server, method)] = server
+                        submitted = True
+
+            done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for future in done:
+                server = in_flight.pop(future)
+                handler_in_flight[server.resource_handler_id] -= 1
+                finished += 1
+                try:
+                    if future.result():
+                        result.succeeded.append(server)
+                    else:
+                        result.failed.append((server, f"power {desired_state.lower()} failed, see logs"))
+                except Exception as e:
+                    logger.exception(f"Could not power {desired_state.lower()} {server.hostname}")
+                    result.failed.append((server, str(e)))
+                if finished % PROGRESS_EVERY == 0:
+                    progress(f"{finished}/{total} server(s) done, {len(result.failed)} failed.")
+
+    if event_message and result.succeeded:
+        _record_events(result.succeeded, event_message, job)
+    progress(result.summary())
+    return result
@@ -0,0 +1,203 @@
+"""
+Concurrent HTTP health check engine used by the resource health checks rule
+(rules/health_checks/resource_health_checks.py).
+
+Health check attempts run on a bounded thread pool that shares one
+keep-alive connection pool per host. Retries are not slept on by the worker
+threads: a failed attempt is put back on a schedule with exponential backoff,
+and the dispatcher hands it to the pool again once it is due. A per-host limit
+keeps many resources behind the same endpoint from being hit all at once.
+
+This module only depends on `requests`, so it can be exercised outside of
+CloudBolt (see rules/health_checks/benchmark_health_checks.py).
+
+Consume this Shared Module in a CloudBolt Plugin:
+from shared_modules.health_check_engine import HealthCheck, HealthCheckEngine
+"""
+import heapq
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Defaults for the optional health check config parameters (see README.md)
+DEFAULT_TIMEOUT_SECONDS = 3
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_INTERVAL_SECONDS = 1
+DEFAULT_RETRY_BACKOFF = 2
+# Upper bound on the wait between two attempts of the same check
+MAX_RETRY_INTERVAL_SECONDS = 60
+
+
+@dataclass
+class HealthCheck:
+    """A single configured health check. ``key`` identifies its owner, e.g. a resource id."""
+    key: Any
+    name: str
+    url: str
+    accepted_status_codes: Optional[List[int]] = None
+    timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS
+    max_retries: int = DEFAULT_MAX_RETRIES
+    retry_interval_seconds: float = DEFAULT_RETRY_INTERVAL_SECONDS
+    retry_backoff: float = DEFAULT_RETRY_BACKOFF
+
+    @classmethod
+    def from_config(cls, key, config: Dict[str, Any]) -> "HealthCheck":
+        """Build a HealthCheck from one entry of a health_check_config 'health_checks' list."""
+        return cls(
+            key=key,
+            name=config.get('name'),
+            url=config.get('url'),
+            accepted_status_codes=config.get('accepted_status_codes'),
+            timeout_seconds=config.get('timeout_seconds', DEFAULT_TIMEOUT_SECONDS),
+            max_retries=config.get('max_retries', DEFAULT_MAX_RETRIES),
+            retry_interval_seconds=config.get('retry_interval_seconds', DEFAULT_RETRY_INTERVAL_SECONDS),
+            retry_backoff=config.get('retry_backoff', DEFAULT_RETRY_BACKOFF),
+        )
+
+    @property
+    def host(self) -> str:
+        return urlsplit(self.url).netloc or self.url
+
+    def retry_delay(self, attempt: int) -> float:
+        """Seconds to wait after failed attempt number ``attempt`` (1-based)."""
+        delay = self.retry_interval_seconds * (self.retry_backoff ** (attempt - 1))
+        return min(delay, MAX_RETRY_INTERVAL_SECONDS)
+
+    def accepts(self, status_code: int) -> bool:
+        return not self.accepted_status_codes or status_code in self.accepted_status_codes
+
+
+@dataclass
+class HealthCheckOutcome:
+    """Final result of a health check after all of its attempts."""
+    check: HealthCheck
+    passed: bool = False
+    attempts: int = 0
+    status_code: Optional[int] = None
+    error: Optional[str] = None
+    # Response time of the last attempt, in seconds
+    latency_seconds: Optional[float] = None
+    latencies: List[float] = field(default_factory=list)
+
+
+class HealthCheckEngine:
+    """
+    Runs health checks concurrently.
+
+    Call run() with a list of HealthCheck objects; it blocks until every check
+    has passed or used up its retries, and returns one HealthCheckOutcome per
+    check in the same order.
+    """
+
+    def __init__(self, max_workers: int = 32, max_per_host: int = 4,
+                 session: Optional[requests.Session] = None, logger=None):
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.logger = logger
+        self.session = session or self._build_session()
+
+    def _build_session(self) -> requests.Session:
+        session = requests.Session()
+        # pool_maxsize matches the per-host limit, so every in-flight request
+        # to a host can reuse a kept-alive connection.
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_per_host)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _log(self, message: str):
+        if self.logger:
+            self.logger.debug(message)
+
+    def _attempt(self, check: HealthCheck):
+        """Send one request. Returns (status_code, error, latency_seconds)."""
+        start = time.monotonic()
+        try:
+            response = self.session.get(check.url, timeout=check.timeout_seconds)
+            # Read the body so the connection goes back to the pool
+            response.content
+            return response.status_code, None, time.monotonic() - start
+        except Exception as e:
+            # Could be ConnectionError, Timeout, MissingSchema..., all count as a failure.
+            return None, str(e), time.monotonic() - start
+
+    def run(self, checks: List[HealthCheck],
+            on_complete: Optional[Callable[[HealthCheckOutcome], None]] = None) -> List[HealthCheckOutcome]:
+        """
+        Run all ``checks`` and return their outcomes in input order.
+
+        ``on_complete`` is called from the calling thread as each check
+        finishes, e.g. to report progress.
+        """
+        outcomes = [HealthCheckOutcome(check=check) for check in checks]
+        # (due_time, sequence, check_index); sequence keeps ordering stable
+        schedule = [(0.0, index, index) for index in range(len(checks))]
+        heapq.heapify(schedule)
+        sequence = len(checks)
+        # Due attempts waiting for their host to have a free slot
+        host_queues = defaultdict(deque)
+        host_in_flight = defaultdict(int)
+        in_flight = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            def submit(index):
+                check = checks[index]
+                host_in_flight[check.host] += 1
+                in_flight[executor.submit(self._attempt, check)] = index
+
+            while schedule or in_flight or any(host_queues.values()):
+                now = time.monotonic()
+                while schedule and schedule[0][0] <= now:
+                    _, _, index = heapq.heappop(schedule)
+                    host_queues[checks[index].host].append(index)
+
+                for host, queue in host_queues.items():
+                    while queue and host_in_flight[host] < self.max_per_host and len(in_flight) < self.max_workers:
+                        submit(queue.popleft())
+
+                if not in_flight:
+                    # Nothing running: sleep until the next retry is due
+                    if schedule:
+                        time.sleep(max(0.0, schedule[0][0] - time.monotonic()))
+                    continue
+
+                timeout = max(0.0, schedule[0][0] - now) if schedule else None
+                done, _ = wait(list(in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = in_flight.pop(future)
+                    check = checks[index]
+                    host_in_flight[check.host] -= 1
+                    status_code, error, latency = future.result()
+
+                    outcome = outcomes[index]
+                    outcome.attempts += 1
+                    outcome.status_code = status_code
+                    outcome.error = error
+                    outcome.latency_seconds = latency
+                    outcome.latencies.append(latency)
+
+                    if status_code is not None and check.accepts(status_code):
+                        outcome.passed = True
+                    elif outcome.attempts <= check.max_retries:
+                        if status_code is not None:
+                            self._log(
+                                f"HTTP Request returned {status_code}, which is not in the accepted "
+                                f"statuses: {check.accepted_status_codes} for health check '{check.name}'."
+                            )
+                        else:
+                            self._log(f"Health check '{check.name}' failed: {error}")
+                        heapq.heappush(schedule, (time.monotonic() + check.retry_delay(outcome.attempts),
+                                                  sequence, index))
+                        sequence += 1
+                        continue
+
+                    if on_complete:
+                        on_complete(outcome)
+
+        return outcomes
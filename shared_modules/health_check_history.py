@@ -0,0 +1,165 @@
+"""
+Health check history store used by the resource health checks rule
+(rules/health_checks/resource_health_checks.py).
+
+Every health check outcome is appended to an SQLite table of raw samples
+(time, pass/fail, latency). Samples older than the raw retention period are
+compacted into hourly rollups holding the sample and failure counts plus the
+p50/p95/max latency for that hour; rollups older than the rollup retention
+period are deleted. This keeps the store bounded while still giving a
+baseline to compare the latest latencies against.
+
+This module only uses the standard library, so it can be exercised outside
+of CloudBolt.
+
+Consume this Shared Module in a CloudBolt Plugin:
+from shared_modules.health_check_history import HealthCheckHistory
+"""
+import math
+import sqlite3
+import time
+from statistics import median
+from typing import Iterable, List, Optional, Tuple
+
+# SQLite file that keeps each check's status and latency between runs
+DEFAULT_HISTORY_DB = '/var/opt/cloudbolt/proserv/health_check_history.sqlite3'
+
+HOUR = 3600
+DAY = 24 * HOUR
+# Raw samples are kept this long before being rolled up
+RAW_RETENTION_SECONDS = 2 * DAY
+# Hourly rollups are kept this long
+ROLLUP_RETENTION_SECONDS = 90 * DAY
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of ``values``; None when empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def count_transitions(statuses: List[bool]) -> int:
+    """Number of pass <-> fail changes in a sequence of check statuses."""
+    return sum(1 for previous, current in zip(statuses, statuses[1:]) if previous != current)
+
+
+class HealthCheckHistory:
+    """Append-only sample table plus hourly rollups, keyed by (resource_id, check_name)."""
+
+    def __init__(self, path: str = DEFAULT_HISTORY_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS check_samples (
+                resource_id INTEGER NOT NULL,
+                check_name TEXT NOT NULL,
+                ts INTEGER NOT NULL,
+                passed INTEGER NOT NULL,
+                latency_ms REAL
+            );
+            CREATE INDEX IF NOT EXISTS check_samples_key_ts
+                ON check_samples (resource_id, check_name, ts);
+            CREATE TABLE IF NOT EXISTS check_rollups (
+                resource_id INTEGER NOT NULL,
+                check_name TEXT NOT NULL,
+                bucket_start INTEGER NOT NULL,
+                samples INTEGER NOT NULL,
+                failures INTEGER NOT NULL,
+                latency_p50_ms REAL,
+                latency_p95_ms REAL,
+                latency_max_ms REAL,
+                PRIMARY KEY (resource_id, check_name, bucket_start)
+            );
+        ''')
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def record(self, samples: Iterable[Tuple[int, str, bool, Optional[float]]], ts: Optional[int] = None):
+        """Append (resource_id, check_name, passed, latency_ms) samples taken at ``ts``."""
+        ts = int(ts if ts is not None else time.time())
+        with self.conn:
+            self.conn.executemany(
+                'INSERT INTO check_samples (resource_id, check_name, ts, passed, latency_ms) VALUES (?, ?, ?, ?, ?)',
+                [(resource_id, name, ts, int(passed), latency_ms)
+                 for resource_id, name, passed, latency_ms in samples],
+            )
+
+    def recent_statuses(self, resource_id: int, check_name: str, limit: int) -> List[bool]:
+        """The last ``limit`` pass/fail statuses, oldest first."""
+        rows = self.conn.execute(
+            'SELECT passed FROM check_samples WHERE resource_id = ? AND check_name = ?'
+            ' ORDER BY ts DESC, rowid DESC LIMIT ?',
+            (resource_id, check_name, limit),
+        ).fetchall()
+        return [bool(row[0]) for row in reversed(rows)]
+
+    def flap_count(self, resource_id: int, check_name: str, window: int) -> int:
+        """Pass/fail transitions within the last ``window`` samples."""
+        return count_transitions(self.recent_statuses(resource_id, check_name, window))
+
+    def latency_percentile(self, resource_id: int, check_name: str, since: int, pct: float = 95) -> Optional[float]:
+        """Percentile of passing-sample latency (ms) recorded at or after ``since``."""
+        rows = self.conn.execute(
+            'SELECT latency_ms FROM check_samples WHERE resource_id = ? AND check_name = ?'
+            ' AND ts >= ? AND passed = 1 AND latency_ms IS NOT NULL',
+            (resource_id, check_name, since),
+        ).fetchall()
+        return percentile([row[0] for row in rows], pct)
+
+    def baseline_latency_p95(self, resource_id: int, check_name: str, since: int, until: int) -> Optional[float]:
+        """
+        Typical p95 latency (ms) between ``since`` and ``until``: the median of
+        the hourly p95 values from rollups and from raw samples not yet rolled up.
+        """
+        hourly = [row[0] for row in self.conn.execute(
+            'SELECT latency_p95_ms FROM check_rollups WHERE resource_id = ? AND check_name = ?'
+            ' AND bucket_start >= ? AND bucket_start < ? AND latency_p95_ms IS NOT NULL',
+            (resource_id, check_name, since, until),
+        )]
+        buckets = {}
+        for ts, latency_ms in self.conn.execute(
+                'SELECT ts, latency_ms FROM check_samples WHERE resource_id = ? AND check_name = ?'
+                ' AND ts >= ? AND ts < ? AND passed = 1 AND latency_ms IS NOT NULL',
+                (resource_id, check_name, since, until)):
+            buckets.setdefault(ts - ts % HOUR, []).append(latency_ms)
+        hourly.extend(percentile(values, 95) for values in buckets.values())
+        return median(hourly) if hourly else None
+
+    def compact(self, now: Optional[int] = None,
+                raw_retention: int = RAW_RETENTION_SECONDS,
+                rollup_retention: int = ROLLUP_RETENTION_SECONDS):
+        """
+        Roll raw samples older than ``raw_retention`` into hourly rollups and
+        drop rollups older than ``rollup_retention``. Only whole hours are
+        rolled up, so a bucket is never written twice.
+        """
+        now = int(now if now is not None else time.time())
+        cutoff = now - raw_retention
+        cutoff -= cutoff % HOUR
+
+        buckets = {}
+        for resource_id, name, ts, passed, latency_ms in self.conn.execute(
+                'SELECT resource_id, check_name, ts, passed, latency_ms FROM check_samples WHERE ts < ?',
+                (cutoff,)):
+            bucket = buckets.setdefault((resource_id, name, ts - ts % HOUR), [0, 0, []])
+            bucket[0] += 1
+            if not passed:
+                bucket[1] += 1
+            elif latency_ms is not None:
+                bucket[2].append(latency_ms)
+
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO check_rollups (resource_id, check_name, bucket_start, samples, failures,'
+                ' latency_p50_ms, latency_p95_ms, latency_max_ms) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [(resource_id, name, bucket_start, samples, failures,
+                  percentile(latencies, 50), percentile(latencies, 95), max(latencies) if latencies else None)
+                 for (resource_id, name, bucket_start), (samples, failures, latencies) in buckets.items()],
+            )
+            self.conn.execute('DELETE FROM check_samples WHERE ts < ?', (cutoff,))
+            self.conn.execute('DELETE FROM check_rollups WHERE bucket_start < ?', (now - rollup_retention,))
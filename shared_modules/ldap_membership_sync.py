@@ -0,0 +1,360 @@
+"""
+Bulk LDAP/AD membership sync engine for external user sync plugins.
+
+The external user sync plugins used to run one LDAP search per user and
+several Group/role queries per DN component and memberOf entry. This Shared
+Module splits the work into three stages instead:
+
+1. fetch_directory_entries() reads the users' DNs and memberOf with one
+   paged search (Simple Paged Results control) per LDAP_FILTER_CHUNK users,
+   filtering on their usernames so the server answers from its index.
+2. The plugin turns each entry into the roles the user should have, using a
+   GroupMap (all CloudBolt groups loaded once, created on demand) and a
+   MembershipPlan.
+3. apply_membership_plan() compares the plan with the current role rows and
+   only deletes and inserts the difference, in bulk.
+
+For testing, any object with a search(usernames) method can stand in for the
+LDAP server, e.g. LdifDirectory reading a recorded LDIF export, or
+PagedLdapDirectory pointed at a local test LDAP server.
+
+Consume this Shared Module in an external user sync plugin:
+from shared_modules.ldap_membership_sync import (
+    GroupMap, MembershipPlan, apply_membership_plan, fetch_directory_entries)
+
+def run(job, logger=None, **kwargs):
+    users = kwargs.get('users', [])
+    entries, missing = fetch_directory_entries(users, kwargs.get('ldap_directory'))
+    plan = MembershipPlan()
+    for user_profile in users:
+        ...  # plan.manage() / plan.grant() from entries[user_profile.id]
+    apply_membership_plan(plan)
+"""
+import base64
+from collections import defaultdict
+
+from django.db import transaction
+
+from accounts.models import Group, UserProfile
+from utilities.logger import ThreadLogger
+
+logger = ThreadLogger(__name__)
+
+# Role relations on UserProfile, each a many-to-many to Group
+ROLE_FIELDS = ('viewers', 'requestors', 'approvers', 'user_admins', 'resource_admins')
+# Entries per page of the LDAP paged search
+LDAP_PAGE_SIZE = 500
+# Usernames OR-ed together in one search filter
+LDAP_FILTER_CHUNK = 200
+# Rows written per bulk query, each batch in its own transaction
+BULK_BATCH_SIZE = 1000
+
+
+def _text(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+class DirectoryEntry(object):
+    """A user's DN and attributes, as returned by the LDAP search."""
+
+    def __init__(self, dn, attributes):
+        self.dn = _text(dn)
+        self.attributes = {name: [_text(value) for value in values] for name, values in attributes.items()}
+
+    @property
+    def member_of(self):
+        return self.attributes.get('memberOf', [])
+
+    def as_search_result(self):
+        """The entry in the shape of LDAPUtility.runUserSearch() results."""
+        return [(self.dn, self.attributes)]
+
+
+class PagedLdapDirectory(object):
+    """
+    Reads users from an LDAP server in a few paged searches: each query
+    returns the DN and memberOf of up to ``filter_chunk`` wanted users,
+    matched by an OR of their usernames, a page of LDAP_PAGE_SIZE entries at
+    a time.
+    """
+
+    def __init__(self, uri, base_dn, bind_dn=None, bind_password=None,
+                 username_attribute='sAMAccountName', search_filter=None, page_size=LDAP_PAGE_SIZE,
+                 filter_chunk=LDAP_FILTER_CHUNK):
+        self.uri = uri
+        self.base_dn = base_dn
+        self.bind_dn = bind_dn
+        self.bind_password = bind_password
+        self.username_attribute = username_attribute
+        self.search_filter = search_filter
+        self.page_size = page_size
+        self.filter_chunk = filter_chunk
+
+    @classmethod
+    def from_ldap_utility(cls, ldap_utility):
+        """Build from a CloudBolt LDAPUtility (the user_profile.ldap of a user)."""
+        uri = '{}://{}:{}'.format(ldap_utility.protocol or 'ldap', ldap_utility.ip, ldap_utility.port)
+        return cls(
+            uri,
+            ldap_utility.base_dn,
+            bind_dn=ldap_utility.serviceaccount,
+            bind_password=ldap_utility.servicepasswd,
+            username_attribute=ldap_utility.ldap_username or 'sAMAccountName',
+            search_filter=ldap_utility.ldap_filter,
+        )
+
+    def user_filter(self, usernames):
+        """The search filter matching ``usernames``, within search_filter if set."""
+        from ldap.filter import escape_filter_chars
+
+        user_filter = '(|{})'.format(''.join(
+            '({}={})'.format(self.username_attribute, escape_filter_chars(username)) for username in usernames))
+        if self.search_filter:
+            extra = self.search_filter if self.search_filter.startswith('(') else '({})'.format(self.search_filter)
+            user_filter = '(&{}{})'.format(extra, user_filter)
+        return user_filter
+
+    def search(self, usernames):
+        """Return {lowercase username: DirectoryEntry} for ``usernames`` found in the directory."""
+        import ldap
+
+        wanted = sorted({username.lower() for username in usernames})
+        entries = {}
+        if not wanted:
+            return entries
+        conn = ldap.initialize(self.uri)
+        conn.set_option(ldap.OPT_REFERRALS, 0)
+        conn.protocol_version = ldap.VERSION3
+        conn.simple_bind_s(self.bind_dn or '', self.bind_password or '')
+        try:
+            for i in range(0, len(wanted), self.filter_chunk):
+                chunk = wanted[i:i + self.filter_chunk]
+                self._paged_search(conn, self.user_filter(chunk), set(chunk), entries)
+        finally:
+            conn.unbind_s()
+        return entries
+
+    def _paged_search(self, conn, user_filter, wanted, entries):
+        import ldap
+        from ldap.controls import SimplePagedResultsControl
+
+        page_control = SimplePagedResultsControl(True, size=self.page_size, cookie='')
+        while True:
+            msgid = conn.search_ext(
+                self.base_dn, ldap.SCOPE_SUBTREE, user_filter,
+                [self.username_attribute, 'memberOf'], serverctrls=[page_control],
+            )
+            _, results, _, response_controls = conn.result3(msgid)
+            for dn, attributes in results:
+                if dn is None:
+                    # Search continuation references
+                    continue
+                usernames_found = attributes.get(self.username_attribute, [])
+                if usernames_found:
+                    username = _text(usernames_found[0]).lower()
+                    if username in wanted:
+                        entries[username] = DirectoryEntry(dn, attributes)
+            cookies = [
+                control.cookie for control in response_controls
+                if control.controlType == SimplePagedResultsControl.controlType
+            ]
+            if not cookies or not cookies[0]:
+                break
+            page_control.cookie = cookies[0]
+
+
+class LdifDirectory(object):
+    """Reads users from a recorded LDIF export instead of an LDAP server."""
+
+    def __init__(self, path, username_attribute='sAMAccountName'):
+        self.path = path
+        self.username_attribute = username_attribute
+
+    def records(self):
+        """Yield (dn, {attribute: [values]}) for each record in the file."""
+        with open(self.path) as f:
+            lines = []
+            for raw_line in f:
+                line = raw_line.rstrip('\n')
+                if line.startswith(' ') and lines:
+                    # Folded continuation of the previous line
+                    lines[-1] += line[1:]
+                elif line.startswith('#'):
+                    continue
+                elif line:
+                    lines.append(line)
+                elif lines:
+                    yield self._record(lines)
+                    lines = []
+            if lines:
+                yield self._record(lines)
+
+    @staticmethod
+    def _record(lines):
+        dn = None
+        attributes = defaultdict(list)
+        for line in lines:
+            name, _, value = line.partition(':')
+            if value.startswith(':'):
+                value = base64.b64decode(value[1:].strip()).decode('utf-8')
+            else:
+                value = value.strip()
+            if name.lower() == 'dn':
+                dn = value
+            else:
+                attributes[name].append(value)
+        return dn, dict(attributes)
+
+    def search(self, usernames):
+        wanted = {username.lower() for username in usernames}
+        entries = {}
+        for dn, attributes in self.records():
+            usernames_found = attributes.get(self.username_attribute, [])
+            if dn and usernames_found and usernames_found[0].lower() in wanted:
+                entries[usernames_found[0].lower()] = DirectoryEntry(dn, attributes)
+        return entries
+
+
+def fetch_directory_entries(user_profiles, directory=None):
+    """
+    Look every user up in LDAP and return ({user profile id: DirectoryEntry},
+    [user profiles not found]).
+
+    Users are searched with one paged search per LDAP server (or in
+    ``directory`` when given). If a paged search fails, that server's users
+    fall back to one runUserSearch each.
+    """
+    entries = {}
+    missing = []
+    by_directory = defaultdict(list)
+    for user_profile in user_profiles:
+        key = directory if directory is not None else getattr(user_profile, 'ldap', None)
+        if key is None:
+            missing.append(user_profile)
+            continue
+        by_directory[key].append(user_profile)
+
+    for key, profiles in by_directory.items():
+        usernames = [profile.user.username for profile in profiles]
+        try:
+            source = key if hasattr(key, 'search') else PagedLdapDirectory.from_ldap_utility(key)
+            found = source.search(usernames)
+        except Exception as e:
+            if key is directory:
+                raise
+            logger.warning('Paged LDAP search failed ({}), searching {} user(s) one at a time'
+                           .format(e, len(profiles)))
+            found = {}
+            for profile in profiles:
+                data = key.runUserSearch(profile.user.username, find="")
+                if data:
+                    found[profile.user.username.lower()] = DirectoryEntry(data[0][0], data[0][1])
+        for profile in profiles:
+            entry = found.get(profile.user.username.lower())
+            if entry is None:
+                missing.append(profile)
+            else:
+                entries[profile.id] = entry
+    return entries, missing
+
+
+class GroupMap(object):
+    """
+    Every CloudBolt group loaded once and indexed by name; groups created
+    through it are added to the index, so each is only created once per sync.
+    """
+
+    def __init__(self):
+        self.by_name = defaultdict(list)
+        for group in Group.objects.order_by('id'):
+            self.by_name[group.name].append(group)
+        self.created = []
+
+    def first(self, name):
+        """The first group with this name, or None."""
+        groups = self.by_name.get(name)
+        return groups[0] if groups else None
+
+    def find(self, name, parent=None):
+        """The group with this name under ``parent``, or None."""
+        parent_id = parent.id if parent else None
+        for group in self.by_name.get(name, []):
+            if group.parent_id == parent_id:
+                return group
+        return None
+
+    def create(self, name, group_type, parent=None):
+        group = Group.objects.create(name=name, type=group_type, parent=parent)
+        self.by_name[name].append(group)
+        self.created.append(group)
+        return group
+
+    def get_or_create(self, name, group_type, parent=None):
+        return self.find(name, parent) or self.create(name, group_type, parent)
+
+
+class MembershipPlan(object):
+    """
+    The roles users should end up with. A role on a group is only ever
+    removed when it is managed for that user (see manage()); granted roles
+    are added if missing.
+    """
+
+    def __init__(self):
+        # role -> {(user profile id, group id)}
+        self.desired = defaultdict(set)
+        self.managed = defaultdict(set)
+
+    def grant(self, user_profile, role, groups):
+        for group in groups:
+            self.desired[role].add((user_profile.id, group.id))
+
+    def manage(self, user_profile, roles, groups):
+        """Reset ``roles`` on ``groups`` for this user to what is granted."""
+        for role in roles:
+            for group in groups:
+                self.managed[role].add((user_profile.id, group.id))
+
+
+def _batches(items, size=BULK_BATCH_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def apply_membership_plan(plan):
+    """
+    Bring the role rows in line with ``plan``, deleting and inserting only
+    what differs. Returns {role: (added, removed)}.
+    """
+    changes = {}
+    for role in ROLE_FIELDS:
+        desired = plan.desired.get(role, set())
+        managed = plan.managed.get(role, set())
+        pairs = desired | managed
+        if not pairs:
+            continue
+        through = getattr(UserProfile, role).through
+        user_ids = {user_id for user_id, _ in pairs}
+        group_ids = {group_id for _, group_id in pairs}
+
+        existing = {}
+        for batch in _batches(user_ids):
+            for row_id, user_id, group_id in through.objects.filter(
+                    userprofile_id__in=batch, group_id__in=group_ids).values_list('id', 'userprofile_id', 'group_id'):
+                existing[(user_id, group_id)] = row_id
+
+        to_remove = [row_id for pair, row_id in existing.items() if pair in managed and pair not in desired]
+        to_add = [
+            through(userprofile_id=user_id, group_id=group_id)
+            for user_id, group_id in sorted(desired - set(existing))
+        ]
+        for batch in _batches(to_remove):
+            with transaction.atomic():
+                through.objects.filter(id__in=batch).delete()
+        for batch in _batches(to_add):
+            with transaction.atomic():
+                through.objects.bulk_create(batch)
+        changes[role] = (len(to_add), len(to_remove))
+        logger.debug('LDAP sync {}: {} added, {} removed'.format(role, len(to_add), len(to_remove)))
+    return changes
@@ -0,0 +1,157 @@
+"""
+Batched RabbitMQ publisher.
+
+Publishing with a new connection, channel and queue declaration per message
+costs several round-trips per message. RabbitMQPublisher instead opens one
+connection and one channel for its whole lifetime (e.g. one job), declares
+the queue once, buffers messages and publishes them in batches. Every batch
+is confirmed by the broker before flush() returns, in one of two modes:
+
+* CONFIRM_EACH: publisher confirms; each message waits for its own ack.
+* CONFIRM_BATCH (default): the batch is published in an AMQP transaction and
+  committed with one round-trip, so thousands of messages go out in a few
+  bursts. pika's BlockingConnection can't pipeline publisher confirms, so
+  this is how a whole batch is acknowledged at once.
+
+Delivery is at least once: if the connection drops mid-flush the batch is
+retried once on a new connection.
+
+pika's BlockingConnection is not thread-safe, and CloudBolt runs jobs as
+threads of one process, so a publisher must only be used from the thread
+that created it. Its connection is closed by close() (or on leaving the
+with block) rather than kept open between jobs, where nothing would process
+its heartbeats.
+
+Consume this Shared Module in a CloudBolt Plugin:
+from shared_modules.rabbitmq_publisher import RabbitMQPublisher, server_record
+
+with RabbitMQPublisher('rabbit.example.com', exchange='', routing_key='servers', queue='servers') as publisher:
+    for server in job.server_set.all():
+        publisher.publish(server_record(server, job))
+
+For tests, pass connection_factory: a callable taking pika.ConnectionParameters
+and returning an object with the BlockingConnection methods used here
+(channel(), close(), is_open).
+"""
+import json
+
+import pika
+
+from utilities.logger import ThreadLogger
+
+logger = ThreadLogger(__name__)
+
+CONFIRM_EACH = 'each'
+CONFIRM_BATCH = 'batch'
+# Messages published per broker round-trip in CONFIRM_BATCH mode
+BATCH_SIZE = 500
+
+
+def server_record(server, job=None):
+    """A server as a JSON-serializable dict for a message body."""
+    return {
+        'id': server.id,
+        'hostname': server.hostname,
+        'mem_size': server.mem_size,
+        'cpu_cnt': server.cpu_cnt,
+        'job_id': job.id if job else None,
+        'status': job.status if job else None,
+    }
+
+
+class RabbitMQPublisher(object):
+    """Publishes dicts as persistent JSON messages, in confirmed batches."""
+
+    def __init__(self, host, exchange='', routing_key='', queue=None, port=5672,
+                 virtual_host='/', username=None, password=None,
+                 confirm_mode=CONFIRM_BATCH, batch_size=BATCH_SIZE, connection_factory=None):
+        connection_kwargs = {'host': host, 'port': port, 'virtual_host': virtual_host}
+        if username:
+            connection_kwargs['credentials'] = pika.PlainCredentials(username, password)
+        self.parameters = pika.ConnectionParameters(**connection_kwargs)
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.queue = queue
+        self.confirm_mode = confirm_mode
+        self.batch_size = batch_size
+        self.connection_factory = connection_factory or pika.BlockingConnection
+        self.properties = pika.BasicProperties(
+            content_type='application/json',
+            delivery_mode=2,  # make message persistent
+        )
+        self.pending = []
+        self.published = 0
+        self.connection = None
+        self.channel = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        self.close()
+
+    def _open_channel(self):
+        if self.connection is None or not self.connection.is_open:
+            self.connection = self.connection_factory(self.parameters)
+        channel = self.connection.channel()
+        if self.queue:
+            channel.queue_declare(queue=self.queue, durable=True)
+        if self.confirm_mode == CONFIRM_BATCH:
+            channel.tx_select()
+        else:
+            channel.confirm_delivery()
+        self.channel = channel
+
+    def publish(self, record):
+        """Queue ``record`` for publishing, flushing when a batch is full."""
+        self.pending.append(json.dumps(record, default=str, sort_keys=True))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def _publish_batch(self, bodies):
+        for body in bodies:
+            delivered = self.channel.basic_publish(
+                exchange=self.exchange, routing_key=self.routing_key,
+                body=body, properties=self.properties,
+            )
+            # Older pika returns False for a nacked message in confirm mode
+            # rather than raising
+            if delivered is False:
+                raise pika.exceptions.AMQPError('Broker did not confirm message: {}'.format(body))
+        if self.confirm_mode == CONFIRM_BATCH:
+            self.channel.tx_commit()
+
+    def flush(self):
+        """Publish every pending message and wait for the broker to confirm them."""
+        while self.pending:
+            batch = self.pending[:self.batch_size]
+            for attempt in (1, 2):
+                if self.channel is None:
+                    self._open_channel()
+                try:
+                    self._publish_batch(batch)
+                    break
+                except (pika.exceptions.AMQPConnectionError, pika.exceptions.AMQPChannelError) as e:
+                    self.channel = None
+                    self._close_connection()
+                    if attempt == 2:
+                        raise
+                    logger.warning('RabbitMQ connection lost ({}), retrying batch of {}'.format(e, len(batch)))
+            del self.pending[:len(batch)]
+            self.published += len(batch)
+
+    def _close_connection(self):
+        connection, self.connection = self.connection, None
+        if connection is not None and connection.is_open:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def close(self):
+        """Close the channel and the connection."""
+        self.pending = []
+        self.channel = None
+        self._close_connection()
@@ -0,0 +1,175 @@
+"""
+Rolling-wave scheduler for running an action as one sub-job per server.
+
+Starting a sub-job for every server at once and waiting for all of them
+floods the job engine, and the targets' shared services (package mirrors,
+license servers, ...) when there are thousands of servers. SubJobScheduler
+runs the servers in waves of `wave_size` instead:
+
+* At most `max_in_flight` sub-jobs run at once, and at most
+  `max_per_environment` / `max_per_handler` on any one environment or
+  resource handler.
+* A wave passes when at least `min_wave_success` of its sub-jobs succeed.
+  As soon as a wave has too many failures to pass, no more of its servers
+  are started; once its running sub-jobs finish, the remaining waves are
+  skipped.
+* The sub-jobs' statuses are polled with one query per `poll_interval`, and
+  progress is aggregated into the parent job.
+
+Consume this Shared Module in a CloudBolt Plugin:
+from shared_modules.sub_job_scheduler import SubJobScheduler
+
+def run(job, *args, servers=None, **kwargs):
+    action = ServerAction.objects.get(label="Patch Linux Server")
+    scheduler = SubJobScheduler(job, max_in_flight=50, wave_size=500)
+    result = scheduler.run(
+        servers, lambda server: action.run_hook_as_job(owner=job.owner, server=server, parent_job=job))
+    return result.status, result.summary(), ""
+"""
+import math
+import time
+from collections import defaultdict, deque
+
+from jobs.models import Job
+from utilities.logger import ThreadLogger
+
+logger = ThreadLogger(__name__)
+
+# Sub-jobs running at once
+MAX_IN_FLIGHT = 25
+# Sub-jobs running at once in any single environment / on any resource handler
+MAX_PER_ENVIRONMENT = 10
+MAX_PER_HANDLER = 10
+# Servers per wave
+WAVE_SIZE = 250
+# Fraction of a wave's sub-jobs that must succeed for the next wave to start
+MIN_WAVE_SUCCESS = 0.9
+# Seconds between sub-job status checks
+POLL_INTERVAL = 10
+
+
+class SubJobResult:
+    """Outcome of a scheduled run."""
+
+    def __init__(self):
+        self.succeeded = []
+        # [(server, job or None, reason)]
+        self.failed = []
+        self.not_started = []
+        self.aborted = False
+
+    @property
+    def status(self):
+        return "FAILURE" if self.failed or self.aborted else "SUCCESS"
+
+    def summary(self):
+        text = f"{len(self.succeeded)} sub-job(s) succeeded, {len(self.failed)} failed"
+        if self.aborted:
+            text += f", {len(self.not_started)} not started after a wave fell below the success threshold"
+        return text + "."
+
+
+class SubJobScheduler:
+    def __init__(self, parent_job, max_in_flight=MAX_IN_FLIGHT, wave_size=WAVE_SIZE,
+                 min_wave_success=MIN_WAVE_SUCCESS, max_per_environment=MAX_PER_ENVIRONMENT,
+                 max_per_handler=MAX_PER_HANDLER, poll_interval=POLL_INTERVAL):
+        self.parent_job = parent_job
+        self.max_in_flight = max_in_flight
+        self.wave_size = wave_size
+        self.min_wave_success = min_wave_success
+        self.max_per_environment = max_per_environment
+        self.max_per_handler = max_per_handler
+        self.poll_interval = poll_interval
+
+    def progress(self, message):
+        if self.parent_job:
+            self.parent_job.set_progress(message)
+        else:
+            logger.info(message)
+
+    def _finished_jobs(self, in_flight):
+        """Reload the in-flight sub-jobs in one query and return those no longer active."""
+        return [sub_job for sub_job in Job.objects.filter(id__in=list(in_flight)) if not sub_job.is_active()]
+
+    def run(self, servers, start_job):
+        """
+        Call ``start_job(server)``, which must start a sub-job and return its
+        Job, for each of ``servers``, wave by wave. Returns a SubJobResult.
+        """
+        servers = list(servers)
+        result = SubJobResult()
+        waves = [servers[i:i + self.wave_size] for i in range(0, len(servers), self.wave_size)]
+        for number, wave in enumerate(waves, 1):
+            passed = self._run_wave(wave, start_job, number, len(waves), result)
+            if not passed:
+                result.aborted = True
+                for later_wave in waves[number:]:
+                    result.not_started.extend(later_wave)
+                self.progress(f"Wave {number}/{len(waves)} fell below {self.min_wave_success:.0%} "
+                              f"success, not starting the remaining {len(result.not_started)} server(s).")
+                break
+        self.progress(result.summary())
+        return result
+
+    def _run_wave(self, wave, start_job, number, wave_count, result):
+        # Successes the wave needs; the tolerance keeps float error (250 * 0.9
+        # is 225.00000000000003) from asking for one more than the threshold
+        required = math.ceil(len(wave) * self.min_wave_success - 1e-9)
+        allowed_failures = len(wave) - required
+        queue = deque(wave)
+        in_flight = {}
+        per_environment = defaultdict(int)
+        per_handler = defaultdict(int)
+        succeeded = failed = 0
+
+        def release(server):
+            per_environment[server.environment_id] -= 1
+            per_handler[server.resource_handler_id] -= 1
+
+        while queue or in_flight:
+            # Start what the limits allow, unless the wave has already failed
+            deferred = deque()
+            while queue and len(in_flight) < self.max_in_flight and failed <= allowed_failures:
+                server = queue.popleft()
+                if (per_environment[server.environment_id] >= self.max_per_environment
+                        or per_handler[server.resource_handler_id] >= self.max_per_handler):
+                    deferred.append(server)
+                    continue
+                per_environment[server.environment_id] += 1
+                per_handler[server.resource_handler_id] += 1
+                try:
+                    sub_job = start_job(server)
+                except Exception as e:
+                    logger.exception(f"Could not start sub-job for {server}")
+                    release(server)
+                    result.failed.append((server, None, str(e)))
+                    failed += 1
+                    continue
+                in_flight[sub_job.id] = (server, sub_job)
+            queue.extendleft(reversed(deferred))
+
+            if failed > allowed_failures:
+                # Don't start anything else in this wave; let running sub-jobs finish
+                result.not_started.extend(queue)
+                queue.clear()
+            if not in_flight:
+                continue
+
+            time.sleep(self.poll_interval)
+            finished = self._finished_jobs(in_flight)
+            for sub_job in finished:
+                server, _ = in_flight.pop(sub_job.id)
+                release(server)
+                if sub_job.status == "SUCCESS":
+                    result.succeeded.append(server)
+                    succeeded += 1
+                else:
+                    result.failed.append((server, sub_job, sub_job.status))
+                    failed += 1
+            if finished:
+                self.progress(
+                    f"Wave {number}/{wave_count}: {succeeded + failed}/{len(wave)} done, {failed} failed, "
+                    f"{len(in_flight)} running. Overall: {len(result.succeeded)} succeeded, "
+                    f"{len(result.failed)} failed."
+                )
+        return failed <= allowed_failures
@@ -4,4 +4,6 @@ from xui.order_report_xui import views
 xui_urlpatterns = [
     url(r'^order_report_xui/order-summary/$', views.order_summary_status_report, name='order_summary_status_report'),
     url(r'^order_report_xui/order-summary/export/$', views.order_summary_export, name='order_summary_export'),
+    url(r'^order_report_xui/order-status/json/$', views.order_information_json, name='order_information_json'),
+    url(r'^order_report_xui/order-status/export/$', views.order_information_export, name='order_information_export'),
 ]
\ No newline at end of file
@@ -1,36 +1,85 @@
-import json, os
+import csv
+from urllib.parse import urlencode
 
 from datetime import datetime, timedelta
 from django.core.exceptions import PermissionDenied
+from django.db.models import Count, Q
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import render
+from django.urls import reverse
 from orders.models import Order
 from common.methods import last_month_day_info
 from extensions.views import report_extension
 from .forms import OrderRangeForm, SummaryRangeForm
+from utilities.cb_http import django_sort_cols_from_datatable_request
+from utilities.decorators import json_view
 from utilities.logger import ThreadLogger
-from django.db.models import Count
 from dateutil.relativedelta import relativedelta
-from django.http import HttpResponse
 
+logger = ThreadLogger("__name__")
 
-from tempfile import NamedTemporaryFile
-from reportengines.internal.export_utils import CSVWrapper
-from wsgiref.util import FileWrapper
+ORDER_COLUMN_HEADINGS = ['Date', 'Order Id', 'Blueprint Name', 'Status', 'Owner']
+# Model fields the Order Status table sorts by, in column order
+ORDER_SORT_COLUMNS = ['create_date', 'id', 'blueprint__name', 'status', 'owner__user__username']
+# Orders fetched per database round trip while streaming a CSV export
+EXPORT_CHUNK_SIZE = 2000
 
-logger = ThreadLogger("__name__")
 
-@report_extension(title='Order Status', thumbnail='order_status.png')
-def order_information_table_report(request):
+class Echo:
+    """File-like object whose write() returns the line, for streaming csv.writer output."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(column_headings, rows, filename):
+    """StreamingHttpResponse writing ``rows`` as CSV one line at a time."""
+    writer = csv.writer(Echo())
+
+    def lines():
+        yield writer.writerow(column_headings)
+        for row in rows:
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(lines(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+
+def filtered_orders(start, end, statuses):
+    """Orders created between ``start`` and ``end`` with one of ``statuses``, with their related rows joined."""
+    return Order.objects.filter(
+        create_date__gte=start, create_date__lte=end, status__in=statuses
+    ).select_related('blueprint', 'owner__user')
+
+
+def order_row(o):
+    bp_name = getattr(o.blueprint, 'name', o.name)
+    return (
+        o.create_date.date(),  # This stays as date for display
+        o.id,
+        bp_name,
+        o.status,
+        o.owner.user.username if o.owner and o.owner.user else '',
+    )
+
+
+def check_super_admin(request):
     profile = request.get_user_profile()
     if not profile.super_admin:
         raise PermissionDenied('Only super admins can view this report.')
 
+
+@report_extension(title='Order Status', thumbnail='order_status.png')
+def order_information_table_report(request):
+    check_super_admin(request)
+
     # Default date range from 1st to last day of last month, as datetime (not .date())
     start, end = last_month_day_info()
 
     show_table = False
-    column_headings = ['Date', 'Order Id', 'Blueprint Name', 'Status', 'Owner']
-    rows = []
+    table_source = None
+    export_params = []
 
     if request.method == 'GET':
         form = OrderRangeForm(initial=dict(start_date=start, end_date=end, status=["SUCCESS"]))
@@ -43,16 +92,10 @@ def order_information_table_report(request):
             sel_status = form.cleaned_data['status']
             logger.info(f"selected status = {sel_status}")
 
-            for o in Order.objects.all():
-                if start <= o.create_date <= end and o.status in sel_status:
-                    bp_name = getattr(o.blueprint, 'name', o.name)
-                    rows.append((
-                        o.create_date.date(),  # This stays as date for display
-                        o.id,
-                        bp_name,
-                        o.status,
-                        o.owner.user.username
-                    ))
+            # Rows are paged, sorted and searched by the database, see order_information_json
+            export_params = [('start_date', start.date()), ('end_date', end.date())]
+            export_params += [('status', status) for status in sel_status]
+            table_source = f"{reverse('order_information_json')}?{urlencode(export_params)}"
 
     return render(request, 'order_report_xui/templates/table.html', dict(
         pagetitle='Order Status',
@@ -61,14 +104,68 @@ def order_information_table_report(request):
         show_table=show_table,
         table_caption='Orders created between {} and {}'.format(start.date(), end.date()),
         form=form,
-        column_headings=column_headings,
-        rows=rows,
+        column_headings=ORDER_COLUMN_HEADINGS,
+        rows=[],
+        table_source=table_source,
+        export_url=reverse('order_information_export'),
+        export_params=export_params,
         sort_by_column=0,
         unsortable_column_indices=[],
     ))
 
-@report_extension(title='Order Status Summary',thumbnail='order_summary.png')
-def order_summary_status_report(request):
+
+@json_view
+def order_information_json(request):
+    """One page of the Order Status table for DataTables, filtered, searched and sorted in the database."""
+    check_super_admin(request)
+    form = OrderRangeForm(request.GET)
+    if not form.is_valid():
+        return {"sEcho": int(request.GET.get("sEcho", 1)), "iTotalRecords": 0,
+                "iTotalDisplayRecords": 0, "aaData": []}
+
+    orders = filtered_orders(form.cleaned_data['start_date'], form.cleaned_data['end_date'],
+                             form.cleaned_data['status'])
+    total_rows = orders.count()
+
+    search = request.GET.get('sSearch')
+    if search:
+        search_filter = (Q(blueprint__name__icontains=search) | Q(name__icontains=search)
+                         | Q(status__icontains=search) | Q(owner__user__username__icontains=search))
+        if search.isdigit():
+            search_filter |= Q(id=int(search))
+        orders = orders.filter(search_filter)
+    display_rows = orders.count() if search else total_rows
+
+    orders = orders.order_by(*django_sort_cols_from_datatable_request(request, ORDER_SORT_COLUMNS), 'id')
+    start = int(request.GET.get('iDisplayStart', 0))
+    length = int(request.GET.get('iDisplayLength', 10))
+    if length >= 0:
+        orders = orders[start:start + length]
+
+    return {
+        "sEcho": int(request.GET.get("sEcho", 1)),
+        "iTotalRecords": total_rows,
+        "iTotalDisplayRecords": display_rows,
+        "aaData": [[str(col) for col in order_row(o)] for o in orders],
+    }
+
+
+def order_information_export(request):
+    """Stream every order matching the Order Status filters as CSV."""
+    check_super_admin(request)
+    form = OrderRangeForm(request.POST)
+    if not form.is_valid():
+        return HttpResponseBadRequest('Invalid date range or status filter.')
+    start = form.cleaned_data['start_date']
+    end = form.cleaned_data['end_date']
+
+    orders = filtered_orders(start, end, form.cleaned_data['status']).order_by('create_date', 'id')
+    rows = (order_row(o) for o in orders.iterator(chunk_size=EXPORT_CHUNK_SIZE))
+    return stream_csv(ORDER_COLUMN_HEADINGS, rows, f'order_status_{start.date()}_{end.date()}.csv')
+
+
+def summary_items(request):
+    """Return (form, selected range, name/status counts) for the summary reports."""
     today = datetime.now()
     start_date = None
     end_date = None
@@ -77,12 +174,7 @@ def order_summary_status_report(request):
     selected_range = "30d"
 
     if form.is_valid():
-        selected_range = form.cleaned_data.get("range", "30d")
-
-    logger.info(f"Request.GET = {request.GET}")
-    logger.info(f"Request.POST = {request.POST}")
-
-
+        selected_range = form.cleaned_data.get("range", "30d") or "30d"
 
     if selected_range == "30d":
         start_date = today - timedelta(days=30)
@@ -108,6 +200,13 @@ def order_summary_status_report(request):
         .annotate(count=Count('id'))
         .order_by('-count')
     )
+    logger.info(f"Filtering by: {selected_range}, Start: {start_date}, End: {end_date}")
+    return form, selected_range, items
+
+
+@report_extension(title='Order Status Summary',thumbnail='order_summary.png')
+def order_summary_status_report(request):
+    form, selected_range, items = summary_items(request)
 
     column_headings = ["Name", "Status", "Count"]
     rows = [
@@ -123,86 +222,20 @@ def order_summary_status_report(request):
         "column_headings": column_headings,
         "rows": rows,
         "show_table": True,
+        "export_url": reverse('order_summary_export'),
+        "export_params": [("range", selected_range)],
         "sort_by_column": 2,
         "unsortable_column_indices": [],
     }
-    logger.info(f"Filtering by: {selected_range}, Start: {start_date}, End: {end_date}")
-
 
     return render(request, "order_report_xui/templates/table.html", context)
-def order_summary_export(request):
-    today = datetime.now()
-    start_date = None
-    end_date = None
 
-    form = SummaryRangeForm(request.GET or request.POST)
-    selected_range = "30d"
 
-    if form.is_valid():
-        selected_range = form.cleaned_data.get("range", "30d")
-
-    logger.info(f"Request.GET = {request.GET}")
-    logger.info(f"Request.POST = {request.POST}")
-
-
-
-    if selected_range == "30d":
-        start_date = today - timedelta(days=30)
-    elif selected_range == "12m":
-        start_date = today - relativedelta(months=12)
-    elif selected_range.startswith("month-"):
-        try:
-            _, year, month = selected_range.split("-")
-            start_date = datetime(int(year), int(month), 1)
-            end_date = (start_date + relativedelta(months=1)) - timedelta(seconds=1)
-        except:
-            pass  # fallback to None
-    # No filtering for 'all'
-
-    queryset = Order.objects.all()
-    if start_date:
-        queryset = queryset.filter(create_date__gte=start_date)
-    if end_date:
-        queryset = queryset.filter(create_date__lt=end_date)
-
-    items = (
-        queryset.values('name', 'status')
-        .annotate(count=Count('id'))
-        .order_by('-count')
-    )
-
-    column_headings = ["Name", "Status", "Count"]
-    rows = [
-        [item["name"] or "", item["status"], item["count"]]
-        for item in items
-    ]
-
-    context = {
-        "report_slug": "order_summary_export",
-        "report_name": "Order Summary Export",
-        "form": form,
-        "column_headings": column_headings,
-        "rows": rows,
-        "show_table": True,
-        "sort_by_column": 2,
-        "unsortable_column_indices": [],
-    }
-    logger.info(f"Filtering by: {selected_range}, Start: {start_date}, End: {end_date}")
+def order_summary_export(request):
+    """Stream the Order Status Summary for the selected range as CSV."""
+    if 'export-data' not in request.POST.get('action', ''):
+        return order_summary_status_report(request)
 
-    if 'export-data' in request.POST.get('action'):
-        writer = CSVWrapper()
-        writer.writerow(column_headings)
-        for row in items:
-            writer.writerow([row['name'], row['status'], row['count']])
-
-        f = NamedTemporaryFile('w', delete=False)
-        f.write(writer.close_and_return_as_string())
-        f.close()
-        filename = f.name
-        wrapper = FileWrapper(open(filename,'rb'))
-        export_filename = f'order_summary_{selected_range}.csv'
-        response = HttpResponse(wrapper, content_type='text/plain')
-        response['Content-Length'] = os.path.getsize(filename)
-        response['Content-Disposition'] = f'attachment; filename={export_filename}'
-        os.remove(f.name)
-        return response
\ No newline at end of file
+    form, selected_range, items = summary_items(request)
+    rows = ([item['name'] or "", item['status'], item['count']] for item in items.iterator())
+    return stream_csv(["Name", "Status", "Count"], rows, f'order_summary_{selected_range}.csv')
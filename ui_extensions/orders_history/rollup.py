@@ -0,0 +1,146 @@
+"""
+Order counts per day and status for the Orders History report.
+
+Counting is done in the database with one grouped query (TruncDay/TruncWeek by
+status). Days older than SETTLE_DAYS are also stored in a small SQLite rollup
+table, filled in incrementally the first time the report is viewed on a new
+day. A year view then reads at most a few hundred rollup rows, plus one grouped
+query over the last SETTLE_DAYS days, however many orders there are.
+
+Orders can still change status shortly after they are created (a cart gets
+submitted, a pending order completes), which is why only days older than
+SETTLE_DAYS are rolled up.
+"""
+import datetime
+import sqlite3
+from collections import Counter
+
+from django.db.models import Count
+from django.db.models.functions import TruncDay, TruncWeek
+from django.utils import timezone
+
+from orders.models import Order
+
+ROLLUP_DB = '/var/opt/cloudbolt/proserv/orders_history_rollup.sqlite3'
+# Order statuses shown on the report
+STATUSES = ('SUCCESS', 'FAILURE', 'CART')
+# Days younger than this are always counted live
+SETTLE_DAYS = 7
+# How far back the rollup goes; the longest report period is a year
+MAX_ROLLUP_DAYS = 366
+
+TRUNCATE = {'day': TruncDay, 'week': TruncWeek}
+
+
+def _day_start(day):
+    """Aware datetime for the start of ``day`` in the current time zone."""
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def _bucket_start(day, bucket):
+    """First day of the ``bucket`` ('day' or 'week', weeks start on Monday) containing ``day``."""
+    if bucket == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    return day
+
+
+def count_orders_in_db(start, end=None, bucket='day'):
+    """
+    Count orders per (bucket start date, status) created on or after the day
+    ``start`` and before the day ``end``, with a single grouped query.
+    """
+    orders = Order.objects.filter(status__in=STATUSES, create_date__gte=_day_start(start))
+    if end is not None:
+        orders = orders.filter(create_date__lt=_day_start(end))
+    rows = (
+        orders.annotate(bucket=TRUNCATE[bucket]('create_date'))
+        .values('bucket', 'status')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    counts = Counter()
+    for row in rows:
+        bucket_start = row['bucket']
+        if isinstance(bucket_start, datetime.datetime):
+            bucket_start = timezone.localtime(bucket_start).date() if timezone.is_aware(bucket_start) \
+                else bucket_start.date()
+        counts[(bucket_start, row['status'])] += row['count']
+    return counts
+
+
+class DailyOrderRollup:
+    """SQLite table of settled (day, status) -> order count."""
+
+    def __init__(self, path=ROLLUP_DB):
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS daily_order_counts (
+                day TEXT NOT NULL,
+                status TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (day, status)
+            );
+            CREATE TABLE IF NOT EXISTS rollup_state (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        ''')
+
+    def close(self):
+        self.conn.close()
+
+    def rolled_up_until(self):
+        """The first day not in the rollup yet, or None if it is empty."""
+        row = self.conn.execute("SELECT value FROM rollup_state WHERE key = 'rolled_up_until'").fetchone()
+        return datetime.date.fromisoformat(row[0]) if row else None
+
+    def update(self, settled_until):
+        """Roll up the days not in the rollup yet that are before ``settled_until``."""
+        start = self.rolled_up_until()
+        oldest = settled_until - datetime.timedelta(days=MAX_ROLLUP_DAYS)
+        if start is None or start < oldest:
+            start = oldest
+        if start >= settled_until:
+            return
+        counts = count_orders_in_db(start, settled_until)
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO daily_order_counts (day, status, count) VALUES (?, ?, ?)',
+                [(day.isoformat(), status, count) for (day, status), count in counts.items()],
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO rollup_state (key, value) VALUES ('rolled_up_until', ?)",
+                (settled_until.isoformat(),),
+            )
+            self.conn.execute('DELETE FROM daily_order_counts WHERE day < ?', (oldest.isoformat(),))
+
+    def counts(self, start, end):
+        """(day, status) -> count for days from ``start`` up to, not including, ``end``."""
+        rows = self.conn.execute(
+            'SELECT day, status, count FROM daily_order_counts WHERE day >= ? AND day < ?',
+            (start.isoformat(), end.isoformat()),
+        )
+        return Counter({(datetime.date.fromisoformat(day), status): count for day, status, count in rows})
+
+
+def order_counts(start, bucket='day', rollup_path=ROLLUP_DB):
+    """
+    Return (bucket start date, status) -> order count for orders created on
+    or after the day ``start``. Settled days come from the rollup (updated
+    first if needed) and the rest from one grouped query.
+    """
+    today = timezone.localdate()
+    settled_until = today - datetime.timedelta(days=SETTLE_DAYS)
+    if start >= settled_until:
+        return count_orders_in_db(start, bucket=bucket)
+
+    rollup = DailyOrderRollup(rollup_path)
+    try:
+        rollup.update(settled_until)
+        counts = Counter()
+        for (day, status), count in rollup.counts(start, settled_until).items():
+            counts[(_bucket_start(day, bucket), status)] += count
+    finally:
+        rollup.close()
+    counts.update(count_orders_in_db(settled_until, bucket=bucket))
+    return counts
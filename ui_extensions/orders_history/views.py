@@ -1,15 +1,16 @@
-from collections import namedtuple
-from django.shortcuts import get_object_or_404, render
-from common.methods import columnify
-from extensions.views import dashboard_extension
-from operator import attrgetter
-from django.contrib.auth.models import User
-from orders.models import Order
-import json
-from extensions.views import report_extension
-from django.core.serializers.json import DjangoJSONEncoder
-from datetime import datetime, timedelta
+import calendar
+from datetime import timedelta
+
+from django.shortcuts import render
+from django.utils import timezone
 from django.utils.translation import gettext as _
+from extensions.views import report_extension
+
+from xui.orders_history.rollup import order_counts
+
+# Days shown for each period, and whether orders are counted per day or per week
+PERIOD_DAYS = {'year': 365, 'month': 30, 'week': 7, 'day': 1}
+PERIOD_BUCKETS = {'year': 'week', 'month': 'day', 'week': 'day', 'day': 'day'}
 
 
 @report_extension(title='Orders History')
@@ -17,50 +18,18 @@ def display_orders(request):
     # Select period
     period = request.GET.get('period', 'month')
     periods = {'year': _('Year'), 'month': _('Month'), 'week': _('Week'), 'day': _('Day')}
+    if period not in PERIOD_DAYS:
+        period = 'month'
+    bucket = PERIOD_BUCKETS[period]
 
-    successful_orders_date = Order.objects.filter(status='SUCCESS').values_list('create_date', flat=True)
-    failed_orders_date = Order.objects.filter(status='FAILURE').values_list('create_date', flat=True)
-    cart_orders_date = Order.objects.filter(status='CART').values_list('create_date', flat=True)
-
-    if period == "day":
-        last_day = datetime.today() - timedelta(days=1)
-        successful_orders_date = Order.objects.filter(status='SUCCESS', create_date__date__gte=last_day).values_list('create_date', flat=True)
-        failed_orders_date = Order.objects.filter(status='FAILURE', create_date__date__gte=last_day).values_list('create_date', flat=True)
-        cart_orders_date = Order.objects.filter(status='CART', create_date__date__gte=last_day).values_list('create_date', flat=True)
-    elif period == "week":
-        last_day = datetime.today() - timedelta(days=7)
-        successful_orders_date = Order.objects.filter(status='SUCCESS', create_date__date__gte=last_day).values_list(
-            'create_date', flat=True)
-        failed_orders_date = Order.objects.filter(status='FAILURE', create_date__date__gte=last_day).values_list(
-            'create_date', flat=True)
-        cart_orders_date = Order.objects.filter(status='CART', create_date__date__gte=last_day).values_list(
-            'create_date', flat=True)
-    elif period == "month":
-        last_day = datetime.today() - timedelta(days=30)
-        successful_orders_date = Order.objects.filter(status='SUCCESS', create_date__date__gte=last_day).values_list(
-            'create_date', flat=True)
-        failed_orders_date = Order.objects.filter(status='FAILURE', create_date__date__gte=last_day).values_list(
-            'create_date', flat=True)
-        cart_orders_date = Order.objects.filter(status='CART', create_date__date__gte=last_day).values_list(
-            'create_date', flat=True)
-    elif period == "year":
-        last_day = datetime.today() - timedelta(days=365)
-        successful_orders_date = Order.objects.filter(status='SUCCESS', create_date__date__gte=last_day).values_list(
-            'create_date', flat=True)
-        failed_orders_date = Order.objects.filter(status='FAILURE', create_date__date__gte=last_day).values_list(
-            'create_date', flat=True)
-        cart_orders_date = Order.objects.filter(status='CART', create_date__date__gte=last_day).values_list(
-            'create_date', flat=True)
-
-    # count dates of orders
-    successful_orders_count = count_orders(successful_orders_date)
-    failed_orders_count = count_orders(failed_orders_date)
-    cart_orders_count = count_orders(cart_orders_date)
+    # count orders per day (or week) and status in the database
+    first_day = timezone.localdate() - timedelta(days=PERIOD_DAYS[period])
+    counts = order_counts(first_day, bucket=bucket)
 
     # list to pass to render
-    success = to_dict(successful_orders_count)
-    failure = to_dict(failed_orders_count)
-    cart = to_dict(cart_orders_count)
+    success = to_series(counts, 'SUCCESS')
+    failure = to_series(counts, 'FAILURE')
+    cart = to_series(counts, 'CART')
 
     return render(request, 'orders_history/templates/charts.html', dict(
         pagetitle='Orders History',
@@ -74,26 +43,18 @@ def display_orders(request):
         data_error=failure,
         periods=periods,
         current_period=period,
-        series_name='orders'
+        series_name='orders',
+        bucket_ms=(7 if bucket == 'week' else 1) * 24 * 3600 * 1000,
     ))
 
 
-def count_orders(list_of_dates):
-    orders_count = {}
-    for date in list_of_dates:
-        day = date.date()
-        if not day in orders_count:
-            orders_count[day] = 1
-        else:
-            orders_count[day] += 1
-    return orders_count
-
-
-def to_dict(orders_count):
-    result = []
-    for date, count in orders_count.items():
-        order_date = date.strftime("%x")
-        order_date = datetime.strptime(order_date,"%m/%d/%y").timestamp()*1000
-        success_dict = {'x': order_date, 'y': count}
-        result.append(success_dict)
-    return result
+def to_series(counts, status):
+    """
+    Highcharts points for one status: x is the bucket's first day as a UTC
+    timestamp in milliseconds, y the number of orders.
+    """
+    return [
+        {'x': calendar.timegm(day.timetuple()) * 1000, 'y': count}
+        for (day, order_status), count in sorted(counts.items())
+        if order_status == status
+    ]
@@ -0,0 +1,73 @@
+"""
+Server-side cache for the SSM Inventory and Patching tabs.
+
+DataTables asks for a new page on every page flip, sort and search. Rather
+than pulling everything from SSM each time, the rows for an instance are
+fetched once, normalized into a CachedTable and kept in the Django cache for
+CACHE_TTL_SECONDS (or until refreshed from the tab). A CachedTable holds a
+lowercase search key per row and the row order for every column sorted both
+ways, so a page is just a slice of a precomputed index.
+"""
+from django.core.cache import cache
+
+CACHE_TTL_SECONDS = 15 * 60
+CACHE_KEY_PREFIX = "xui_ssm_inventory"
+# Kinds of tables cached per server, see views.py
+TABLE_KINDS = ("inventory", "patches")
+
+
+class CachedTable:
+    """Rows for one DataTables table, with search keys and sort orders precomputed."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        # Fields are joined with a separator so a search can't match across two fields
+        self.search_keys = ["\x00".join(str(field).lower() for field in row) for row in rows]
+        columns = len(rows[0]) if rows else 0
+        self.ascending = []
+        self.descending = []
+        for column in range(columns):
+            indexes = range(len(rows))
+            # Two sorts rather than a reversed copy, so rows with equal values
+            # keep their original order either way, as sorted() does.
+            self.ascending.append(sorted(indexes, key=lambda i: rows[i][column]))
+            self.descending.append(sorted(indexes, key=lambda i: rows[i][column], reverse=True))
+
+    def page(self, search="", sort_column=0, descending=False, start=0, length=10):
+        """Return (total rows, rows matching ``search``, the requested page of them)."""
+        if not self.rows:
+            return 0, 0, []
+        if not 0 <= sort_column < len(self.ascending):
+            sort_column = 0
+        order = (self.descending if descending else self.ascending)[sort_column]
+        if search:
+            search = search.lower()
+            search_keys = self.search_keys
+            order = [i for i in order if search in search_keys[i]]
+        if length < 0:
+            # DataTables asks for every row with a length of -1
+            length = len(order)
+        return len(self.rows), len(order), [self.rows[i] for i in order[start:start + length]]
+
+
+def cache_key(kind, server):
+    return f"{CACHE_KEY_PREFIX}:{kind}:{server.id}"
+
+
+def get_cached_table(kind, server, fetch_rows, refresh=False):
+    """
+    Return the CachedTable of ``kind`` for ``server``, calling
+    ``fetch_rows(server)`` to build it when it is not cached, has expired or
+    ``refresh`` is set.
+    """
+    key = cache_key(kind, server)
+    table = None if refresh else cache.get(key)
+    if table is None:
+        table = CachedTable(fetch_rows(server))
+        cache.set(key, table, CACHE_TTL_SECONDS)
+    return table
+
+
+def clear_cached_tables(server):
+    """Drop every cached table for ``server`` so the next request refetches from SSM."""
+    cache.delete_many([cache_key(kind, server) for kind in TABLE_KINDS])
@@ -17,4 +17,9 @@ xui_urlpatterns = [
         views.patch_json,
         name="ssm_patch_json",
     ),
+    url(
+        r"^ssm-inventory/(?P<server_id>\d+)/refresh/$",
+        views.refresh_json,
+        name="ssm_inventory_refresh",
+    ),
 ]
\ No newline at end of file
@@ -8,6 +8,7 @@ from django.urls import reverse
 from django.http import HttpResponseRedirect
 from django.utils.html import format_html
 from django.utils.translation import ugettext as _
+from django.views.decorators.http import require_POST
 import json
 from os import path
 from c2_wrapper import create_hook
@@ -19,11 +20,21 @@ from utilities.decorators import json_view, dialog_view
 from utilities.logger import ThreadLogger
 from utilities.templatetags import helper_tags
 from xui.ssm_inventory.forms import PatchEC2Form
+from xui.ssm_inventory.inventory_cache import clear_cached_tables, get_cached_table
 
 logger = ThreadLogger(__name__)
 
 XUI_PATH = path.dirname(path.abspath(__file__))
 
+
+def get_server_or_404(request, server_id):
+    """
+    Return the server, if the requesting user can view it. Servers the user
+    can't see are a 404, as if they didn't exist.
+    """
+    profile = request.get_user_profile()
+    return get_object_or_404(Server.objects_for_profile(profile), pk=server_id)
+
 class TabDelegate(TabExtensionDelegate):
     def should_display(self):
         logger.debug(f"SSM Self: {self} ")
@@ -38,7 +49,7 @@ class TabDelegate(TabExtensionDelegate):
     description="Displays a list of guest apps"
 )
 def server_tab_ssm(request, obj_id):
-    server = get_object_or_404(Server, pk=obj_id)
+    server = get_server_or_404(request, obj_id)
 
     return render(request, 'ssm_inventory/templates/server_tab.html', dict(
         server=server,
@@ -48,9 +59,8 @@ def server_tab_ssm(request, obj_id):
 @json_view
 def inventory_json(request, server_id):
     logger.debug(f"SSM Inventory: {request.__dict__}")
-    profile = request.get_user_profile()
-    server = get_object_or_404(Server, pk=server_id)
-    inventory = get_ssm_inventory(server)
+    server = get_server_or_404(request, server_id)
+    inventory = get_cached_table("inventory", server, get_ssm_inventory)
 
     total_rows, display_rows, paged_inventory = data_tables_helper(request,
                                                                    inventory)
@@ -63,19 +73,16 @@ def inventory_json(request, server_id):
     }
 
 
-def sort_list(inventory, column, descending=True):
-    return sorted(inventory, key=lambda x: x[column], reverse=descending)
-
-
-def filter_inventory(inventory, search):
-    if not search:
-        return inventory
-    search = search.lower()
-    filtered = []
-    for item in inventory:
-        if any(search in str(field).lower() for field in item):
-            filtered.append(item)
-    return filtered
+@require_POST
+@json_view
+def refresh_json(request, server_id):
+    """
+    Drop the cached inventory and patches for the server, so the tables are
+    fetched from SSM again on their next draw.
+    """
+    server = get_server_or_404(request, server_id)
+    clear_cached_tables(server)
+    return {"refreshed": True}
 
 
 def get_ssm_inventory(server):
@@ -156,7 +163,7 @@ def patch_ec2(request, server_id):
     logger.debug(f"server_id: {server_id}")
     profile = request.get_user_profile()
     action_url = reverse("ssm_inventory_patch_ec2", args=[server_id])
-    server = get_object_or_404(Server, pk=server_id)
+    server = get_server_or_404(request, server_id)
     initial = {
         "operation": "Install",
         "reboot_option": "RebootIfNeeded",
@@ -323,7 +330,7 @@ def register_cloudbolt_hook():
     description="Displays a list of guest patches available in SSM Patch Manager"
 )
 def server_tab_ssm_patches(request, obj_id):
-    server = get_object_or_404(Server, pk=obj_id)
+    server = get_server_or_404(request, obj_id)
 
     return render(request, 'ssm_inventory/templates/server_patches.html', dict(
         server=server,
@@ -333,9 +340,8 @@ def server_tab_ssm_patches(request, obj_id):
 @json_view
 def patch_json(request, server_id):
     logger.debug(f"SSM Patches: {request.__dict__}")
-    profile = request.get_user_profile()
-    server = get_object_or_404(Server, pk=server_id)
-    patches = list_instance_patches(server)
+    server = get_server_or_404(request, server_id)
+    patches = get_cached_table("patches", server, list_instance_patches)
 
     total_rows, display_rows, paged_inventory = data_tables_helper(request,
                                                                    patches)
@@ -348,7 +354,11 @@ def patch_json(request, server_id):
     }
 
 
-def data_tables_helper(request, inventory):
+def data_tables_helper(request, table):
+    """
+    Page, search and sort a CachedTable for DataTables. Runs against the
+    cache only, no calls are made to AWS.
+    """
     # Get pagination parameters from DataTables
     start = int(request.GET.get('iDisplayStart', 0))
     length = int(request.GET.get('iDisplayLength', 10))
@@ -357,13 +367,7 @@ def data_tables_helper(request, inventory):
     sort_direction = request.GET.get('sSortDir_0', "asc")
     descending = sort_direction == "desc"
 
-    filtered_inventory = filter_inventory(inventory, search)
-    sorted_inventory = sort_list(filtered_inventory, sort_column, descending)
-    paged_inventory = sorted_inventory[start:start + length]
-
-    total_rows = len(inventory)
-    display_rows = len(filtered_inventory)
-    return total_rows, display_rows, paged_inventory
+    return table.page(search, sort_column, descending, start, length)
 
 
 def list_instance_patches(server):